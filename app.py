@@ -1,5 +1,19 @@
+import os
 import sys
 print(sys.executable)
+import time
+import uuid
+import hmac
+import threading
+import logger as log
+from concurrent.futures import (
+    ThreadPoolExecutor
+)
+from urllib.parse import urlencode
+from datetime import (
+    datetime,
+    timedelta
+)
 import plotly.express as px
 import pandas as pd
 import dash_bootstrap_components as dbc # Dash Bootstrap components
@@ -7,20 +21,81 @@ from dash import (
     Dash, 
     html, 
     dcc,
-    exceptions
+    ctx,
+    exceptions,
+    no_update
 )
 from dash.dependencies import (
     Input, 
     Output, 
-    State
+    State,
+    ClientsideFunction
 )
 from dash.exceptions import PreventUpdate
 from ui_data import (
     MongoData
 )
+from database import (
+    DatabaseConnection,
+    RefreshJobsCollection,
+    get_config
+)
+from chart_cache import (
+    ChartCache
+)
+from search_index import (
+    SearchIndex
+)
+from timeseries import (
+    ACTIVE,
+    COMPANY,
+    INACTIVE,
+    ENTITY_LABELS
+)
+from cooccurrence import (
+    get_cooccurrence_matrix,
+    get_named_pair_counts,
+    update_cooccurrence_matrix
+)
+from flask import (
+    Response,
+    abort,
+    jsonify,
+    request
+)
+from refresh import (
+    RefreshLockedError,
+    refresh_drugs_locked
+)
+from metrics import (
+    CONTENT_TYPE,
+    REGISTRY
+)
+from profiling import (
+    CallbackProfiler,
+    section
+)
+from dashboard_data import (
+    DashboardData
+)
+from watcher import (
+    LyophilizedWatcher
+)
+import export_api
+import query_api
+from export_api import (
+    export_blueprint
+)
+from query_api import (
+    query_blueprint
+)
+
+DatabaseConnection().set_profile('dashboard')
 
 app = Dash(__name__, external_stylesheets=[dbc.themes.SANDSTONE],
         meta_tags=[{'name': 'viewport', 'content': 'width=device-width, initial-scale=1'},], suppress_callback_exceptions=True)
+app.server.register_blueprint(export_blueprint)
+app.server.register_blueprint(query_blueprint)
         
 # the style arguments for the sidebar. We use position:fixed and a fixed width
 SIDEBAR_STYLE = {
@@ -58,6 +133,7 @@ sidebar = html.Div(
                 dbc.NavLink("Display Tables", href="/tables", active="exact"),
                 dbc.NavLink("Display Charts", href="/charts", active="exact"),
                 dbc.NavLink("Display Time-Series Data", href="/time_series", active="exact"),
+                dbc.NavLink("Display Co-occurrence", href="/cooccurrence", active="exact"),
             ],
             vertical=True,
             pills=True,
@@ -72,8 +148,208 @@ content = html.Div(id="page-content", style=CONTENT_STYLE)
 app.layout = html.Div([dcc.Location(id="url"), sidebar, content])
 
 UI_DATA_OBJ = MongoData()
-ACTIVE_CHART, INACTIVE_CHART, ACTIVE_TIMESERIES, INACTIVE_TIMESERIES = UI_DATA_OBJ.get_timeseries_dataframe()
-PRODUCTS_LIST, ACTIVE_INGREDIENTS_LIST, INACTIVE_INGREDIENTS_LIST = UI_DATA_OBJ.get_search_bar_data()
+DASHBOARD_DATA = DashboardData.from_config(UI_DATA_OBJ)
+TIMESERIES_INDEX = DASHBOARD_DATA.timeseries_index
+CHART_CACHE = ChartCache(TIMESERIES_INDEX)
+SEARCH_INDEXES = {
+    "product_dropdown": SearchIndex(DASHBOARD_DATA.search_values['products']),
+    "active_dropdown": SearchIndex(DASHBOARD_DATA.search_values['active']),
+    "inactive_dropdown": SearchIndex(DASHBOARD_DATA.search_values['inactive'])
+}
+TIMESERIES_SEARCH_INDEXES = {
+    entity_type: SearchIndex(TIMESERIES_INDEX.get_entities(entity_type)) for entity_type in ENTITY_LABELS
+}
+COOCCURRENCE_MATRIX = get_cooccurrence_matrix()
+COOCCURRENCE_SEARCH_INDEX = SearchIndex(COOCCURRENCE_MATRIX.ingredients)
+CALLBACK_PROFILER = CallbackProfiler.from_config()
+
+DASHBOARD_CACHES_LOCK = threading.Lock()
+
+DEBUG_API_CONFIG = get_config().get('debug_api') or {}
+
+# Number of processes serving the dashboard, set by `gunicorn.conf.py`.
+SERVER_WORKERS = int(os.environ.get('DASHBOARD_WORKERS', 1))
+
+# Refreshes requested through `/api/refresh`, run in the background. Their status is
+# in the `refresh_jobs` collection, shared by all the workers, and they run one at a
+# time across the workers and the backend through the locks of `refresh.refresh_drugs_locked`.
+REFRESH_API_CONFIG = get_config().get('refresh_api') or {}
+REFRESH_EXECUTOR = ThreadPoolExecutor(max_workers=1)
+REFRESH_LOCK_RETRY = 30
+REFRESH_LOCK_WAIT = 60 * 60
+
+def update_dashboard_caches(changed_values, removed_values=None, pair_counts=None):
+    """Update the dashboard caches for the drugs which changed in the database,
+    only the entries of the given entities are computed again.
+
+    :param changed_values: (dict) Entity type (`active`, `inactive`, `company` or
+                           `products`) to the values of the changed drugs, before
+                           and after the change, see `refresh.get_changed_values`.
+    :param removed_values: (dict) Entity type to the values not listed by any drug
+                           anymore, they are removed from the search bars.
+    :param pair_counts: (dict) Change in the ingredient pair counts, by canonical
+                        ingredient IDs, applied to the co-occurrence matrix.
+    """
+    with DASHBOARD_CACHES_LOCK:
+        _update_dashboard_caches(changed_values, removed_values or {}, pair_counts or {})
+
+def _update_dashboard_caches(changed_values, removed_values, pair_counts):
+    global COOCCURRENCE_MATRIX, COOCCURRENCE_SEARCH_INDEX
+
+    for mongo_data in [UI_DATA_OBJ, export_api.MONGO_DATA, query_api.MONGO_DATA]:
+        mongo_data.reset_ingredient_index()
+    ingredient_index = UI_DATA_OBJ.ingredient_index
+
+    # Entities are shown by canonical name, count every canonical ID with the same name.
+    entities = dict()
+    values = dict()
+    for entity_type in ENTITY_LABELS:
+        if entity_type == COMPANY:
+            entities[entity_type] = set(changed_values.get(entity_type, []))
+            values[entity_type] = entities[entity_type]
+        else:
+            entities[entity_type] = {ingredient_index.get_name(ingredient_id)
+                                     for ingredient_id in changed_values.get(entity_type, [])}
+            values[entity_type] = ingredient_index.get_ids(entities[entity_type])
+
+    TIMESERIES_INDEX.update(UI_DATA_OBJ.get_occurrences_dataframe(values), entities)
+    CHART_CACHE.invalidate(entities)
+    for entity_type in ENTITY_LABELS:
+        if entities[entity_type]:
+            TIMESERIES_SEARCH_INDEXES[entity_type] = SearchIndex(TIMESERIES_INDEX.get_entities(entity_type))
+
+    unlisted_values = dict()
+    if any(removed_values.get(entity_type) for entity_type in ['products', ACTIVE, INACTIVE]):
+        unlisted_values = UI_DATA_OBJ.get_unlisted_search_bar_values(removed_values)
+    for search_bar, entity_type, values in [("product_dropdown", 'products', changed_values.get('products', [])),
+                                            ("active_dropdown", ACTIVE, entities[ACTIVE]),
+                                            ("inactive_dropdown", INACTIVE, entities[INACTIVE])]:
+        unlisted = unlisted_values.get(entity_type) or set()
+        SEARCH_INDEXES[search_bar].add(value for value in values if value not in unlisted)
+        SEARCH_INDEXES[search_bar].remove(unlisted)
+
+    if pair_counts:
+        COOCCURRENCE_MATRIX = update_cooccurrence_matrix(get_named_pair_counts(pair_counts, ingredient_index))
+        COOCCURRENCE_SEARCH_INDEX = SearchIndex(COOCCURRENCE_MATRIX.ingredients)
+
+@app.server.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Expose the process metrics in the Prometheus text format."""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.server.route('/health', methods=['GET'])
+def get_health():
+    """Liveness of the dashboard process."""
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
+
+@app.server.route('/ready', methods=['GET'])
+def get_readiness():
+    """Readiness of the dashboard process, once its caches are warm and the database answers."""
+    warm = WORKER_READY.is_set()
+    database = warm and DatabaseConnection().ping()
+    status = 200 if database else 503
+    return jsonify({'status': 'ready' if database else 'not ready', 'pid': os.getpid(),
+                    'warm': warm, 'database': database}), status
+
+@app.server.route('/debug/callbacks', methods=['GET'])
+def get_callback_stats():
+    """Latency percentiles per callback and section, when callback profiling is enabled."""
+    if not CALLBACK_PROFILER.enabled:
+        abort(404)
+    return jsonify(CALLBACK_PROFILER.get_stats())
+
+@app.server.route('/debug/db-pool', methods=['GET'])
+def get_db_pool_stats():
+    """Options and connection stats of the Mongo pool of this process, when enabled
+    in the `debug_api` section of the config file, e.g. `{"enabled": true, "token": "..."}`.
+    When a token is set, requests must send it as `Authorization: Bearer <token>`.
+    """
+    if not DEBUG_API_CONFIG.get('enabled'):
+        abort(404)
+    check_token(DEBUG_API_CONFIG.get('token'))
+    return jsonify(DatabaseConnection().get_pool_stats())
+
+def check_token(token):
+    """Abort the request unless it sends the token, if any, as `Authorization: Bearer <token>`."""
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ""), f"Bearer {token}"):
+        abort(401)
+
+def check_refresh_api():
+    """Abort the request unless the refresh API is enabled in the `refresh_api` section
+    of the config file, e.g. `{"enabled": true, "token": "..."}`. When a token is set,
+    requests must send it as `Authorization: Bearer <token>`. With several workers the
+    dashboard watcher must be enabled, a refresh would only update the worker serving it.
+    """
+    if not REFRESH_API_CONFIG.get('enabled'):
+        abort(404)
+    check_token(REFRESH_API_CONFIG.get('token'))
+    if SERVER_WORKERS > 1 and not DASHBOARD_WATCHER:
+        abort(503, f"The dashboard runs {SERVER_WORKERS} workers with the dashboard watcher disabled, "
+                   f"a refresh would only update one of them. Enable `dashboard_watcher` in the config file.")
+
+def run_refresh_job(job_id, application_numbers, setids):
+    """Refresh the drugs from DailyMed and update the dashboard for them, runs in
+    the background for `/api/refresh`. The job waits while a backend run or another
+    refresh holds the locks, up to `REFRESH_LOCK_WAIT` seconds."""
+    refresh_jobs_db_obj = RefreshJobsCollection()
+    wait_start_time = time.time()
+    try:
+        while True:
+            try:
+                refresh_jobs_db_obj.set_job(job_id, status='running')
+                result = refresh_drugs_locked(application_numbers, setids)
+                break
+            except RefreshLockedError as exc:
+                if time.time() - wait_start_time >= REFRESH_LOCK_WAIT:
+                    raise exc
+                refresh_jobs_db_obj.set_job(job_id, status='waiting')
+                time.sleep(REFRESH_LOCK_RETRY)
+        if not result:
+            refresh_jobs_db_obj.set_job(job_id, status='failed', error="No drugs found to refresh")
+            return
+        if DASHBOARD_WATCHER:
+            # The watcher updates every worker, this one included.
+            DASHBOARD_WATCHER.check(result['record_ids'])
+        else:
+            update_dashboard_caches(result['changed'], pair_counts=result['pair_counts'])
+    except Exception as exc:
+        log.do_error(f"Refresh job {job_id} failed, error: {exc}")
+        refresh_jobs_db_obj.set_job(job_id, status='failed', error=str(exc))
+        return
+    refresh_jobs_db_obj.set_job(job_id, status='done', application_numbers=result['application_numbers'])
+
+@app.server.route('/api/refresh', methods=['POST'])
+def refresh_drugs_api():
+    """Queue a refresh of the drugs given by `application_numbers` and/or `setids`
+    in the JSON body from DailyMed, the dashboard is updated for them once done.
+    Returns the id of the job, its status is at `/api/refresh/<job_id>`.
+    """
+    check_refresh_api()
+    body = request.get_json(silent=True) or {}
+    application_numbers = body.get('application_numbers') or []
+    setids = body.get('setids') or []
+    if not (isinstance(application_numbers, list) and isinstance(setids, list)) or \
+            not (application_numbers or setids):
+        abort(400, "Give a list of `application_numbers` and/or `setids` to refresh")
+
+    job_id = uuid.uuid4().hex
+    RefreshJobsCollection().set_job(job_id, status='queued', requested_at=int(datetime.now().timestamp()))
+    REFRESH_EXECUTOR.submit(run_refresh_job, job_id, application_numbers, setids)
+    response = jsonify({'job_id': job_id, 'status': 'queued'})
+    response.headers['Location'] = f"/api/refresh/{job_id}"
+    return response, 202
+
+@app.server.route('/api/refresh/<job_id>', methods=['GET'])
+def get_refresh_job(job_id):
+    """Status of a refresh job: `queued`, `waiting` (for a backend run or another
+    refresh), `running`, `done` (with the refreshed `application_numbers`) or
+    `failed` (with the `error`)."""
+    check_refresh_api()
+    job = RefreshJobsCollection().get_job(job_id)
+    if not job:
+        abort(404)
+    job['job_id'] = job.pop('_id')
+    return jsonify(job)
 
 '''
 *********************
@@ -98,6 +374,8 @@ def render_page_content(pathname):
         return generate_chart()
     elif pathname == '/time_series':
         return generate_time_series()
+    elif pathname == '/cooccurrence':
+        return generate_cooccurrence_page()
 
 
 
@@ -164,20 +442,9 @@ def generate_chart():
     Output("selected-data", "figure"),
     Input("chart-dropdown", "value")
 )
+@CALLBACK_PROFILER.profile("display_selected_data")
 def display_selected_data(chart_dropdown):
-    if chart_dropdown == "show_active_ingredients":
-        
-        fig = px.bar(ACTIVE_CHART, x='Ingredient', y='Occurences',
-             hover_data=['Ingredient'], color='Occurences',
-             labels={'Ingredient':'Active Ingredient'}, height=1000)
-        return fig
-
-    if chart_dropdown == "show_inactive_ingredients":
-        
-        fig = px.bar(INACTIVE_CHART, x='Ingredient', y='Occurences',
-             hover_data=['Ingredient'], color='Occurences',
-             labels={'Ingredient':'Inactive Ingredient'}, height=1000)
-        return fig
+    return CHART_CACHE.get_bar_chart(chart_dropdown)
 
 
 '''
@@ -214,6 +481,21 @@ def generate_table_page():
                         style={'color': 'black', 'backgroundColor': 'white', 'width': '102%'}
                     )
                 ], style=dict(display='flex')),
+                html.Div([
+                    html.Span("First submitted: ", style={'padding-right': '10px'}),
+                    dcc.DatePickerRange(
+                        id='table_date_range',
+                        display_format='MM-DD-YYYY',
+                        start_date_placeholder_text="Start date",
+                        end_date_placeholder_text="End date",
+                        clearable=True
+                    )
+                ], style={'padding-top': '20px'}),
+                html.Div([
+                    html.A("Export CSV", id="export_csv_link", href="/export?format=csv", target="_blank"),
+                    " | ",
+                    html.A("Export Parquet", id="export_parquet_link", href="/export?format=parquet", target="_blank")
+                ], style={'padding-top': '20px'}),
                 html.Div(
                     id='output_container',
                     className="container",
@@ -223,36 +505,107 @@ def generate_table_page():
 
 @app.callback(
     Output("selection_dropdown", "options"),
-    Input("table_dropdown", "value")
+    [
+        Input("table_dropdown", "value"),
+        Input("selection_dropdown", "search_value")
+    ],
+    State("selection_dropdown", "value")
 )
-def get_selection_options(table_option):
-    if table_option == "product_dropdown":
-        return [{'label': i, 'value': i} for i in sorted(PRODUCTS_LIST)]
-    elif table_option == "active_dropdown":
-        return [{'label': i, 'value': i} for i in sorted(ACTIVE_INGREDIENTS_LIST)]
-    elif table_option == "inactive_dropdown":
-        return [{'label': i, 'value': i} for i in sorted(INACTIVE_INGREDIENTS_LIST)]
-    else:
+def get_selection_options(table_option, search_value, selected_value):
+    search_index = SEARCH_INDEXES.get(table_option)
+    if not search_index:
         raise PreventUpdate
 
-def get_custom_tag(items_list):
+    # A new search type was chosen, the previous selection is not valid for it.
+    if ctx.triggered_id == "table_dropdown":
+        selected_value = None
+
+    return search_index.get_options(search_value, selected_value)
+
+def get_table_lines(table_row):
+    """Return the `html.Tr` of every line of a drug, in a single pass over its
+    `TableRow`. The drug cells span all its lines, a label spans its ingredients."""
+    row_span = f"{table_row.row_span}"
+    dates = list()
+    for date in table_row.dates:
+        dates.extend([date.strftime('%m-%d-%Y'), html.Br()])
+    products = list()
+    for product in table_row.products:
+        products.extend([product.upper(), html.Br()])
+
+    table_lines = list()
+    for label, active, inactive in table_row.iter_lines():
+        cells = list()
+        if not table_lines:
+            cells.append(html.Td(dates[:-1], className="item-stock", rowSpan=row_span))
+            cells.append(html.Td([html.Strong(products, className="book-title"),
+                                  html.Span([table_row.application_number], className="text-offset")],
+                                 className="item-stock", rowSpan=row_span))
+            cells.append(html.Td([table_row.company], className="item-stock", rowSpan=row_span))
+        if label:
+            title, web_url, label_span = label
+            cells.append(html.Td([dcc.Markdown(f"[{title}]({web_url})")], className="item-stock", rowSpan=f"{label_span}"))
+        for ingredient in [active, inactive]:
+            name, strength = ingredient or ("", "")
+            cells.append(html.Td([name], className="item-stock", rowSpan="1"))
+            cells.append(html.Td([strength], className="item-stock", rowSpan="1"))
+        table_lines.append(html.Tr(cells))
+
+    return table_lines
+
+def get_date_range(start_date, end_date):
+    """Return the first submission date range picked on the tables page. The end
+    date is included by the picker but excluded by the queries, hence the extra day.
+
+    :returns: (tuple) Start and end `datetime`, None for the dates not picked.
+    """
+    if start_date:
+        start_date = datetime.fromisoformat(start_date[:10])
+    if end_date:
+        end_date = datetime.fromisoformat(end_date[:10]) + timedelta(days=1)
+    return (start_date or None, end_date or None)
+
+EXPORT_FILTERS = {
+    "product_dropdown": "product",
+    "active_dropdown": "active",
+    "inactive_dropdown": "inactive"
+}
 
-    if len(items_list) > 0 and items_list[-1] == "products":
-        app_number = items_list[0][-1]
-        items_len = len(items_list[0])
-        return html.Td([html.Strong([items_list[0][i] for i in range(0, items_len-1)], className="book-title"), html.Span([app_number], className="text-offset")], className="item-stock", rowSpan=f"{items_list[1]}")
-    else:
-        return html.Td([date for date in items_list[0]], className="item-stock", rowSpan=f"{items_list[1]}")
+@app.callback(
+    [
+        Output("export_csv_link", "href"),
+        Output("export_parquet_link", "href")
+    ],
+    [
+        Input("selection_dropdown", "value"),
+        Input("table_dropdown", "value"),
+        Input("table_date_range", "start_date"),
+        Input("table_date_range", "end_date")
+    ]
+)
+def get_export_links(selection_dropdown, table_dropdown, start_date, end_date):
+    filters = dict()
+    export_filter = EXPORT_FILTERS.get(table_dropdown)
+    if export_filter and selection_dropdown:
+        filters[export_filter] = selection_dropdown
+    for key, value in zip(['start_date', 'end_date'], get_date_range(start_date, end_date)):
+        if value:
+            filters[key] = value.strftime('%Y-%m-%d')
+
+    return [f"/export?{urlencode(dict(filters, format=export_format))}" for export_format in ["csv", "parquet"]]
 
 @app.callback(
     Output("output_container", "children"),
     [ 
         Input("selection_dropdown", "value"),
-        Input("table_dropdown", "value")
+        Input("table_dropdown", "value"),
+        Input("table_date_range", "start_date"),
+        Input("table_date_range", "end_date")
         #Input("inactive_dropdown", "value")
     ]
 )
-def display_table(selection_dropdown, table_dropdown):
+@CALLBACK_PROFILER.profile("display_table")
+def display_table(selection_dropdown, table_dropdown, start_date, end_date):
 
     product_dropdown = None
     active_dropdown = None
@@ -264,10 +617,17 @@ def display_table(selection_dropdown, table_dropdown):
     elif table_dropdown == "inactive_dropdown":
         inactive_dropdown = selection_dropdown
         
-    records_rows = UI_DATA_OBJ.get_table_data(product_search=product_dropdown, 
-                                              active_search=active_dropdown,
-                                              inactive_search=inactive_dropdown)
+    start_date, end_date = get_date_range(start_date, end_date)
+    table_rows = UI_DATA_OBJ.get_table_data(start_date=start_date,
+                                            end_date=end_date,
+                                            product_search=product_dropdown, 
+                                            active_search=active_dropdown,
+                                            inactive_search=inactive_dropdown)
+
+    with section('build_components'):
+        return build_table(table_rows)
 
+def build_table(table_rows):
     return html.Table([
                 html.Thead([
                     html.Tr([
@@ -297,14 +657,14 @@ def display_table(selection_dropdown, table_dropdown):
                         ], scope="col")
                     ])
                 ]),
-                html.Tbody([html.Tr([get_custom_tag(value) if isinstance(value[0], list) else html.Td([value[0]], className="item-stock", rowSpan=f"{value[1]}") for value in row]) for row in records_rows]) 
+                html.Tbody([table_line for table_row in table_rows for table_line in get_table_lines(table_row)])
             ])
 
 
 '''
-*************************************************
------ INACTIVE INGREDIENTS TIME SERIES PAGE -----
-*************************************************
+***************************
+----- TIME SERIES PAGE -----
+***************************
 '''
 
 
@@ -329,15 +689,25 @@ menuSlider = html.Div([
 
 def generate_time_series():
     return  html.Div([
-                    dcc.Dropdown(
-                        id='inactive_time_series_dropdown',
-                        options=[{'label': i, 'value': i} for i in sorted(INACTIVE_INGREDIENTS_LIST)],
-                        placeholder="Choose an Inactive Ingredient",
-                        style={'color': 'black', 'backgroundColor': 'white', 'width': '100%'},
-                        multi=True,
-                        #value=["sucrose"]),
-                    ),
+                    html.Div([
+                        dcc.Dropdown(
+                            id='time_series_type_dropdown',
+                            options=[{'label': label, 'value': entity_type} for entity_type, label in ENTITY_LABELS.items()],
+                            value=INACTIVE,
+                            clearable=False,
+                            style={'color': 'black', 'backgroundColor': 'white', 'width': '100%'}
+                        ),
+                        dcc.Dropdown(
+                            id='time_series_dropdown',
+                            options=TIMESERIES_SEARCH_INDEXES[INACTIVE].get_options(None),
+                            placeholder="Choose values to plot..",
+                            style={'color': 'black', 'backgroundColor': 'white', 'width': '102%'},
+                            multi=True,
+                            #value=["sucrose"]),
+                        )
+                    ], style=dict(display='flex')),
                     menuSlider,
+                    dcc.Store(id="time_series_store"),
                     dcc.Graph(
                         id="time_series_chart",
                         figure=dict(
@@ -358,78 +728,169 @@ def generate_time_series():
                 ])
 
 
+@app.callback(
+    [
+        Output("time_series_dropdown", "options"),
+        Output("time_series_dropdown", "value")
+    ],
+    [
+        Input("time_series_type_dropdown", "value"),
+        Input("time_series_dropdown", "search_value")
+    ],
+    State("time_series_dropdown", "value")
+)
+def get_time_series_options(entity_type, search_value, selected_values):
+    search_index = TIMESERIES_SEARCH_INDEXES.get(entity_type)
+    if not search_index:
+        raise PreventUpdate
+
+    # A new entity type was chosen, the previous selection is not valid for it.
+    if ctx.triggered_id == "time_series_type_dropdown":
+        return search_index.get_options(None), None
+
+    if search_value is None:
+        raise PreventUpdate
+
+    # Typing only changes the options, leave the selection (and the callbacks on it) alone.
+    return search_index.get_options(search_value, selected_values), no_update
+
 @app.callback(
     Output("timeseries_table", "children"),
     [ 
-        Input("inactive_time_series_dropdown", "value")
-    ]
-
+        Input("time_series_dropdown", "value")
+    ],
+    State("time_series_type_dropdown", "value")
 )
-def display_timeseries_table(inactive_time_series_dropdown):
+@CALLBACK_PROFILER.profile("display_timeseries_table")
+def display_timeseries_table(time_series_dropdown, entity_type):
+
+    if not time_series_dropdown:
+        raise PreventUpdate
 
-    if not inactive_time_series_dropdown:
+    search_keys = {
+        "active": "active_search",
+        "inactive": "inactive_search",
+        "company": "company_search"
+    }
+    search_key = search_keys.get(entity_type)
+    if not search_key:
         raise PreventUpdate
 
-    records_rows = UI_DATA_OBJ.get_table_data(inactive_search=inactive_time_series_dropdown)
+    table_rows = UI_DATA_OBJ.get_table_data(**{search_key: time_series_dropdown})
 
-    return html.Table([
-                html.Thead([
-                    html.Tr([
-                        html.Th([
-                            "Date"
-                        ], scope="col", style={'width': '10%'}),
-                        html.Th([
-                            "Products"
-                        ], scope="col"),
-                        html.Th([
-                            "Company"
-                        ], scope="col"),
-                        html.Th([
-                            "DailyMed Label"
-                        ], scope="col"),
-                        html.Th([
-                            "Active Ingredient"
-                        ], scope="col"),
-                        html.Th([
-                            "Strength"
-                        ], scope="col"),
-                        html.Th([
-                            "Inactive Ingredient"
-                        ], scope="col"),
-                        html.Th([
-                            "Strength"
-                        ], scope="col")
-                    ])
-                ]),
-                html.Tbody([html.Tr([get_custom_tag(value) if isinstance(value[0], list) else html.Td([value[0]], className="item-stock", rowSpan=f"{value[1]}") for value in row]) for row in records_rows]) 
-            ])
+    with section('build_components'):
+        return build_table(table_rows)
 
 @app.callback(
+    Output("time_series_store", "data"),
+    [Input("time_series_dropdown", "value")],
+    State("time_series_type_dropdown", "value")
+)
+@CALLBACK_PROFILER.profile("load_timeseries_data")
+def load_timeseries_data(time_series_dropdown, entity_type):
+
+    if not time_series_dropdown:
+        raise PreventUpdate
+
+    return CHART_CACHE.get_timeseries_data(entity_type, time_series_dropdown)
+
+# Year range filtering of the selected series is done in the browser, see
+# `assets/timeseries.js`, so moving the slider does not hit the server.
+app.clientside_callback(
+    ClientsideFunction(namespace="timeseries", function_name="filter_years"),
     Output("time_series_chart", "figure"),
-    [Input("inactive_time_series_dropdown", "value"),
+    [Input("time_series_store", "data"),
     Input("era-slider", "value")]
 )
-def display_timeseries_graph(inactive_time_series_dropdown, year_range):
 
-    if not inactive_time_series_dropdown:
+
+
+'''
+*****************************************
+----- INGREDIENT CO-OCCURRENCE PAGE -----
+*****************************************
+'''
+
+def generate_cooccurrence_page():
+    return html.Div([
+                html.Div([dcc.Markdown('''
+                    ### Ingredients Co-occurrence
+                    Number of Lyophilized drugs in which two ingredients are present together. Choose a single
+                    ingredient to see the ingredients most often used with it, or several ingredients to compare them.
+                    ''')],className='home'
+                ),
+                dcc.Dropdown(
+                    id='cooccurrence_dropdown',
+                    options=COOCCURRENCE_SEARCH_INDEX.get_options(None),
+                    placeholder="Choose ingredients..",
+                    style={'color': 'black', 'backgroundColor': 'white', 'width': '100%'},
+                    multi=True
+                ),
+                dcc.Graph(id="cooccurrence_heatmap")
+            ])
+
+@app.callback(
+    Output("cooccurrence_dropdown", "options"),
+    Input("cooccurrence_dropdown", "search_value"),
+    State("cooccurrence_dropdown", "value")
+)
+def get_cooccurrence_options(search_value, selected_values):
+    if search_value is None:
         raise PreventUpdate
 
-    inactive_df = None
-    if inactive_time_series_dropdown:
-        inactive_df = INACTIVE_TIMESERIES[INACTIVE_TIMESERIES['Ingredient'].isin(inactive_time_series_dropdown)]
-        
-        if year_range:
-            inactive_df = inactive_df[(inactive_df.Year >= year_range[0] )&( inactive_df.Year <= year_range[1] )]
-        else:
-            inactive_df = inactive_df[( inactive_df.Year >= 1954 )&( inactive_df.Year <= 2022)]
-     
-    fig = px.line(inactive_df, x='Year', y='Occurences', color='Ingredient')
-    fig.update_traces(mode='markers+lines')
-    return fig
+    return COOCCURRENCE_SEARCH_INDEX.get_options(search_value, selected_values)
+
+@app.callback(
+    Output("cooccurrence_heatmap", "figure"),
+    Input("cooccurrence_dropdown", "value")
+)
+@CALLBACK_PROFILER.profile("display_cooccurrence_heatmap")
+def display_cooccurrence_heatmap(cooccurrence_dropdown):
+
+    if not cooccurrence_dropdown:
+        raise PreventUpdate
 
+    ingredients = list(cooccurrence_dropdown)
+    if len(ingredients) == 1:
+        ingredients.extend(partner for partner, _ in COOCCURRENCE_MATRIX.get_top_partners(ingredients[0], limit=20))
+
+    names, counts = COOCCURRENCE_MATRIX.get_submatrix(ingredients)
+    with section('build_figure'):
+        fig = px.imshow(counts, x=names, y=names, text_auto=True, color_continuous_scale='Blues',
+                        labels={'color': 'Drugs'}, height=max(500, 40 * len(names)))
+    return fig
 
         
+DASHBOARD_WATCHER = LyophilizedWatcher.from_config(update_dashboard_caches, workers=SERVER_WORKERS)
+WORKER_READY = threading.Event()
+
+def close_db_connections():
+    """Close the db client used to load the dashboard data. Run by the server's
+    master process before forking the workers (see `wsgi`), every worker then
+    connects on its own.
+    """
+    for mongo_data in [UI_DATA_OBJ, export_api.MONGO_DATA, query_api.MONGO_DATA]:
+        mongo_data.reset_db_objs()
+    DatabaseConnection().close()
+
+def init_worker():
+    """Prepare a process to serve the dashboard: connect to the database, warm the
+    caches which are loaded lazily and start the watcher. The data loaded on import
+    is shared with the master process when the app is preloaded.
+    """
+    for mongo_data in [UI_DATA_OBJ, export_api.MONGO_DATA, query_api.MONGO_DATA]:
+        mongo_data.reset_db_objs()
+        # Load the ingredient index now instead of on the first request.
+        mongo_data.ingredient_index
+    if not DatabaseConnection().ping():
+        log.do_error(f"Dashboard worker {os.getpid()} could not reach the database.")
+    if DASHBOARD_WATCHER:
+        DASHBOARD_WATCHER.start()
+    WORKER_READY.set()
+    log.do_info(f"Dashboard worker {os.getpid()} is ready.")
+
 # Call app server
 if __name__ == '__main__':
-    # set debug to false when deploying app
-    app.run_server(debug=False, port=8050)
+    init_worker()
+    # Development server, run `gunicorn wsgi:server` to serve multiple users.
+    app.run(debug=False, port=8050)
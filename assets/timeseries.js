@@ -0,0 +1,42 @@
+/*
+ * Clientside callbacks for the time series page. The series for the selected
+ * ingredients are shipped to the browser once (`time_series_store`), moving
+ * the year slider only filters them here without a server round-trip.
+ */
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    timeseries: {
+        filter_years: function(data, yearRange) {
+            if (!data || !data.series) {
+                throw window.dash_clientside.PreventUpdate;
+            }
+
+            var range = yearRange || data.year_range;
+            var traces = data.series.map(function(series) {
+                var x = [];
+                var y = [];
+                for (var i = 0; i < series.x.length; i++) {
+                    if (series.x[i] >= range[0] && series.x[i] <= range[1]) {
+                        x.push(series.x[i]);
+                        y.push(series.y[i]);
+                    }
+                }
+                return {
+                    type: 'scatter',
+                    mode: 'markers+lines',
+                    name: series.name,
+                    x: x,
+                    y: y
+                };
+            });
+
+            return {
+                data: traces,
+                layout: {
+                    xaxis: {title: {text: 'Year'}},
+                    yaxis: {title: {text: 'Occurences'}},
+                    legend: {title: {text: data.label || 'Ingredient'}}
+                }
+            };
+        }
+    }
+});
@@ -0,0 +1,469 @@
+#pylint: disable=invalid-name
+# -*- coding: utf-8 -*-
+"""
+.. :module:: benchmark
+   :platform: Linux
+   :synopsis: Benchmark of the backend pipeline stages and the dashboard
+              data functions, replaying a fixture corpus of openFDA and
+              DailyMed responses through a local fake server.
+
+Usage::
+
+    python benchmark.py --output bench.json
+    python benchmark.py --compare bench.json
+    python benchmark.py --corpus recorded_corpus/
+
+By default a synthetic corpus is generated from a fixed seed, so results of
+two commits run with the same `--applications` and `--seed` are comparable.
+A recorded corpus can be replayed with `--corpus`, using the layout written
+by `generate_corpus`. The pipeline runs against the Mongo server from the
+config file, in a separate database which is dropped after the run.
+
+.. moduleauthor:: Ashwani Agarwal (agarw288@purdue.edu) (October 18, 2026)
+"""
+
+import io
+import os
+import gc
+import json
+import time
+import random
+import zipfile
+import argparse
+import tempfile
+import platform
+import threading
+import subprocess
+import logging
+import logger as log
+import connection
+import metrics
+from datetime import (
+    datetime
+)
+from pathlib import (
+    Path
+)
+from urllib.parse import (
+    parse_qs,
+    urlsplit
+)
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer
+)
+from url_mapping import URL_MAP
+from database import (
+    DatabaseConnection,
+    Databases
+)
+
+DEFAULT_APPLICATIONS = 200
+DEFAULT_SEED = 42
+DEFAULT_HOST_RATE = 10000
+BENCHMARK_DB = "lyohub_benchmark"
+UI_REPEAT = 5
+PERCENTILES = (50, 95, 99)
+
+LYOPHILIZED_FORM = "INJECTION, POWDER, LYOPHILIZED, FOR SOLUTION"
+OTHER_FORMS = ["INJECTION, SOLUTION", "TABLET, FILM COATED", "INJECTION, POWDER, FOR SOLUTION"]
+INACTIVE_POOL = ["SUCROSE", "MANNITOL", "TREHALOSE", "POLYSORBATE 80", "SODIUM CHLORIDE", "GLYCINE",
+                 "HISTIDINE", "SODIUM PHOSPHATE, DIBASIC", "POLYSORBATE 20", "ARGININE", "SODIUM CITRATE",
+                 "CITRIC ACID MONOHYDRATE", "HYDROCHLORIC ACID", "SODIUM HYDROXIDE", "LACTOSE MONOHYDRATE"]
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).parent,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return
+
+def get_percentiles(values):
+    """Return the `PERCENTILES` of the values (nearest rank) in milliseconds."""
+    if not values:
+        return dict()
+    values = sorted(values)
+    return {f"p{percentile}": round(values[min(len(values) - 1, int(len(values) * percentile / 100))] * 1000, 3)
+            for percentile in PERCENTILES}
+
+def get_spl_xml(form, actives, inactives, description="Benchmark label.", setid="", title="", application_number=""):
+    ingredients = list()
+    for class_code, substances in [("ACTIB", actives), ("IACT", inactives)]:
+        for name, code, value, unit in substances:
+            ingredients.append(
+                f'<ingredient classCode="{class_code}"><quantity><numerator value="{value}" unit="{unit}"/>'
+                f'<denominator value="1" unit="mL"/></quantity><ingredientSubstance><code code="{code}" '
+                f'codeSystem="2.16.840.1.113883.4.9"/><name>{name}</name></ingredientSubstance></ingredient>')
+
+    return ('<?xml version="1.0" encoding="UTF-8"?><document xmlns="urn:hl7-org:v3">'
+            f'<setId root="{setid}"/><versionNumber value="1"/><title>{title}</title><component><structuredBody>'
+            '<component><section><code code="34089-3" displayName="DESCRIPTION SECTION"/>'
+            f'<text><paragraph>{description}</paragraph></text></section></component>'
+            '<component><section><code code="48780-1"/><subject><manufacturedProduct><manufacturedProduct>'
+            f'<name>BENCHMARK</name><formCode code="C42932" displayName="{form}"/>{"".join(ingredients)}'
+            '</manufacturedProduct><subjectOf><approval>'
+            f'<id extension="{application_number}" root="2.16.840.1.113883.3.150"/></approval></subjectOf>'
+            '</manufacturedProduct></subject></section></component>'
+            '</structuredBody></component></document>')
+
+def generate_corpus(path, applications=DEFAULT_APPLICATIONS, seed=DEFAULT_SEED):
+    """Write a synthetic corpus of `applications` drugs to the given directory:
+
+    - `drugsfda.zip`: openFDA drugs export with the drugs.
+    - `spls/<application_number>.json`: DailyMed `spls.json` response per drug.
+    - `spls/listing.json`: all the labels, served as the paged DailyMed SPL listing.
+    - `spl/<setid>.xml`: SPL document per label.
+    - `spl_release.zip`: DailyMed SPL release archive, with a zip per label.
+    """
+    rng = random.Random(seed)
+    path = Path(path)
+    for folder in ['spls', 'spl']:
+        (path / folder).mkdir(parents=True, exist_ok=True)
+
+    active_pool = [(f"BENCHMARKDRUG {index}", f"A{index:07d}X") for index in range(applications // 2 + 1)]
+    inactive_pool = [(name, f"I{index:07d}X") for index, name in enumerate(INACTIVE_POOL)]
+    results = list()
+    listing = list()
+    for index in range(applications):
+        application_number = f"{rng.choice(['NDA', 'ANDA', 'BLA'])}{index:06d}"
+        submissions = [{'submission_status_date': f"{rng.randint(1955, 2022)}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}"}
+                       for _ in range(rng.randint(1, 4))]
+        results.append({
+            'application_number': application_number,
+            'sponsor_name': f"COMPANY {rng.randint(0, applications // 10)}",
+            'products': [{'brand_name': f"PRODUCT {index}-{product}"} for product in range(rng.randint(1, 3))],
+            'submissions': submissions
+        })
+
+        spls = list()
+        lyophilized = rng.random() < 0.4
+        for label in range(rng.randint(1, 3)):
+            setid = f"{rng.getrandbits(128):032x}"
+            setid = f"{setid[:8]}-{setid[8:12]}-{setid[12:16]}-{setid[16:20]}-{setid[20:]}"
+            form = LYOPHILIZED_FORM if lyophilized else rng.choice(OTHER_FORMS)
+            title = f"PRODUCT {index}-{label} ({form.lower()})"
+            spls.append({'setid': setid, 'title': title, 'spl_version': 1, 'published_date': "Jan 01, 2022"})
+            actives = [name_code + (rng.randint(1, 500), "mg") for name_code in rng.sample(active_pool, rng.randint(1, 2))]
+            inactives = [name_code + (rng.randint(1, 100), "mg") for name_code in rng.sample(inactive_pool, rng.randint(1, 5))]
+            description = "Benchmark label."
+            # A few labels only say the drug is lyophilized in their description.
+            if not lyophilized and rng.random() < 0.05 and form.startswith("INJECTION"):
+                description = "Benchmark label, a sterile lyophilized powder for injection."
+            (path / 'spl' / f"{setid}.xml").write_text(get_spl_xml(form, actives, inactives, description, setid,
+                                                                   title, application_number))
+
+        listing.extend(spls)
+        dosage_form = "INJECTABLE" if any("injection" in spl['title'] for spl in spls) else "TABLET"
+        for product in results[-1]['products']:
+            product['dosage_form'] = dosage_form
+        # Most drugs carry their set IDs in the openFDA harmonized fields, the others
+        # are looked up one by one.
+        if rng.random() < 0.9:
+            results[-1]['openfda'] = {'spl_set_id': [spl['setid'] for spl in spls]}
+
+        (path / 'spls' / f"{application_number}.json").write_text(json.dumps({
+            'data': spls,
+            'metadata': {'total_elements': len(spls), 'next_page_url': "null"}
+        }))
+
+    (path / 'spls' / 'listing.json').write_text(json.dumps(listing))
+
+    with zipfile.ZipFile(path / 'spl_release.zip', 'w') as release_zip:
+        for spl in listing:
+            spl_zip_buffer = io.BytesIO()
+            with zipfile.ZipFile(spl_zip_buffer, 'w', zipfile.ZIP_DEFLATED) as spl_zip:
+                spl_zip.write(path / 'spl' / f"{spl['setid']}.xml", f"{spl['setid']}.xml")
+            release_zip.writestr(f"prescription/20220101_{spl['setid']}.zip", spl_zip_buffer.getvalue())
+
+    drugs_json = json.dumps({'meta': {'results': {'total': len(results)}}, 'results': results})
+    with zipfile.ZipFile(path / 'drugsfda.zip', 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr('drug-drugsfda-0001-of-0001.json', drugs_json)
+
+    log.do_info(f"Generated benchmark corpus of {applications} drugs in {path}")
+
+class CorpusHandler(BaseHTTPRequestHandler):
+    """Serve the corpus files for the openFDA and DailyMed urls used by the pipeline."""
+
+    corpus_path = None
+
+    def send_file(self, path, content_type):
+        if not path.exists():
+            self.send_body(b"", content_type, status=404)
+            return
+        self.send_body(path.read_bytes(), content_type)
+
+    def send_body(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_listing_page(self, page, page_size):
+        listing_path = self.corpus_path / 'spls' / 'listing.json'
+        listing = json.loads(listing_path.read_text()) if listing_path.exists() else []
+        total_pages = max(1, -(-len(listing) // page_size))
+        next_page_url = "null"
+        if page < total_pages:
+            next_page_url = f"http://{self.headers.get('Host')}{urlsplit(self.path).path}?page={page + 1}&pagesize={page_size}"
+        self.send_body(json.dumps({
+            'data': listing[(page - 1) * page_size:page * page_size],
+            'metadata': {'total_elements': len(listing), 'total_pages': total_pages,
+                         'current_page': page, 'next_page_url': next_page_url}
+        }).encode(), 'application/json')
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/drugsfda.zip':
+            self.send_file(self.corpus_path / 'drugsfda.zip', 'application/zip')
+        elif url.path == '/dailymed/services/v2/spls.json' and 'application_number' not in query:
+            self.send_listing_page(int(query.get('page', ['1'])[0]), int(query.get('pagesize', ['100'])[0]))
+        elif url.path == '/dailymed/services/v2/spls.json':
+            path = self.corpus_path / 'spls' / f"{query.get('application_number', [''])[0]}.json"
+            if path.exists():
+                self.send_file(path, 'application/json')
+            else:
+                self.send_body(json.dumps({'data': [], 'metadata': {'next_page_url': "null"}}).encode(),
+                               'application/json')
+        elif url.path.startswith('/dailymed/services/v2/spls/'):
+            self.send_file(self.corpus_path / 'spl' / Path(url.path).name, 'application/xml')
+        else:
+            self.send_body(b"", 'text/plain', status=404)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_corpus_server(corpus_path):
+    """Serve the corpus on a local port and point `URL_MAP` to it.
+
+    :returns: (ThreadingHTTPServer) The running server.
+    """
+    handler = type('Handler', (CorpusHandler,), {'corpus_path': Path(corpus_path)})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    URL_MAP.update({
+        'download_fda_drugs_data': f"{base_url}/drugsfda.zip",
+        'get_spl_set_id': f"{base_url}/dailymed/services/v2/spls.json?application_number={{}}&page={{}}&pagesize={{}}",
+        'get_spl_listing': f"{base_url}/dailymed/services/v2/spls.json?page={{}}&pagesize={{}}",
+        'get_spl_document': f"{base_url}/dailymed/services/v2/spls/{{}}.xml"
+    })
+    return server
+
+def get_rss():
+    """Return the resident set size of the process in bytes."""
+    try:
+        with open('/proc/self/statm') as fp:
+            return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class RssSampler(object):
+    """
+    Sample the resident set size of the process from a background thread to
+    find the peak RSS during a benchmark.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = get_rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop_event.set()
+        self._thread.join()
+        self.peak = max(self.peak, get_rss())
+
+    def _sample(self):
+        while not self._stop_event.wait(self.interval):
+            self.peak = max(self.peak, get_rss())
+
+class Benchmark(object):
+    """
+    Class to run the benchmarks and collect their results.
+    """
+
+    def __init__(self):
+        self.results = dict()
+
+    def measure(self, name, function, repeat=1, stage=None):
+        """Run the function `repeat` times and record its latency percentiles,
+        throughput (records counted by the stage, see `metrics.count_records`,
+        or the length of the returned value) and peak RSS.
+
+        :returns: The value returned by the last call.
+        """
+        gc.collect()
+        latencies = list()
+        records = 0
+        with RssSampler() as sampler:
+            start_time = time.perf_counter()
+            for _ in range(repeat):
+                call_start_time = time.perf_counter()
+                start_records = metrics.STAGE_RECORDS.get(stage=stage) if stage else 0
+                if stage:
+                    with metrics.track_stage(stage):
+                        value = function()
+                    records += metrics.STAGE_RECORDS.get(stage=stage) - start_records
+                else:
+                    value = function()
+                    records += len(value) if hasattr(value, '__len__') else 0
+                latencies.append(time.perf_counter() - call_start_time)
+            duration = time.perf_counter() - start_time
+
+        self.results[name] = dict({
+            'seconds': round(duration, 4),
+            'calls': repeat,
+            'records': records,
+            'records_per_second': round(records / duration, 2) if duration else None,
+            'peak_rss_mb': round(sampler.peak / 2 ** 20, 1)
+        }, **get_percentiles(latencies))
+        log.do_info(f"Benchmark {name}: {self.results[name]}")
+        return value
+
+    def measure_each(self, name, function, items):
+        """Call the function once per item and record the latency percentiles of the calls."""
+        gc.collect()
+        latencies = list()
+        with RssSampler() as sampler:
+            start_time = time.perf_counter()
+            for item in items:
+                call_start_time = time.perf_counter()
+                function(item)
+                latencies.append(time.perf_counter() - call_start_time)
+            duration = time.perf_counter() - start_time
+
+        self.results[name] = dict({
+            'seconds': round(duration, 4),
+            'calls': len(latencies),
+            'records': len(latencies),
+            'records_per_second': round(len(latencies) / duration, 2) if duration else None,
+            'peak_rss_mb': round(sampler.peak / 2 ** 20, 1)
+        }, **get_percentiles(latencies))
+        log.do_info(f"Benchmark {name}: {self.results[name]}")
+
+def run_benchmarks(corpus_path, work_path):
+    """Run every stage of `run.py` over the corpus, then the `ui_data.py` functions
+    over the resulting collections.
+
+    :returns: (dict) Benchmark name to its results.
+    """
+    # Imported here, after the database name is switched to the benchmark database.
+    import run
+    from fda_drugs import DrugsMeta
+    from dailymed import DailyMed
+    from ui_data import MongoData
+
+    benchmark = Benchmark()
+    drugs_meta_obj = DrugsMeta()
+    drugs_meta_obj.drugs_data_obj._folder_path = Path(work_path)
+
+    drugs_data = benchmark.measure('load_drugs_data', lambda: drugs_meta_obj.load_drugs_data(download_new_data=True))
+    benchmark.results['load_drugs_data']['records'] = len(drugs_data.get('results', []))
+    benchmark.measure('fetch_fda_drugs', lambda: drugs_meta_obj.update_drugs_data_to_db(download_new_data=False),
+                      stage='fetch_fda_drugs')
+    benchmark.measure('mark_lyophilized', run.mark_lyophilized_drugs_in_db, stage='mark_lyophilized')
+    benchmark.measure('update_ingredients_to_db', run.get_ingredients_for_lyophilized, stage='get_ingredients')
+    benchmark.measure('create_db_indexes', run.create_db_indexes)
+    # Rebuilds the labels and ingredients of the drugs from the release archive, in place.
+    spl_release_path = Path(corpus_path) / 'spl_release.zip'
+    if spl_release_path.exists():
+        benchmark.measure('ingest_spl_archives', lambda: run.ingest_spl_archives_to_db([spl_release_path]),
+                          stage='ingest_spl_archives')
+
+    setids = sorted(path.stem for path in (Path(corpus_path) / 'spl').glob('*.xml'))
+    dailymed_obj = DailyMed()
+    benchmark.measure_each('get_ingredients', dailymed_obj.get_ingredients, setids)
+
+    mongo_data = MongoData()
+    products, actives, inactives = benchmark.measure('get_search_bar_data', mongo_data.get_search_bar_data,
+                                                     repeat=UI_REPEAT)
+    benchmark.measure('get_occurrences_dataframe', mongo_data.get_occurrences_dataframe, repeat=UI_REPEAT)
+    benchmark.measure('get_table_data_default', mongo_data.get_table_data, repeat=UI_REPEAT)
+    benchmark.measure('get_table_data_date_range', lambda: mongo_data.get_table_data(start_date=datetime(2000, 1, 1)),
+                      repeat=UI_REPEAT)
+    benchmark.measure_each('get_table_data_active', lambda active: mongo_data.get_table_data(active_search=active),
+                           sorted(actives)[:50])
+    benchmark.measure_each('get_table_data_product', lambda product: mongo_data.get_table_data(product_search=product),
+                           sorted(products)[:50])
+    benchmark.measure('iter_export_rows', lambda: list(mongo_data.iter_export_rows()), repeat=UI_REPEAT)
+
+    return benchmark.results
+
+def print_results(results, baseline=None):
+    """Print the results as a table, with the change against the baseline results if given."""
+    columns = ['seconds', 'records_per_second', 'p50', 'p95', 'p99', 'peak_rss_mb']
+    print(f"{'benchmark':<28}" + "".join(f"{column:>20}" for column in columns))
+    for name, result in results.items():
+        row = f"{name:<28}"
+        for column in columns:
+            value = result.get(column)
+            cell = "-" if value is None else f"{value}"
+            baseline_value = ((baseline or {}).get(name) or {}).get(column)
+            if value is not None and baseline_value:
+                cell += f" ({(value - baseline_value) / baseline_value:+.0%})"
+            row += f"{cell:>20}"
+        print(row)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages and dashboard data functions.")
+    parser.add_argument('--corpus', help="Directory of a recorded corpus to replay, a synthetic one is generated if not given.")
+    parser.add_argument('--applications', type=int, default=DEFAULT_APPLICATIONS,
+                        help="Number of drugs in the synthetic corpus.")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="Seed of the synthetic corpus.")
+    parser.add_argument('--db-name', default=BENCHMARK_DB, help="Mongo database to run the benchmark in, dropped after the run.")
+    parser.add_argument('--host-rate', type=float, default=DEFAULT_HOST_RATE,
+                        help="Requests per second allowed to the fake server.")
+    parser.add_argument('--output', help="File to write the results to, as JSON.")
+    parser.add_argument('--compare', help="Results file of a previous run to compare against.")
+    parser.add_argument('--verbose', action='store_true', help="Show the pipeline logs.")
+    args = parser.parse_args()
+
+    if args.db_name == Databases.LYOHUB_DB:
+        parser.error(f"Refusing to run the benchmark in the {Databases.LYOHUB_DB} database.")
+    if not args.verbose:
+        log.logger.setLevel(logging.WARNING)
+
+    Databases.LYOHUB_DB = args.db_name
+    connection.DEFAULT_HOST_RATE = args.host_rate
+    db_client = DatabaseConnection().get_db_client()
+    db_client.drop_database(args.db_name)
+
+    with tempfile.TemporaryDirectory() as work_path:
+        corpus_path = args.corpus
+        if not corpus_path:
+            corpus_path = Path(work_path) / 'corpus'
+            generate_corpus(corpus_path, args.applications, args.seed)
+
+        server = start_corpus_server(corpus_path)
+        try:
+            results = run_benchmarks(corpus_path, work_path)
+        finally:
+            server.shutdown()
+            db_client.drop_database(args.db_name)
+
+    report = {
+        'commit': get_git_commit(),
+        'python': platform.python_version(),
+        'corpus': args.corpus or {'applications': args.applications, 'seed': args.seed},
+        'results': results,
+        'metrics': metrics.REGISTRY.snapshot()
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp).get('results')
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(report, fp, indent=2)
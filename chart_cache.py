@@ -0,0 +1,134 @@
+#pylint: disable=invalid-name
+# -*- coding: utf-8 -*-
+"""
+.. :module:: chart_cache
+   :platform: Linux
+   :synopsis: Module for building the dashboard's plotly figures once and
+              serving them from a cache of serialized JSON.
+
+.. moduleauthor:: Ashwani Agarwal (agarw288@purdue.edu) (October 18, 2026)
+"""
+
+import json
+import threading
+import plotly.express as px
+import plotly.io as pio
+from collections import (
+    OrderedDict
+)
+from timeseries import (
+    ACTIVE,
+    INACTIVE,
+    ENTITY_LABELS
+)
+
+ACTIVE_CHART = "show_active_ingredients"
+INACTIVE_CHART = "show_inactive_ingredients"
+DEFAULT_YEAR_RANGE = (1954, 2022)
+MAX_TIMESERIES_ENTRIES = 256
+
+BAR_CHARTS = {
+    ACTIVE_CHART: ACTIVE,
+    INACTIVE_CHART: INACTIVE
+}
+
+class ChartCache(object):
+    """
+    Class to hold the plotly figures for the charts and time series pages.
+    Figures are stored as serialized JSON so that a callback only has to
+    decode them instead of rebuilding every trace on each interaction.
+    Bar charts are built once on creation. For the time series page only the
+    series of the selected entities are cached (LRU, keyed on the entity type
+    and entity set), the year range filtering happens in a clientside callback.
+    All the figures are built from the shared `TimeSeriesIndex`.
+    """
+
+    def __init__(self, timeseries_index, max_entries=MAX_TIMESERIES_ENTRIES):
+        self.timeseries_index = timeseries_index
+        self.max_entries = max_entries
+        self._timeseries_data = OrderedDict()
+        self._lock = threading.Lock()
+        self._bar_charts = {
+            chart_type: self.build_bar_chart(entity_type) for chart_type, entity_type in BAR_CHARTS.items()
+        }
+
+    def build_bar_chart(self, entity_type):
+        """Build the bar chart for the entities of the given type and their total
+        number of occurences.
+
+        :param entity_type: (str) One of `active`, `inactive` or `company`.
+        :returns: (str) Serialized JSON of the figure.
+        """
+        chart_df = self.timeseries_index.get_totals(entity_type)
+        fig = px.bar(chart_df, x='Entity', y='Occurences',
+             hover_data=['Entity'], color='Occurences',
+             labels={'Entity': ENTITY_LABELS.get(entity_type)}, height=1000)
+        return pio.to_json(fig, validate=False)
+
+    def build_timeseries_data(self, entity_type, entities):
+        """Build the per year occurences of the given entities. The year range
+        filtering and plotting is done in the browser, so only the series for
+        the selected entities are returned.
+
+        :param entity_type: (str) One of `active`, `inactive` or `company`.
+        :param entities: (frozenset) Entities to fetch the series for.
+        :returns: (str) Serialized JSON of the series and the default year range.
+        """
+        series = self.timeseries_index.get_series(entity_type, entities)
+        return json.dumps({
+            'series': series,
+            'label': ENTITY_LABELS.get(entity_type),
+            'year_range': list(DEFAULT_YEAR_RANGE)
+        })
+
+    def invalidate(self, entities):
+        """Drop the cached figures showing any of the given entities, after their
+        occurences were updated in the `TimeSeriesIndex`. Bar charts of the
+        entity types given are built again.
+
+        :param entities: (dict) Entity type to the names of the updated entities.
+        """
+        for chart_type, entity_type in BAR_CHARTS.items():
+            if entities.get(entity_type):
+                self._bar_charts[chart_type] = self.build_bar_chart(entity_type)
+
+        with self._lock:
+            for key in list(self._timeseries_data):
+                if key[1] & set(entities.get(key[0], [])):
+                    del self._timeseries_data[key]
+
+    def get_bar_chart(self, chart_type):
+        """Return the cached bar chart for the given chart type.
+
+        :param chart_type: (str) Either `show_active_ingredients` or `show_inactive_ingredients`.
+        :returns: (dict) Plotly figure, None for an unknown chart type.
+        """
+        figure_json = self._bar_charts.get(chart_type)
+        if not figure_json:
+            return
+        return json.loads(figure_json)
+
+    def get_timeseries_data(self, entity_type, entities):
+        """Return the time series data for the given entities, building and
+        caching it if it is not present in the cache already.
+
+        :param entity_type: (str) One of `active`, `inactive` or `company`.
+        :param entities: (list) Entities selected by the user.
+        :returns: (dict) Dict with `series`, a list of per entity `x` (years)
+                  and `y` (occurences) values, the entity `label` and the
+                  default `year_range`.
+        """
+        key = (entity_type, frozenset(entities))
+        with self._lock:
+            series_json = self._timeseries_data.get(key)
+            if series_json:
+                self._timeseries_data.move_to_end(key)
+
+        if not series_json:
+            series_json = self.build_timeseries_data(entity_type, key[1])
+            with self._lock:
+                self._timeseries_data[key] = series_json
+                while len(self._timeseries_data) > self.max_entries:
+                    self._timeseries_data.popitem(last=False)
+
+        return json.loads(series_json)
@@ -7,23 +7,216 @@
 .. moduleauthor:: Ashwani Agarwal (agarw288@purdue.edu) (March 17, 2022)
 """
 
+import time
+import random
+import threading
 import requests
+from datetime import (
+    datetime,
+    timezone
+)
+from email.utils import (
+    parsedate_to_datetime
+)
+from urllib.parse import (
+    urlsplit
+)
 import logger as log
+from metrics import (
+    HTTP_REQUEST_SECONDS
+)
 from requests.exceptions import (
     ChunkedEncodingError
 )
 
-MAX_RETRY_COUNT = 3
+MAX_RETRY_COUNT = 5
+BACKOFF_BASE = 1
+BACKOFF_CAP = 60
+
+# Shared per host request budget, it backs off when the host answers with
+# 429/503 and slowly grows back to the default rate afterwards.
+DEFAULT_HOST_RATE = 10
+MIN_HOST_RATE = 0.5
+RATE_DECREASE_FACTOR = 0.5
+RATE_INCREASE_STEP = 0.1
+
+# Per host circuit breaker, opened after consecutive failed requests.
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_COOLDOWN = 30
+MAX_CIRCUIT_WAIT = 10 * 60
+
+THROTTLE_STATUS_CODES = {429, 503}
+
+class CircuitOpenError(Exception):
+    """Raised when a host is still failing after waiting for its circuit to close."""
+
+class RateLimiter(object):
+    """
+    Token bucket limiting the number of requests made per second. A limiter
+    can be shared between threads (and request wrappers) to put a common
+    budget on all of them. An adaptive limiter halves its rate when the
+    server throttles (`throttle`) and grows it back step by step with every
+    successful request (`succeed`), up to the initial rate.
+    """
+
+    def __init__(self, rate, burst=None, min_rate=None):
+        """
+        :param rate: (float) Number of requests allowed per second.
+        :param burst: (int) Maximum number of requests allowed at once (default `rate`).
+        :param min_rate: (float) Lowest rate the limiter adapts down to, the
+                         rate is fixed if not given.
+        """
+        self.rate = float(rate)
+        self.max_rate = self.rate
+        self.min_rate = min_rate
+        self.burst = float(burst or max(rate, 1))
+        self._tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def acquire(self):
+        """Block until a request is allowed by the budget."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._blocked_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_time = max(self._blocked_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait_time)
+
+    def throttle(self, retry_after=None):
+        """Slow down after the server throttled a request.
+
+        :param retry_after: (float) Seconds the server asked to wait before the next request.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.min_rate:
+                self.rate = max(self.min_rate, self.rate * RATE_DECREASE_FACTOR)
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+
+    def succeed(self):
+        """Speed back up after a successful request."""
+        if self.min_rate and self.rate < self.max_rate:
+            with self._lock:
+                self._refill(time.monotonic())
+                self.rate = min(self.max_rate, self.rate + RATE_INCREASE_STEP)
+
+class CircuitBreaker(object):
+    """
+    Per host circuit breaker. After `failure_threshold` consecutive failures
+    the circuit opens and requests to the host wait until the cooldown is
+    over, then a single probe request is let through: the circuit closes if
+    it succeeds and opens again if it fails. Requests wait instead of failing
+    right away so that a batch run pauses while the host is down, rather than
+    dropping records.
+    """
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, cooldown=CIRCUIT_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._condition = threading.Condition()
+
+    def before_request(self, max_wait=MAX_CIRCUIT_WAIT):
+        """Block while the circuit is open.
+
+        :param max_wait: (float) Maximum number of seconds to wait.
+        :raises CircuitOpenError: If the circuit did not close in time.
+        """
+        deadline = time.monotonic() + max_wait
+        with self._condition:
+            while self._opened_at is not None:
+                now = time.monotonic()
+                if now >= deadline:
+                    raise CircuitOpenError(f"Circuit still open after waiting {max_wait} seconds")
+                reopen_at = self._opened_at + self.cooldown
+                if now >= reopen_at and not self._probing:
+                    self._probing = True
+                    return
+                self._condition.wait(min(deadline, max(reopen_at, now + 1)) - now)
+
+    def record_success(self):
+        with self._condition:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+            self._condition.notify_all()
+
+    def cancel_probe(self):
+        """Let another request probe the host, when the probe failed for a reason
+        unrelated to the host."""
+        with self._condition:
+            if self._probing:
+                self._probing = False
+                self._condition.notify_all()
+
+    def record_failure(self):
+        with self._condition:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    log.do_error(f"Opening circuit after {self._failures} consecutive failures.")
+                self._opened_at = time.monotonic()
+                self._probing = False
+                self._condition.notify_all()
+
+_HOST_LIMITERS = dict()
+_HOST_CIRCUITS = dict()
+_HOSTS_LOCK = threading.Lock()
+
+def get_host_controls(url):
+    """Return the shared rate limiter and circuit breaker for the host of the url."""
+    host = urlsplit(url).netloc
+    with _HOSTS_LOCK:
+        if host not in _HOST_LIMITERS:
+            _HOST_LIMITERS[host] = RateLimiter(DEFAULT_HOST_RATE, min_rate=MIN_HOST_RATE)
+            _HOST_CIRCUITS[host] = CircuitBreaker()
+        return _HOST_LIMITERS[host], _HOST_CIRCUITS[host]
+
+def get_retry_after(resp):
+    """Return the number of seconds to wait from the `Retry-After` header, if any."""
+    retry_after = resp.headers.get('Retry-After')
+    if not retry_after:
+        return
+    try:
+        return max(0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return
+
+def get_backoff(retry):
+    """Exponential backoff with full jitter for the given retry."""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** retry))
 
 class RequestWrapper():
     """Define HTTP API Request Wrapper class."""
 
-    def __init__(self):
-        pass
+    def __init__(self, rate_limiter=None):
+        """
+        :param rate_limiter: (RateLimiter) Budget applied on top of the shared per host limit.
+        """
+        self.rate_limiter = rate_limiter
 
     def make_request(self, method, url, headers=None, params=None,
-                     data=None, timeout=60):
-        """Invoke HTTP API call
+                     data=None, timeout=60, endpoint=None):
+        """Invoke HTTP API call. Requests are paced by the shared rate limiter of
+        the host, and throttled (429/503), failed (5xx) or timed out requests
+        are retried with exponential backoff, honoring `Retry-After`.
 
         :param method: (HTTPMethods) http methods (eg: get, post, put, delete)
         :param url: (string) Fully qualified URL and Path.
@@ -31,27 +224,66 @@ class RequestWrapper():
         :param params: (string) Query parameters.
         :param data: optional data valid only for PUT and POST.
         :param timeout: (int) request timeout in seconds (default 60 seconds).
+        :param endpoint: (str) Name of the endpoint for the latency metrics (default the host).
         """
+        host_limiter, circuit = get_host_controls(url)
+        endpoint = endpoint or urlsplit(url).netloc
         retry = 0
         while True:
+            retry += 1
+            wait_time = get_backoff(retry)
             try:
-                retry += 1
+                circuit.before_request()
+                if self.rate_limiter:
+                    self.rate_limiter.acquire()
+                host_limiter.acquire()
                 request = getattr(requests, method.lower())
-                resp = request(url, headers=headers, data=data,
-                            timeout=timeout, params=params)
+                start_time = time.perf_counter()
+                try:
+                    resp = request(url, headers=headers, data=data,
+                                timeout=timeout, params=params)
+                except requests.RequestException as ex:
+                    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start_time,
+                                                 endpoint=endpoint, status=type(ex).__name__)
+                    raise ex
+                HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start_time,
+                                             endpoint=endpoint, status=resp.status_code)
                 resp.raise_for_status()
             except requests.HTTPError:
                 log.do_error(f"HTTP request error for {url}, status code: {resp.status_code}, error: {resp.text}")
                 exception = Exception(f"HTTP request error for {url}, status code: {resp.status_code}, error: {resp.text}")
-                if resp.status_code >= 500 and retry >= MAX_RETRY_COUNT:
+                if resp.status_code < 500 and resp.status_code not in THROTTLE_STATUS_CODES:
+                    circuit.record_success()
                     raise exception
-                elif resp.status_code < 500:
+
+                if resp.status_code in THROTTLE_STATUS_CODES:
+                    retry_after = get_retry_after(resp)
+                    host_limiter.throttle(retry_after)
+                    wait_time = max(wait_time, retry_after or 0)
+                if resp.status_code == 429:
+                    circuit.record_success()
+                else:
+                    circuit.record_failure()
+                if retry >= MAX_RETRY_COUNT:
                     raise exception
             except (requests.ConnectionError, requests.Timeout, ChunkedEncodingError) as ex:
                 log.do_error(f"HTTP request timeout for {url}, error: {repr(ex)}")
+                circuit.record_failure()
+                if retry >= MAX_RETRY_COUNT:
+                    raise ex
+            except CircuitOpenError as ex:
+                log.do_error(f"HTTP request for {url} not sent, error: {repr(ex)}")
                 raise ex
             except (requests.RequestException, Exception) as ex:
                 log.do_error(f"HTTP request for {url} failed with general error, error: {repr(ex)}")
+                circuit.cancel_probe()
                 raise ex
             else:
-                return resp
\ No newline at end of file
+                circuit.record_success()
+                host_limiter.succeed()
+                if self.rate_limiter:
+                    self.rate_limiter.succeed()
+                return resp
+
+            log.do_info(f"Retrying request for {url} in {wait_time:.1f} seconds, attempt {retry + 1}.")
+            time.sleep(wait_time)
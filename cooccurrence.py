@@ -0,0 +1,254 @@
+#pylint: disable=invalid-name
+# -*- coding: utf-8 -*-
+"""
+.. :module:: cooccurrence
+   :platform: Linux
+   :synopsis: Module for counting which ingredients appear together in
+              lyophilized drugs and querying the counts as a sparse matrix.
+
+.. moduleauthor:: Ashwani Agarwal (agarw288@purdue.edu) (October 18, 2026)
+"""
+
+import itertools
+import numpy as np
+import logger as log
+from collections import (
+    Counter
+)
+from scipy import (
+    sparse
+)
+from database import (
+    CooccurrenceCollection,
+    LyophilizedCollection
+)
+from ingredient_index import (
+    IngredientIndex
+)
+from string_table import (
+    get_string_table
+)
+
+TOP_PARTNERS = 10
+REBUILD_BATCH_SIZE = 5000
+
+_COOCCURRENCE_MATRIX = None
+
+def get_ingredient_pairs(ingredients):
+    """Return all the pairs of distinct ingredients, each pair sorted so that
+    (a, b) and (b, a) are counted as the same pair.
+
+    :param ingredients: (iterable) Canonical ingredient IDs of a drug.
+    :returns: (set) Set of tuples of two ingredient IDs.
+    """
+    ingredients = sorted(set(ingredient for ingredient in ingredients if ingredient))
+    return set(itertools.combinations(ingredients, 2))
+
+def update_pair_counts(pair_counts, old_ingredients, new_ingredients):
+    """Update the pair counts with the change in a drug's ingredients, i.e. add
+    the pairs that are new and remove the pairs that are not present anymore.
+
+    :param pair_counts: (Counter) Pair counts to update.
+    :param old_ingredients: (iterable) Canonical ingredient IDs of the drug before the update.
+    :param new_ingredients: (iterable) Canonical ingredient IDs of the drug after the update.
+    :returns: (Counter) The updated pair counts.
+    """
+    old_pairs = get_ingredient_pairs(old_ingredients)
+    new_pairs = get_ingredient_pairs(new_ingredients)
+    for pair in new_pairs - old_pairs:
+        pair_counts[pair] += 1
+    for pair in old_pairs - new_pairs:
+        pair_counts[pair] -= 1
+
+    return pair_counts
+
+def get_named_pair_counts(pair_counts, ingredient_index):
+    """Translate the pair counts, kept by canonical ingredient ID, to the canonical
+    ingredient names the matrix is indexed on.
+
+    :param pair_counts: (dict) Dict with a tuple of two ingredient IDs as key and a count as value.
+    :param ingredient_index: (IngredientIndex) Index to look the canonical names up.
+    :returns: (Counter) The counts by tuple of two ingredient names.
+    """
+    strings = get_string_table()
+    named_pair_counts = Counter()
+    for ingredients, count in pair_counts.items():
+        names = tuple(sorted(strings.intern(ingredient_index.get_name(ingredient)) for ingredient in ingredients))
+        named_pair_counts[names] += count
+    return named_pair_counts
+
+def rebuild_cooccurrence_counts():
+    """Rebuild the `ingredient_pairs` collection from scratch from the canonical
+    ingredient IDs of the drugs in the `lyophilized` collection. Only needed to backfill the
+    counts, they are kept up to date incrementally by `update_ingredients_to_db`.
+    """
+    pair_counts = Counter()
+    projection = {'active_ingredient_ids': 1, 'inactive_ingredient_ids': 1}
+    for record in LyophilizedCollection().get_records(query={'lyophilized': True}, projection=projection):
+        ingredients = record.get('active_ingredient_ids', []) + record.get('inactive_ingredient_ids', [])
+        pair_counts.update(get_ingredient_pairs(ingredients))
+
+    cooccurrence_db_obj = CooccurrenceCollection()
+    cooccurrence_db_obj.remove_all()
+    pairs = list(pair_counts.items())
+    for index in range(0, len(pairs), REBUILD_BATCH_SIZE):
+        cooccurrence_db_obj.bulk_increment(dict(pairs[index:index + REBUILD_BATCH_SIZE]))
+
+    log.do_info(f"Rebuilt ingredient co-occurrence counts with {len(pairs)} pairs.")
+
+def get_cooccurrence_matrix(reload=False):
+    """Return the co-occurrence matrix loaded from the database, loading it on
+    first use (or when `reload` is set) and sharing it afterwards.
+    """
+    global _COOCCURRENCE_MATRIX
+    if _COOCCURRENCE_MATRIX is None or reload:
+        _COOCCURRENCE_MATRIX = CooccurrenceMatrix.from_db()
+    return _COOCCURRENCE_MATRIX
+
+def update_cooccurrence_matrix(pair_counts):
+    """Apply the change in the pair counts to the shared co-occurrence matrix.
+
+    :param pair_counts: (dict) Dict with a tuple of two ingredient names as key and
+                        the number to add to the pair's count as value.
+    :returns: (CooccurrenceMatrix) The updated matrix.
+    """
+    global _COOCCURRENCE_MATRIX
+    _COOCCURRENCE_MATRIX = get_cooccurrence_matrix().apply_pair_counts(pair_counts)
+    return _COOCCURRENCE_MATRIX
+
+class CooccurrenceMatrix(object):
+    """
+    Class to hold the ingredient co-occurrence counts as a symmetric sparse
+    matrix (CSR), with a row and a column per canonical ingredient. Looking up the
+    partners of an ingredient only reads the non zero entries of its row.
+    """
+
+    def __init__(self, pair_counts):
+        """
+        :param pair_counts: (iterable) Iterable of ((ingredient, ingredient), count).
+        """
+        rows = list()
+        columns = list()
+        counts = list()
+        self._index = dict()
+        for (first, second), count in pair_counts:
+            if count <= 0 or first == second:
+                continue
+            first_index = self._index.setdefault(first, len(self._index))
+            second_index = self._index.setdefault(second, len(self._index))
+            rows.extend([first_index, second_index])
+            columns.extend([second_index, first_index])
+            counts.extend([count, count])
+
+        self.ingredients = list(self._index)
+        size = len(self.ingredients)
+        self._matrix = sparse.csr_matrix((np.array(counts, dtype=np.int64), (rows, columns)), shape=(size, size))
+
+    @classmethod
+    def from_csr(cls, ingredients, matrix):
+        """Create the matrix from the ingredient names and their counts, rows and
+        columns in the same order as the names."""
+        cooccurrence_matrix = cls([])
+        cooccurrence_matrix.ingredients = list(ingredients)
+        cooccurrence_matrix._index = {ingredient: index for index, ingredient in enumerate(ingredients)}
+        cooccurrence_matrix._matrix = matrix
+        return cooccurrence_matrix
+
+    @classmethod
+    def from_db(cls, ingredient_index=None):
+        """Load the pair counts, which are stored by canonical ingredient ID, with the
+        IDs translated to the canonical ingredient names.
+        """
+        if ingredient_index is None:
+            ingredient_index = IngredientIndex.from_db()
+
+        strings = get_string_table()
+        pair_counts = list()
+        for record in CooccurrenceCollection().get_records():
+            ingredients = record.get('ingredients', [])
+            if len(ingredients) == 2:
+                names = tuple(strings.intern(ingredient_index.get_name(ingredient)) for ingredient in ingredients)
+                pair_counts.append((names, record.get('count', 0)))
+
+        log.do_info(f"Loaded ingredient co-occurrence matrix with {len(pair_counts)} pairs.")
+        return cls(pair_counts)
+
+    def apply_pair_counts(self, pair_counts):
+        """Return the matrix with the change in the pair counts applied, without
+        loading the counts again from the database. Ingredients left without any
+        partner are dropped.
+
+        :param pair_counts: (dict) Dict with a tuple of two ingredient names as key and
+                            the number to add to the pair's count (can be negative) as value.
+        :returns: (CooccurrenceMatrix) The updated matrix, this one is left as it is.
+        """
+        index = dict(self._index)
+        rows = list()
+        columns = list()
+        counts = list()
+        for (first, second), count in pair_counts.items():
+            if not count or first == second:
+                continue
+            first_index = index.setdefault(first, len(index))
+            second_index = index.setdefault(second, len(index))
+            rows.extend([first_index, second_index])
+            columns.extend([second_index, first_index])
+            counts.extend([count, count])
+
+        size = len(index)
+        current = self._matrix.tocoo()
+        matrix = sparse.csr_matrix((np.concatenate([current.data, np.array(counts, dtype=np.int64)]),
+                                    (np.concatenate([current.row, np.array(rows, dtype=current.row.dtype)]),
+                                     np.concatenate([current.col, np.array(columns, dtype=current.col.dtype)]))),
+                                   shape=(size, size))
+        matrix.data[matrix.data < 0] = 0
+        matrix.eliminate_zeros()
+
+        ingredients = list(index)
+        kept = np.diff(matrix.indptr) > 0
+        if not kept.all():
+            matrix = matrix[kept][:, kept]
+            ingredients = [ingredient for ingredient, keep in zip(ingredients, kept) if keep]
+        return self.from_csr(ingredients, matrix.tocsr())
+
+    def __contains__(self, ingredient):
+        return ingredient in self._index
+
+    def get_count(self, first, second):
+        """Return the number of drugs both the ingredients are present in."""
+        if first not in self._index or second not in self._index:
+            return 0
+        return int(self._matrix[self._index[first], self._index[second]])
+
+    def get_top_partners(self, ingredient, limit=TOP_PARTNERS):
+        """Return the ingredients most often present together with the given ingredient.
+
+        :param ingredient: (str) Ingredient name.
+        :param limit: (int) Maximum number of partners to return.
+        :returns: (list) List of (partner, count) tuples, highest count first.
+        """
+        row = self._index.get(ingredient)
+        if row is None or limit <= 0:
+            return list()
+
+        start, end = self._matrix.indptr[row], self._matrix.indptr[row + 1]
+        columns = self._matrix.indices[start:end]
+        counts = self._matrix.data[start:end]
+        if len(counts) > limit:
+            top = np.argpartition(-counts, limit - 1)[:limit]
+            columns = columns[top]
+            counts = counts[top]
+
+        partners = [(self.ingredients[column], int(count)) for column, count in zip(columns, counts)]
+        return sorted(partners, key=lambda partner: (-partner[1], partner[0]))
+
+    def get_submatrix(self, ingredients):
+        """Return the co-occurrence counts between the given ingredients.
+
+        :param ingredients: (list) Ingredient names, unknown names are skipped.
+        :returns: (tuple) List of the ingredient names kept and a dense 2D array
+                  of their counts in the same order.
+        """
+        names = [ingredient for ingredient in ingredients if ingredient in self._index]
+        indexes = [self._index[name] for name in names]
+        return names, self._matrix[indexes][:, indexes].toarray()
@@ -11,31 +11,58 @@
 """
 
 import json
+import time
 import xmltodict
 import datetime
 import requests
 import logger as log
+from collections import (
+    Counter
+)
 from pymongo import (
     MongoClient
 )
-from bs4 import (
-    BeautifulSoup
-)
 from download_drugs_data import (
     DownloadDrugsData
 )
 from database import (
+    CooccurrenceCollection,
     DrugsMetaCollection,
     IngredientsCollection,
+    LabelIngredientsCollection,
     LyophilizedCollection
 )
+from cooccurrence import (
+    update_pair_counts
+)
+from ingredient_index import (
+    IngredientIndex
+)
+from label_ingredients import (
+    get_label_ingredient_records
+)
 from connection import (
     RequestWrapper
 )
+from metrics import (
+    SPL_PARSE_SECONDS,
+    count_records
+)
+from spl_classifier import (
+    classify_spl
+)
 from url_mapping import URL_MAP
 
 LYOPHILIZED = "lyophilized"
 DAILYMED_WEBPAGE_URL = URL_MAP.get('dailymed_webpage_url')
+# DailyMed serves at most 100 SPLs per page.
+SPL_LISTING_PAGE_SIZE = 100
+# Only the SPLs of drugs with a dosage form a lyophilized drug can have are
+# classified (freeze-dried orally disintegrating tablets included), drugs
+# without known dosage forms are always classified.
+SPL_CLASSIFIER_FORMS = "POWDER|FOR SOLUTION|FOR SUSPENSION|INJECT|KIT|LYOPHILI|ORALLY DISINTEGRATING"
+SPL_CLASSIFIER_QUERY = {'$or': [{'dosage_forms': {'$in': [None, []]}},
+                                {'dosage_forms': {'$regex': SPL_CLASSIFIER_FORMS}}]}
 
 class DailyMed(object):
     """
@@ -43,11 +70,13 @@ class DailyMed(object):
     perform different operations on the response.
     """
 
-    def __init__(self):
-        self.request_wrapper = RequestWrapper()
+    def __init__(self, rate_limiter=None):
+        self.request_wrapper = RequestWrapper(rate_limiter)
         self._drugs_db_obj = None
         self._ingredients_db_obj = None
         self._lyophilized_db_obj = None
+        self._cooccurrence_db_obj = None
+        self._label_ingredients_db_obj = None
     
     @property
     def drugs_db_obj(self):
@@ -61,12 +90,24 @@ class DailyMed(object):
             self._ingredients_db_obj = IngredientsCollection()
         return self._ingredients_db_obj
 
-     @property
+    @property
     def lyophilized_db_obj(self):
         if not self._lyophilized_db_obj:
             self._lyophilized_db_obj = LyophilizedCollection()
         return self._lyophilized_db_obj
 
+    @property
+    def cooccurrence_db_obj(self):
+        if not self._cooccurrence_db_obj:
+            self._cooccurrence_db_obj = CooccurrenceCollection()
+        return self._cooccurrence_db_obj
+
+    @property
+    def label_ingredients_db_obj(self):
+        if not self._label_ingredients_db_obj:
+            self._label_ingredients_db_obj = LabelIngredientsCollection()
+        return self._label_ingredients_db_obj
+
     def sanitize_list(self, data):
         if not isinstance(data, list):
             data_list = list()
@@ -94,7 +135,7 @@ class DailyMed(object):
         setid_and_title = list()
         while cursor:
             try:
-                response = self.request_wrapper.make_request('get', cursor)
+                response = self.request_wrapper.make_request('get', cursor, endpoint='get_spl_set_id')
                 response_json = response.json()
             except Exception as exc:
                 log.do_error(f"Failed to get SPL set ID for app number: {application_number}, error: {exc}")
@@ -116,25 +157,132 @@ class DailyMed(object):
         
         return setid_and_title
 
-    
-    def update_drugs_setids_to_db(self, query=None):
+    def get_spl_listing_page(self, page_number, page_size=SPL_LISTING_PAGE_SIZE):
+        """Return a page of the listing of all the SPL documents in DailyMed.
+
+        :param page_number: (int) Page to fetch, starting at 1.
+        :param page_size: (int) Number of SPLs per page.
+        :returns: (dict) The `spls.json` response, with `data` and `metadata`.
+        """
+        cursor = URL_MAP.get('get_spl_listing').format(page_number, page_size)
+        try:
+            response = self.request_wrapper.make_request('get', cursor, endpoint='get_spl_listing')
+            return response.json()
+        except Exception as exc:
+            log.do_error(f"Failed to get page {page_number} of the SPL listing, error: {exc}")
+            raise exc
+
+    def get_spl_titles(self, first_page=None):
+        """Return the title of every SPL document in DailyMed, paging through the
+        whole SPL listing once. Pages which fail to load are skipped, the SPLs on
+        them are then missing from the titles returned.
+
+        :param first_page: (dict) First page of the listing, if already fetched.
+        :returns: (dict) Dict with the SPL set ID as key and the label title as value,
+                  empty if the listing could not be read.
+        """
+        try:
+            first_page = first_page or self.get_spl_listing_page(1)
+            total_pages = int(first_page.get('metadata', {}).get('total_pages'))
+        except Exception as exc:
+            log.do_error(f"Failed to read the SPL listing, error: {exc}")
+            return dict()
+
+        spl_titles = dict()
+        failed_pages = 0
+        for page_number in range(1, total_pages + 1):
+            try:
+                response_json = first_page if page_number == 1 else self.get_spl_listing_page(page_number)
+            except Exception:
+                failed_pages += 1
+                continue
+            for result in response_json.get('data', []):
+                if result.get('setid') and result.get('title'):
+                    spl_titles[result.get('setid')] = result.get('title')
+
+        log.do_info(f"Fetched the titles of {len(spl_titles)} SPLs in {total_pages - failed_pages} pages "
+                    f"from DailyMed, {failed_pages} pages failed.")
+        return spl_titles
+
+    def use_spl_listing(self, records_count):
+        """Check if the set IDs of the given number of drugs are resolved faster from
+        the whole SPL listing, i.e. if the listing has less pages than there are drugs.
+
+        :returns: (tuple) True and the first listing page if the listing is to be used,
+                  False and None otherwise.
+        """
+        if not (records_count and URL_MAP.get('get_spl_listing')):
+            return (False, None)
+        try:
+            first_page = self.get_spl_listing_page(1)
+        except Exception:
+            return (False, None)
+
+        total_pages = first_page.get('metadata', {}).get('total_pages')
+        try:
+            total_pages = int(total_pages)
+        except (TypeError, ValueError):
+            return (False, None)
+
+        log.do_info(f"SPL listing has {total_pages} pages, {records_count} drugs to resolve.")
+        return (total_pages < records_count, first_page)
+
+    def update_drugs_setids_to_db(self, query=None, force=False, bulk=False):
         """Fetch SPL set ID for different drugs and update these setIDs to corresponding
         record for the drug (based on application number) in the `ingredients` collection.
+
+        In bulk mode, the titles of all the SPLs are fetched once from the DailyMed
+        listing and each drug is resolved from its openFDA `spl_set_ids`, along with the
+        set IDs found by earlier lookups which are still listed. The drugs without any
+        openFDA set ID, or with some of them not in the listing (retired labels, or
+        listing pages which failed to load), are looked up one by one.
+
+        Bulk mode is opt-in: the listing does not tell which drug a label is for, so the
+        labels of a drug which openFDA does not list yet are only found by the lookup.
+
+        :param query: (dict) Query restricting the drugs to update.
+        :param force: (bool) Resolve the set IDs again for drugs which already have them.
+                      A drug already tagged as lyophilized stays lyophilized.
+        :param bulk: (bool) Resolve the set IDs from the SPL listing, when the listing has
+                     less pages than there are drugs to resolve.
         """
         ingredients_collection = list()
-        search_query = {'set_ids': {'$exists': 0}}
+        previously_lyophilized = set()
+        spl_set_ids = dict()
+        previous_set_ids = dict()
+        search_query = dict() if force else {'set_ids': {'$exists': 0}}
         if query:
             search_query.update(query)
         for record in self.ingredients_db_obj.get_records(query=search_query):
             ingredients_collection.append({'_id': record.get('_id')})
-
-        
+            spl_set_ids[record.get('_id')] = record.get('spl_set_ids') or []
+            previous_set_ids[record.get('_id')] = list(record.get('set_ids') or {})
+            if record.get(LYOPHILIZED) is True:
+                previously_lyophilized.add(record.get('_id'))
+
+        spl_titles = None
+        first_page = None
+        if bulk:
+            bulk, first_page = self.use_spl_listing(len(ingredients_collection))
+        if bulk:
+            spl_titles = self.get_spl_titles(first_page)
+
+        lookup_counter = 0
         for record in ingredients_collection:
             app_number = record.get('_id')
-            try:
-                setid_and_title = self.get_spl_set_id(app_number)
-            except Exception:
-                continue
+            count_records()
+            setid_and_title = list()
+            openfda_set_ids = spl_set_ids.get(app_number, [])
+            if spl_titles and openfda_set_ids and all(setid in spl_titles for setid in openfda_set_ids):
+                setids = openfda_set_ids + [setid for setid in previous_set_ids.get(app_number, [])
+                                            if setid in spl_titles and setid not in openfda_set_ids]
+                setid_and_title = [{'setid': setid, 'title': spl_titles[setid]} for setid in setids]
+            if not setid_and_title:
+                lookup_counter += 1
+                try:
+                    setid_and_title = self.get_spl_set_id(app_number)
+                except Exception:
+                    continue
 
             set_ids_dict = dict()
 
@@ -150,7 +298,9 @@ class DailyMed(object):
                     setid: {'title': title, 'web_url': dailymed_webpage_url}
                 })
 
-            if not setid_and_title:
+            if record.get('_id') in previously_lyophilized:
+                record.update({LYOPHILIZED: True})
+            elif not setid_and_title:
                 record.update({LYOPHILIZED: "N/A"})
             else:
                 record.update({LYOPHILIZED: is_lyophilized})
@@ -159,18 +309,23 @@ class DailyMed(object):
                 'set_ids': set_ids_dict
             })
 
+        if spl_titles:
+            log.do_info(f"Resolved {len(ingredients_collection) - lookup_counter} drugs from the SPL listing, "
+                        f"looked up {lookup_counter} drugs one by one.")
         if ingredients_collection:
             self.ingredients_db_obj.bulk_update({'insert': ingredients_collection})
             log.do_info(f"Updated ingredients collection.")
 
-    def insert_drugs_to_lyophilized_coll(self):
+    def insert_drugs_to_lyophilized_coll(self, query=None):
         """Fetches drugs with `lyophilized: True` key-value pair from ingredients collection
         and stores them in lyophilized collection where active and inactive ingredients will
         be stored for faster processing.
         """
         lyophilized_collection = list()
         record_counter = 0
-        search_query = {LYOPHILIZED: True} 
+        search_query = {LYOPHILIZED: True}
+        if query:
+            search_query.update(query)
         for record in self.ingredients_db_obj.get_records(query=search_query):
             lyophilized_collection.append(record)
             record_counter += 1
@@ -218,8 +373,9 @@ class DailyMed(object):
         """Fetch the ingreients info, via an API call, for a given drug (based on drug's SPL set ID).
 
         :param setid: (str) SPL set ID for a particular drug.
-        :returns ingredients_info: (list) Returns a list of dicts containing different
-                                active and inactive ingredients for the given setID.
+        :returns ingredients_info: (dict) Returns a dict with the lists of active and inactive
+                                ingredients for the given setID, and `lyophilized_sources`, where
+                                the SPL says the drug is lyophilized (see `spl_classifier.classify_spl`).
         """
 
         url = URL_MAP.get('get_spl_document')
@@ -228,123 +384,156 @@ class DailyMed(object):
             return
         url = url.format(setid)
 
-        active_ingredients_set = set()
-        inactive_ingredients_set = set()
-        active_ingredients_list = list()
-        inactive_ingredients_list = list()
         try:
-            response = self.request_wrapper.make_request('get', url)
+            response = self.request_wrapper.make_request('get', url, endpoint='get_spl_document')
+            parse_start_time = time.perf_counter()
             response_data = xmltodict.parse(response.content)
             response_json = json.loads(json.dumps(response_data))
         except Exception as exc:
             log.do_error(f"Failed to get SPL Document for setid: {setid}, error: {exc}")
             raise exc
-        else:
-            try:
-                documents = response_json.get('document', {}).\
-                                        get('component', {}).\
-                                        get('structuredBody', {}).\
-                                        get('component', [])
-                iterator = 0
-                lyophilized = False
-                documents_list = self.sanitize_list(documents)
-                display_name_to_ingredients = dict()
-                for document in documents_list:
-                    subjects = document.get('section', {}).get('subject', [])
-                    subjects_list = self.sanitize_list(subjects)
-                    ingredients = list()
-                    for subject in subjects_list:
-                        products = subject.get('manufacturedProduct', {}).get('manufacturedProduct', {})
-                        ingredients = products.get('ingredient', [])
-                        if ingredients:
-                            display_name = products.get('formCode', {}).get('@displayName', "").lower()
+
+        ingredients = self.get_ingredients_from_spl(response_json, setid)
+        SPL_PARSE_SECONDS.observe(time.perf_counter() - parse_start_time)
+        return ingredients
+
+    def get_ingredients_from_spl(self, response_json, setid=None):
+        """Return the ingredients info of a SPL document already parsed.
+
+        :param response_json: (dict) SPL document, as parsed by xmltodict.
+        :param setid: (str) SPL set ID of the document, for the logs.
+        :returns ingredients_info: (dict) Same as `get_ingredients`.
+        """
+        active_ingredients_set = set()
+        inactive_ingredients_set = set()
+        active_ingredients_list = list()
+        inactive_ingredients_list = list()
+        lyophilized_sources = list()
+        try:
+            lyophilized_sources = classify_spl(response_json.get('document', {}))
+            documents = response_json.get('document', {}).\
+                                    get('component', {}).\
+                                    get('structuredBody', {}).\
+                                    get('component', [])
+            iterator = 0
+            lyophilized = False
+            documents_list = self.sanitize_list(documents)
+            display_name_to_ingredients = dict()
+            for document in documents_list:
+                subjects = document.get('section', {}).get('subject', [])
+                subjects_list = self.sanitize_list(subjects)
+                ingredients = list()
+                for subject in subjects_list:
+                    products = subject.get('manufacturedProduct', {}).get('manufacturedProduct', {})
+                    ingredients = products.get('ingredient', [])
+                    if ingredients:
+                        display_name = products.get('formCode', {}).get('@displayName', "").lower()
+                        display_name += ("_" + str(iterator))
+                        iterator += 1
+                        display_name_to_ingredients[display_name] = ingredients
+                        if LYOPHILIZED in display_name:
+                            lyophilized = True
+
+                    else:
+                        parts = products.get('part', [])
+                        parts = self.sanitize_list(parts)
+                        for part in parts:
+                            part_products = part.get('partProduct', {})
+                            display_name = part_products.get('formCode', {}).get('@displayName', "").lower()
                             display_name += ("_" + str(iterator))
                             iterator += 1
-                            display_name_to_ingredients[display_name] = ingredients
+                            part_ingredients = part_products.get('ingredient', [])
+                            part_ingredients = self.sanitize_list(part_ingredients)
+                            display_name_to_ingredients[display_name] = part_ingredients
                             if LYOPHILIZED in display_name:
                                 lyophilized = True
-
-                        else:
-                            parts = products.get('part', [])
-                            parts = self.sanitize_list(parts)
-                            for part in parts:
-                                part_products = part.get('partProduct', {})
-                                display_name = part_products.get('formCode', {}).get('@displayName', "").lower()
-                                display_name += ("_" + str(iterator))
-                                iterator += 1
-                                part_ingredients = part_products.get('ingredient', [])
-                                part_ingredients = self.sanitize_list(part_ingredients)
-                                display_name_to_ingredients[display_name] = part_ingredients
-                                if LYOPHILIZED in display_name:
-                                    lyophilized = True
-                                #ingredients.extend(part_ingredients)
+                            #ingredients.extend(part_ingredients)
                                 
-                ingredients_list = list()
-                remove_additional_fields = False
-                if iterator > 1 and lyophilized:
-                    remove_additional_fields = True
+            ingredients_list = list()
+            remove_additional_fields = False
+            if iterator > 1 and lyophilized:
+                remove_additional_fields = True
                     
-                for key, value in display_name_to_ingredients.items():
-                    if remove_additional_fields:
-                        if LYOPHILIZED in key:
-                            value = self.sanitize_list(value)
-                            ingredients_list.extend(value)
-                    else:
+            for key, value in display_name_to_ingredients.items():
+                if remove_additional_fields:
+                    if LYOPHILIZED in key:
                         value = self.sanitize_list(value)
                         ingredients_list.extend(value)
+                else:
+                    value = self.sanitize_list(value)
+                    ingredients_list.extend(value)
 
-                ingredients_list = self.sanitize_list(ingredients_list)
+            ingredients_list = self.sanitize_list(ingredients_list)
         
-                for ingredient in ingredients_list:
-                    ingredient_meta = self.parse_ingredient(ingredient)
-                    ingredient_str = f"{ingredient_meta['name']}{ingredient_meta['code']}{ingredient_meta['strength']}"
-                    if ingredient.get('@classCode', "").startswith("ACT"):                 
-                        if ingredient_str not in active_ingredients_set:
-                            active_ingredients_set.add(ingredient_str)
-                            active_ingredients_list.append(ingredient_meta)
+            for ingredient in ingredients_list:
+                ingredient_meta = self.parse_ingredient(ingredient)
+                ingredient_str = f"{ingredient_meta['name']}{ingredient_meta['code']}{ingredient_meta['strength']}"
+                if ingredient.get('@classCode', "").startswith("ACT"):                 
+                    if ingredient_str not in active_ingredients_set:
+                        active_ingredients_set.add(ingredient_str)
+                        active_ingredients_list.append(ingredient_meta)
 
-                    elif ingredient.get('@classCode', "").startswith("IACT"):
-                        if ingredient_str not in inactive_ingredients_set:
-                            inactive_ingredients_set.add(ingredient_str)
-                            inactive_ingredients_list.append(ingredient_meta)
+                elif ingredient.get('@classCode', "").startswith("IACT"):
+                    if ingredient_str not in inactive_ingredients_set:
+                        inactive_ingredients_set.add(ingredient_str)
+                        inactive_ingredients_list.append(ingredient_meta)
 
-            except Exception as exception:
-                log.do_error(f"Error while parsing SPL document for setid: {setid}, error: {exception}")
+        except Exception as exception:
+            log.do_error(f"Error while parsing SPL document for setid: {setid}, error: {exception}")
 
-        return {'active': active_ingredients_list, 'inactive': inactive_ingredients_list}
+        return {'active': active_ingredients_list, 'inactive': inactive_ingredients_list,
+                'lyophilized_sources': lyophilized_sources}
 
 
-    def update_ingredients_to_db(self, query=None):
+    def update_ingredients_to_db(self, query=None, spl_ingredients=None):
         """Fetch Ingredeients info for different drugs and update the info to corresponding
         record for the drug (based on application number) in the `ingredients` collection.
+
+        :param query: (dict) Query restricting the drugs to update.
+        :param spl_ingredients: (dict) SPL set ID to the ingredients info already parsed for
+                                it (e.g. from a DailyMed release archive), the SPLs not in it
+                                are fetched with `get_ingredients`.
         """
         setids_list = list()
+        previous_ingredients = dict()
         search_query = {LYOPHILIZED: True}
         if query:
             search_query.update(query)
         for record in self.lyophilized_db_obj.get_records(query=search_query):
             setids_list.append({'_id': record.get('_id'), 'set_ids': record.get('set_ids')})
+            previous_ingredients[record.get('_id')] = record.get('active_ingredient_ids', []) + \
+                                                      record.get('inactive_ingredient_ids', [])
 
         log.do_info(f"Number of lyophilized records in db: {len(setids_list)}")
 
         update_counter = 0
+        pair_counts = Counter()
+        label_ingredients = dict()
+        ingredient_index = IngredientIndex.from_db()
 
         for record in setids_list:
+            count_records()
             active_ingredients = dict()
             inactive_ingredients = dict()
             active_ingredients_set = set()
             inactive_ingredients_set = set()
+            lyophilized_sources = dict()
             set_ids = record.get('set_ids')
             for setid, _ in set_ids.items():
-                try:
-                    ingredients = self.get_ingredients(setid)
-                except Exception:
-                    continue
+                if spl_ingredients and setid in spl_ingredients:
+                    ingredients = spl_ingredients[setid]
+                else:
+                    try:
+                        ingredients = self.get_ingredients(setid)
+                    except Exception:
+                        continue
 
                 if not ingredients:
                     continue
                 active_ingredients.update({setid: ingredients.get('active')})
                 inactive_ingredients.update({setid: ingredients.get('inactive')})
+                if ingredients.get('lyophilized_sources'):
+                    lyophilized_sources[setid] = ingredients.get('lyophilized_sources')
 
                 for active in ingredients.get('active', []):
                     if active.get('name'):
@@ -356,120 +545,101 @@ class DailyMed(object):
 
             record['active_ingredients_list'] = list(active_ingredients_set)
             record['inactive_ingredients_list'] = list(inactive_ingredients_set)
+            record['lyophilized_sources'] = lyophilized_sources
+            record['active_ingredient_ids'] = ingredient_index.get_ingredient_ids(
+                                                [active for actives in active_ingredients.values() for active in actives])
+            record['inactive_ingredient_ids'] = ingredient_index.get_ingredient_ids(
+                                                [inactive for inactives in inactive_ingredients.values() for inactive in inactives])
+            update_pair_counts(pair_counts, previous_ingredients.get(record.get('_id'), []),
+                               record['active_ingredient_ids'] + record['inactive_ingredient_ids'])
 
             if active_ingredients or inactive_ingredients:
                 record['active_ingredients'] = active_ingredients
                 record['inactive_ingredients'] = inactive_ingredients
+                label_ingredients[record.get('_id')] = get_label_ingredient_records(
+                                                        record.get('_id'), active_ingredients, inactive_ingredients, ingredient_index)
                 update_counter += 1
 
             if (update_counter % 50) == 0:
                 log.do_info(f"Number of records processed till now: {update_counter}")
 
+        ingredient_index.save()
         self.lyophilized_db_obj.bulk_update({'insert': setids_list})
         log.do_info(f"Updated ingredients collection with ingredients info with {update_counter} records.")
-        
-    def get_lyophilized_drugs_from_dailymed(self, url):
-        """Makes an HTTP call to get the web page for lyophilized drugs from 
-        dailymed and uses BeautifulSoup to parse the web page.
 
-        :param url: (str) HTTP url to make the GET request. 
-        :returns set_ids: (set) Returns a set of SPL set IDs. SPL set ID is an UUID 
-                                associated with a drug.
-        """
-        set_ids = set()
-        try:
-            response = self.request_wrapper.make_request('get', url)
-            soup = BeautifulSoup(response.text, 'html.parser')
+        self.cooccurrence_db_obj.bulk_increment(pair_counts)
+        log.do_info(f"Updated ingredient co-occurrence counts for {len(pair_counts)} pairs.")
 
-            attrs = {
-                'class': "drug-info-link"
-            }
-            
-            for drug in soup.find_all('a', attrs=attrs):
-                link = drug.get('href', "")
-                link_split = link.split('setid=')
-                if len(link_split) > 1:
-                    set_ids.add(link_split[1])
-        except Exception as exc:
-            log.do_error(f"Error while fetching lyophilized drugs from dailymed, error: {exc}")
-        
-        return set_ids
-
-    def lyophilized_setid_from_dailymed(self):
-        """Calls underlying function `get_lyophilized_drugs_from_dailymed` to get the
-        lyophilized drugs from Dailymed. It returns the list of SPL set ID of drugs
-        which contain the keyword `lyophilized` in its `description` section or in the
-        `dosage forms and strength` section on the drugs's dailymed page.
-        
-        :returns setids_list: (list) Returns a list of SPL set IDs. SPL set ID is an UUID 
-                                     associated with a drug.
-        """
+        self.label_ingredients_db_obj.bulk_replace(label_ingredients)
+        log.do_info(f"Updated label ingredients collection for {len(label_ingredients)} drugs.")
         
-        api_list = list()
-        api_list.append(URL_MAP.get('lyophilized_from_dosage'))
-        api_list.append(URL_MAP.get('lyophilized_from_description'))
-
-        setids_set = set()
-        for api in api_list:
-            page_number = 1
-            while True:
-                url = api.format(page_number)
-                setids = self.get_lyophilized_drugs_from_dailymed(url)
-                if not setids:
-                    break
-                else:
-                    setids_set.update(setids)
-                page_number += 1
-
-        setids_list = list(setids_set)
-        setids_list_len = len(setids_list)
-        log.do_info(f"Total number of lyophilized drugs returned by dailymed: {setids_list_len}")
-    
-        return setids_list
-
-    
-    def compare_dailymed_data_from_db(self, setids=None):
-        """Checks what setIds are not marked as Lyophilized in mongo collection
-        based on the setIds for the lyophilized drugs retrieved from dailymed.
-
-        :returns ids_dict: (dict) Returns a dict containing the mongo collection _id
-                            with the value as the list of set ids that are lyophilized
-                            as per dailymed but not marked as one in mongo collection.
+    def classify_lyophilized_from_spl(self, query=None, force=False):
+        """Mark as lyophilized the drugs whose label titles do not say so, but whose
+        SPL documents do, in the dosage form of a product or in the dosage forms and
+        description sections (see `spl_classifier.classify_spl`).
+
+        Only the drugs with a dosage form a lyophilized drug can have are looked at
+        (see `SPL_CLASSIFIER_QUERY`), and each SPL is classified once, the set IDs
+        classified are kept in `spl_classified`. The first run on a database thus
+        fetches one SPL per label of each of these drugs, in the order of ten thousand
+        requests for the whole of DailyMed, the later runs only the new labels. The
+        archive ingest (see `spl_archive.py`) classifies every SPL without any request,
+        run it first to skip this cost.
+
+        :param query: (dict) Query restricting the drugs to classify.
+        :param force: (bool) Classify again the SPLs already classified.
+        :returns spl_ingredients: (dict) SPL set ID to the ingredients info parsed for the
+                                  labels of the drugs marked as lyophilized, to be passed to
+                                  `update_ingredients_to_db` instead of fetching them again.
         """
-        if not setids:
-            setids = self.lyophilized_setid_from_dailymed()
-
-        drug_counter = 0
-        lyo_drugs_counter = 0
-        ids_dict = dict()
-        for setid in setids:
-            try:
-                query = {"set_ids.{}".format(setid): {'$exists': 1}}
-                for record in self.lyophilized_db_obj.get_records(query=query):
-                    drug_counter += 1
-                    if not record.get(LYOPHILIZED):
-                        if not ids_dict.get(record.get('_id')):
-                            ids_dict[record.get('_id')] = list()
-                        ids_dict[record.get('_id')].append(setid)
-                        lyo_drugs_counter += 1
-            except Exception as exc:
-                log.do_error(f"Error while fetching drug info from db for: {setid}, error: {exc}")
-
-        log.do_info(f"Lyophilized drugs from dalymed: {len(setids)}, drugs present in db: {drug_counter}")
-        log.do_info(f"Drugs not marked as lyophilized in db: {lyo_drugs_counter}")
-
+        search_query = {LYOPHILIZED: False}
+        if query:
+            search_query = {'$and': [search_query, SPL_CLASSIFIER_QUERY, query]}
+        else:
+            search_query.update(SPL_CLASSIFIER_QUERY)
+
+        records_setids = list()
+        for record in self.ingredients_db_obj.get_records(query=search_query,
+                                                          projection={'set_ids': 1, 'spl_classified': 1}):
+            classified = set() if force else set(record.get('spl_classified') or [])
+            setids = [setid for setid in (record.get('set_ids') or {}) if setid not in classified]
+            if setids:
+                records_setids.append((record.get('_id'), classified, setids))
+        log.do_info(f"Classifying {sum(len(setids) for _, _, setids in records_setids)} SPL documents "
+                    f"of {len(records_setids)} drugs.")
+
+        spl_ingredients = dict()
         records_list = list()
-        update_counter = 0
-        for key, _ in ids_dict.items():
-            records_list.append({'_id': key, LYOPHILIZED: True})
-            update_counter += 1
+        spl_counter = 0
+        lyophilized_counter = 0
+        for record_id, classified, setids in records_setids:
+            count_records()
+            lyophilized_sources = dict()
+            drug_ingredients = dict()
+            for setid in setids:
+                try:
+                    ingredients = self.get_ingredients(setid)
+                except Exception:
+                    continue
+                spl_counter += 1
+                classified.add(setid)
+                drug_ingredients[setid] = ingredients
+                if ingredients and ingredients.get('lyophilized_sources'):
+                    lyophilized_sources[setid] = ingredients.get('lyophilized_sources')
+
+            db_record = {'_id': record_id, 'spl_classified': sorted(classified)}
+            if lyophilized_sources:
+                db_record.update({LYOPHILIZED: True, 'lyophilized_sources': lyophilized_sources})
+                spl_ingredients.update(drug_ingredients)
+                lyophilized_counter += 1
+            records_list.append(db_record)
 
-        self.lyophilized_db_obj.bulk_update({'insert': records_list})
-        self.ingredients_db_obj.bulk_update({'insert': records_list})
+        if records_list:
+            self.ingredients_db_obj.bulk_update({'insert': records_list})
 
-        log.do_info(f"Number of records updated as lyophilized in mongo collections: {update_counter}")
+        log.do_info(f"Classified {spl_counter} SPL documents, number of records updated as lyophilized: {lyophilized_counter}")
 
-        return ids_dict
+        return spl_ingredients
 
     def get_ingredients_for_additional_drugs(self, ids_dict):
         """Given a dict of `_id` of mongo records, and the corresponding SPL Set IDs
@@ -482,6 +652,8 @@ class DailyMed(object):
        
         update_counter = 0
         records_to_insert = list()
+        label_ingredients = dict()
+        ingredient_index = IngredientIndex.from_db()
         for key, value in ids_dict.items():
             try:
                 db_record = {'_id': key}
@@ -513,10 +685,16 @@ class DailyMed(object):
 
                 db_record['active_ingredients_list'] = list(active_ingredients_set)
                 db_record['inactive_ingredients_list'] = list(inactive_ingredients_set)
+                db_record['active_ingredient_ids'] = ingredient_index.get_ingredient_ids(
+                                                    [active for actives in active_ingredients.values() for active in actives])
+                db_record['inactive_ingredient_ids'] = ingredient_index.get_ingredient_ids(
+                                                    [inactive for inactives in inactive_ingredients.values() for inactive in inactives])
 
                 if active_ingredients or inactive_ingredients:
                     db_record['active_ingredients'] = active_ingredients
                     db_record['inactive_ingredients'] = inactive_ingredients
+                    label_ingredients[key] = get_label_ingredient_records(key, active_ingredients, inactive_ingredients,
+                                                                          ingredient_index)
                     update_counter += 1
 
                 records_to_insert.append(db_record)
@@ -524,7 +702,9 @@ class DailyMed(object):
             except Exception as exc:
                 log.do_error(f"Error while fetching and updating ingredients for _id: {key}, error: {exc}")
             
+        ingredient_index.save()
         if records_to_insert:
             self.lyophilized_db_obj.bulk_update({'insert': records_to_insert})
+            self.label_ingredients_db_obj.bulk_replace(label_ingredients)
         
         log.do_info(f"Updated additional records in ingredients collection with {len(records_to_insert)} records.")
\ No newline at end of file
@@ -0,0 +1,201 @@
+#pylint: disable=invalid-name
+# -*- coding: utf-8 -*-
+"""
+.. :module:: dashboard_data
+   :platform: Linux
+   :synopsis: Module for the in-memory data of the dashboard (string table,
+              search bar values and yearly occurences), with a snapshot in
+              memory-mapped Arrow files shared by the dashboard processes.
+
+.. moduleauthor:: Ashwani Agarwal (agarw288@purdue.edu) (October 18, 2026)
+"""
+
+import os
+import time
+import numpy as np
+import logger as log
+from database import (
+    get_config
+)
+from string_table import (
+    get_string_table
+)
+from timeseries import (
+    TimeSeriesIndex
+)
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+STRINGS_FILE = "strings.arrow"
+OCCURRENCES_FILE = "occurrences.arrow"
+DEFAULT_MAX_AGE = 3600
+
+# Bit set in the `flags` column of the strings file for the values of each search bar.
+SEARCH_FLAGS = {
+    'products': 1,
+    'active': 2,
+    'inactive': 4
+}
+
+OCCURRENCE_COLUMNS = {
+    'entity_type': np.int8,
+    'entity': np.int32,
+    'year': np.int16,
+    'occurences': np.int32
+}
+
+class DashboardData(object):
+    """
+    Class to hold the data the dashboard keeps in memory: the yearly occurences
+    index and the values of the search bars, all coded on the shared string
+    table. Every name is held once per process, in the string table, the rest
+    is integer arrays.
+
+    The data can be saved to a snapshot of two Arrow IPC files, the string table
+    (with a flag per search bar) and the occurences. Loading the snapshot memory
+    maps the occurences file, the index then reads the mapped pages directly, so
+    the dashboard processes on a host share one copy of them through the page cache.
+    """
+
+    def __init__(self, strings, timeseries_index, search_values):
+        """
+        :param strings: (StringTable) Table the data is coded on.
+        :param timeseries_index: (TimeSeriesIndex) Yearly occurences of the entities.
+        :param search_values: (dict) Search bar (`products`, `active` or `inactive`)
+                              to the list of its values.
+        """
+        self.strings = strings
+        self.timeseries_index = timeseries_index
+        self.search_values = search_values
+
+    @classmethod
+    def from_db(cls, mongo_data):
+        """Load the data from the database.
+
+        :param mongo_data: (MongoData) Object to query the database with.
+        """
+        strings = get_string_table()
+        timeseries_index = TimeSeriesIndex(mongo_data.get_occurrences_dataframe(), strings)
+        search_values = dict()
+        for search_bar, values in zip(SEARCH_FLAGS, mongo_data.get_search_bar_data()):
+            search_values[search_bar] = [strings.intern(value) for value in values if value]
+        return cls(strings, timeseries_index, search_values)
+
+    @classmethod
+    def from_config(cls, mongo_data):
+        """Load the data from the snapshot set in the `dashboard_data` section of the
+        config file, e.g. `{"path": "data/dashboard", "max_age": 3600}`. The data is
+        loaded from the database, and saved to the snapshot, if there is no snapshot
+        or it is older than `max_age` seconds.
+
+        :param mongo_data: (MongoData) Object to query the database with.
+        """
+        config = get_config().get('dashboard_data') or {}
+        path = config.get('path')
+        if not path:
+            return cls.from_db(mongo_data)
+        if pa is None:
+            log.do_error("Dashboard data snapshot needs pyarrow to be installed, loading from database.")
+            return cls.from_db(mongo_data)
+
+        max_age = config.get('max_age', DEFAULT_MAX_AGE)
+        try:
+            created = get_snapshot_time(path)
+            if created and time.time() - created <= max_age:
+                return cls.load(path)
+        except (OSError, ValueError, pa.ArrowException) as exc:
+            log.do_error(f"Failed to load dashboard data snapshot from {path}, error: {exc}")
+
+        dashboard_data = cls.from_db(mongo_data)
+        try:
+            dashboard_data.save(path)
+        except (OSError, pa.ArrowException) as exc:
+            log.do_error(f"Failed to save dashboard data snapshot to {path}, error: {exc}")
+        return dashboard_data
+
+    def save(self, path):
+        """Save the data to a snapshot in the given directory. Each file is written
+        under a temporary name and moved in place, both carry the time of the
+        snapshot so that a reader can tell they belong together.
+
+        :param path: (str) Directory of the snapshot.
+        """
+        os.makedirs(path, exist_ok=True)
+        metadata = {'created': str(time.time())}
+
+        search_codes = {search_bar: self.strings.get_codes(values) for search_bar, values in self.search_values.items()}
+        flags = np.zeros(len(self.strings), dtype=np.uint8)
+        for search_bar, codes in search_codes.items():
+            flags[codes] |= SEARCH_FLAGS[search_bar]
+        strings_table = pa.table({
+            'value': pa.array(self.strings.values, type=pa.string()),
+            'flags': pa.array(flags)
+        }).replace_schema_metadata(metadata)
+
+        occurrences_table = pa.table({
+            name: pa.array(array.astype(OCCURRENCE_COLUMNS[name], copy=False))
+            for name, array in zip(OCCURRENCE_COLUMNS, self.timeseries_index.arrays)
+        }).replace_schema_metadata(metadata)
+
+        for file_name, table in [(STRINGS_FILE, strings_table), (OCCURRENCES_FILE, occurrences_table)]:
+            file_path = os.path.join(path, file_name)
+            temp_path = f"{file_path}.{os.getpid()}.tmp"
+            with pa.OSFile(temp_path, 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(temp_path, file_path)
+
+        log.do_info(f"Saved dashboard data snapshot with {len(self.strings)} strings and "
+                    f"{len(occurrences_table)} occurences to {path}")
+
+    @classmethod
+    def load(cls, path):
+        """Load the data from a snapshot, with the occurences memory mapped.
+
+        :param path: (str) Directory of the snapshot.
+        """
+        strings_table = read_table(os.path.join(path, STRINGS_FILE))
+        occurrences_table = read_table(os.path.join(path, OCCURRENCES_FILE))
+        if strings_table.schema.metadata != occurrences_table.schema.metadata:
+            raise ValueError("Dashboard data snapshot files are from different snapshots")
+
+        strings = get_string_table()
+        values = strings_table.column('value').to_pylist()
+        codes = strings.get_codes(values)
+        flags = get_array(strings_table, 'flags')
+        search_values = {search_bar: [strings.get_value(code) for code in codes[(flags & flag) != 0]]
+                         for search_bar, flag in SEARCH_FLAGS.items()}
+
+        arrays = [get_array(occurrences_table, name) for name in OCCURRENCE_COLUMNS]
+        is_sorted = np.array_equal(codes, np.arange(len(codes)))
+        if not is_sorted:
+            # The process already had strings in its table, recode the entities on it.
+            arrays[1] = codes[arrays[1]]
+        timeseries_index = TimeSeriesIndex.from_arrays(strings, *arrays, is_sorted=is_sorted)
+
+        log.do_info(f"Loaded dashboard data snapshot with {len(values)} strings and "
+                    f"{len(occurrences_table)} occurences from {path}")
+        return cls(strings, timeseries_index, search_values)
+
+def read_table(file_path):
+    """Read an Arrow IPC file memory mapped, the columns are not copied in memory."""
+    return pa.ipc.open_file(pa.memory_map(file_path, 'r')).read_all()
+
+def get_array(table, name):
+    """Return a column of a table as a numpy array, a view of the table's memory if
+    the column is in a single chunk."""
+    column = table.column(name)
+    if column.num_chunks == 1:
+        return column.chunk(0).to_numpy(zero_copy_only=True)
+    return column.to_numpy()
+
+def get_snapshot_time(path):
+    """Return the time a snapshot was created at, None if there is no snapshot."""
+    file_path = os.path.join(path, OCCURRENCES_FILE)
+    if not os.path.exists(file_path):
+        return None
+    metadata = pa.ipc.open_file(pa.memory_map(file_path, 'r')).schema.metadata or {}
+    return float(metadata.get(b'created', 0))
@@ -8,24 +8,78 @@
 """
 
 from functools import wraps
+from contextlib import contextmanager
+import os
 import time
 import json
+import threading
+import importlib.util
 import logger as log
+from metrics import (
+    BULK_WRITE_SECONDS,
+    BULK_WRITE_SIZE,
+    POOL_CHECKOUT_FAILURES,
+    POOL_CHECKOUT_SECONDS,
+    POOL_CONNECTIONS
+)
 from pymongo import (
+    ASCENDING,
     MongoClient,
     UpdateOne,
-    DeleteOne
+    ReplaceOne,
+    DeleteOne,
+    DeleteMany
 )
 from pymongo.errors import (
+    ConfigurationError,
     ConnectionFailure,
+    DuplicateKeyError,
     PyMongoError,
     BulkWriteError,
+    ServerSelectionTimeoutError
+)
+from pymongo.monitoring import (
+    ConnectionPoolListener
 )
 
 MAX_RETRIES = 20
+# Seconds the status of a refresh job is kept after its last update.
+REFRESH_JOB_TTL = 7 * 24 * 60 * 60
 
 CONFIG_FILE = "config"
 
+# Client options of every process, see `DatabaseConnection.get_client_options`.
+CLIENT_OPTIONS = {
+    'serverSelectionTimeoutMS': 10000
+}
+
+# Client options per kind of process. The dashboard runs many short reads from
+# the threads of its workers and keeps a few connections warm, the ingest runs
+# fewer, longer bulk writes.
+CLIENT_PROFILES = {
+    'default': {},
+    'dashboard': {
+        'maxPoolSize': 20,
+        'minPoolSize': 2,
+        'maxIdleTimeMS': 60000,
+        'waitQueueTimeoutMS': 10000
+    },
+    'ingest': {
+        'maxPoolSize': 10,
+        'socketTimeoutMS': 300000
+    }
+}
+
+# Client options not to report in the pool stats.
+SECRET_OPTIONS = ('username', 'password', 'tlsCertificateKeyFilePassword')
+
+# Python module needed by each wire compressor, zlib is always available.
+COMPRESSOR_MODULES = {
+    'zstd': 'zstandard',
+    'snappy': 'snappy',
+    'zlib': 'zlib'
+}
+
 def get_config():
     """
     JSON Load the config from config file.
@@ -86,15 +140,152 @@ def db_retry(retry_count=MAX_RETRIES):
     return retry
 
 
+def timed_bulk_write(collection, operations):
+    """Run an unordered bulk write, recording its latency and number of operations.
+
+    :param collection: (Collection) Mongo collection to write to.
+    :param operations: (list) Bulk write operations.
+    :returns: (BulkWriteResult) Result of the bulk write.
+    """
+    BULK_WRITE_SIZE.observe(len(operations), collection=collection.name)
+    with BULK_WRITE_SECONDS.time(collection=collection.name):
+        return collection.bulk_write(operations, ordered=False)
+
+def get_compressors(compressors):
+    """Return the given wire compressors, without the ones whose module is not installed.
+
+    :param compressors: (str/list) Compressors in order of preference, e.g. `zstd,snappy,zlib`.
+    :returns: (list) Available compressors.
+    """
+    if isinstance(compressors, str):
+        compressors = [compressor.strip() for compressor in compressors.split(',')]
+
+    available = list()
+    for compressor in compressors:
+        module = COMPRESSOR_MODULES.get(compressor)
+        if module and importlib.util.find_spec(module):
+            available.append(compressor)
+        else:
+            log.do_error(f"Wire compressor {compressor} is not available, skipping it.")
+    return available
+
+class PoolStatsListener(ConnectionPoolListener):
+    """
+    Listener of the connection pool events of a db client. Keeps the number of
+    open and checked out connections, checkouts and failed checkouts per server,
+    and reports them, with the checkout times, to the metrics.
+    """
+
+    def __init__(self, profile):
+        self.profile = profile
+        self._stats = dict()
+        self._lock = threading.Lock()
+
+    def _update(self, address, **amounts):
+        server = f"{address[0]}:{address[1]}"
+        with self._lock:
+            stats = self._stats.setdefault(server, {'open': 0, 'checked_out': 0, 'checkouts': 0,
+                                                    'checkout_failures': 0, 'clears': 0})
+            for key, amount in amounts.items():
+                stats[key] += amount
+            open_count, checked_out_count = stats['open'], stats['checked_out']
+        POOL_CONNECTIONS.set(open_count, profile=self.profile, server=server, state='open')
+        POOL_CONNECTIONS.set(checked_out_count, profile=self.profile, server=server, state='checked_out')
+
+    def get_stats(self):
+        """Return the pool stats per server (`host:port`)."""
+        with self._lock:
+            return {server: dict(stats) for server, stats in self._stats.items()}
+
+    def pool_created(self, event):
+        self._update(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._update(event.address, clears=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._update(event.address, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(event.address, open=-1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._update(event.address, checkout_failures=1)
+        POOL_CHECKOUT_FAILURES.inc(profile=self.profile, server=f"{event.address[0]}:{event.address[1]}",
+                                   reason=str(event.reason))
+
+    def connection_checked_out(self, event):
+        self._update(event.address, checked_out=1, checkouts=1)
+        # The time the checkout took, including waiting for a free connection.
+        duration = getattr(event, 'duration', None)
+        if duration is not None:
+            POOL_CHECKOUT_SECONDS.observe(duration, profile=self.profile)
+
+    def connection_checked_in(self, event):
+        self._update(event.address, checked_out=-1)
+
 @singleton
 class DatabaseConnection(object):
     """
     Class to establish database connection. DB's host and port
     are read from the `config` file. Default host and port for
     mongo db are `localhost` and `27017` respectively.
+
+    A client is created per process: a client created before a fork is
+    dropped, not used, by the child process, which creates its own. The
+    client options depend on the profile of the process (`dashboard` or
+    `ingest`, see `set_profile`) and can be set in the `db_client` section
+    of the config file.
     """
     def __init__(self):
         self._db_client = None
+        self._pid = None
+        self._collections = dict()
+        self._client_options = dict()
+        self._pool_listener = None
+        self.profile = 'default'
+
+    def set_profile(self, profile):
+        """Set the kind of process the client is for, to be called before the first
+        database operation. A client already created for another profile is closed.
+
+        :param profile: (str) One of `default`, `dashboard` or `ingest`.
+        """
+        if profile not in CLIENT_PROFILES:
+            raise ValueError(f"Unknown db client profile: {profile}, expected one of {', '.join(CLIENT_PROFILES)}")
+        if profile != self.profile:
+            self.close()
+            self.profile = profile
+
+    def get_client_options(self):
+        """Return the options to create the db client with: `CLIENT_OPTIONS` and the
+        profile's `CLIENT_PROFILES` entry, updated with the `db_client` section of the
+        config file, e.g. `{"compressors": "zstd,zlib", "profiles": {"dashboard":
+        {"maxPoolSize": 50, "readPreference": "secondaryPreferred"}}}`. Any option of
+        `MongoClient` can be given.
+
+        :return: (dict) Client options.
+        """
+        config = get_config().get('db_client') or {}
+        profiles = config.get('profiles') or {}
+        options = dict(CLIENT_OPTIONS, **CLIENT_PROFILES[self.profile])
+        options.update({key: value for key, value in config.items() if key != 'profiles'})
+        options.update(profiles.get(self.profile) or {})
+        if options.get('compressors'):
+            options['compressors'] = get_compressors(options['compressors'])
+        return options
 
     def get_db_client(self):
         """
@@ -104,15 +295,24 @@ class DatabaseConnection(object):
         :return: (object) Database connection object.
         :raises: (Exception) In case of Database connection failure.
         """
+        if self._db_client and self._pid != os.getpid():
+            # Created by the parent process, it must not be used, nor closed, here.
+            self._db_client = None
+            self._collections = dict()
+
         retry = 1
         while True:
             try:
                 if not self._db_client:
                     config = get_config()
+                    self._client_options = self.get_client_options()
+                    self._pool_listener = PoolStatsListener(self.profile)
                     self._db_client = MongoClient(config.get("db_host") or "localhost",
                                                 config.get("db_port") or 27017,
-                                                serverSelectionTimeoutMS = 10000)
-            except errors.ServerSelectionTimeoutError as connection_error:
+                                                event_listeners=[self._pool_listener],
+                                                **self._client_options)
+                    self._pid = os.getpid()
+            except (ServerSelectionTimeoutError, ConfigurationError) as connection_error:
                 raise connection_error
             except Exception as exception:
                 if retry > MAX_RETRIES:
@@ -126,21 +326,71 @@ class DatabaseConnection(object):
 
         return self._db_client
 
+    def get_collection(self, collection_name):
+        """Return a collection of the `lyohub` database on the client of this process.
+
+        :param collection_name: (str) Name of the collection, see `Databases`.
+        :return: (Collection) The collection.
+        """
+        db_client = self.get_db_client()
+        collection = self._collections.get(collection_name)
+        if collection is None:
+            collection = db_client[Databases.LYOHUB_DB][collection_name]
+            self._collections[collection_name] = collection
+        return collection
+
+    def get_pool_stats(self):
+        """Return the profile, the pool options and the pool stats per server of the
+        client of this process.
+
+        :return: (dict) Pool stats, empty if no client was created yet.
+        """
+        if not self._db_client or self._pid != os.getpid():
+            return dict()
+        return {
+            'pid': self._pid,
+            'profile': self.profile,
+            'options': {key: value for key, value in self._client_options.items() if key not in SECRET_OPTIONS},
+            'servers': self._pool_listener.get_stats()
+        }
+
+    def close(self):
+        """Close the db client, a new one is created on next use. To be called before
+        forking, a child process must not use the client of its parent.
+        """
+        if self._db_client and self._pid == os.getpid():
+            self._db_client.close()
+        self._db_client = None
+        self._collections = dict()
+
+    def ping(self):
+        """Return whether the database answers a ping."""
+        try:
+            self.get_db_client().admin.command('ping')
+        except PyMongoError as exc:
+            log.do_error(f"Database ping failed, error: {str(exc)}")
+            return False
+        return True
+
 class Databases:
     LYOHUB_DB = "lyohub"
     DRUGS_META_COLLECTION = "drugs_meta"
     INGREDIENTS_COLLECTION = "ingredients"
     LYOPHILIZED_COLLECTION = "lyophilized"
+    COOCCURRENCE_COLLECTION = "ingredient_pairs"
+    INGREDIENT_INDEX_COLLECTION = "ingredient_index"
+    LOCKS_COLLECTION = "locks"
+    LABEL_INGREDIENTS_COLLECTION = "label_ingredients"
+    REFRESH_JOBS_COLLECTION = "refresh_jobs"
 
 class DrugsMetaCollection(object):
     """
     Class to perform different operations on `drugs_meta` collection
     in Mongo DB.
     """
-    def __init__(self):
-        db = DatabaseConnection()
-        db_client = db.get_db_client()
-        self.db_connection = db_client[Databases.LYOHUB_DB][Databases.DRUGS_META_COLLECTION]
+    @property
+    def db_connection(self):
+        return DatabaseConnection().get_collection(Databases.DRUGS_META_COLLECTION)
 
     @db_retry() #decorator
     def bulk_update(self, records):
@@ -166,7 +416,7 @@ class DrugsMetaCollection(object):
         if not operations:
             return
 
-        return self.db_connection.bulk_write(operations, ordered=False)
+        return timed_bulk_write(self.db_connection, operations)
 
     @db_retry(retry_count=10)
     def get_records(self, query=None):
@@ -185,10 +435,9 @@ class IngredientsCollection(object):
     Class to perform different operations on `ingredients` collection
     in Mongo DB.
     """
-    def __init__(self):
-        db = DatabaseConnection()
-        db_client = db.get_db_client()
-        self.db_connection = db_client[Databases.LYOHUB_DB][Databases.INGREDIENTS_COLLECTION]
+    @property
+    def db_connection(self):
+        return DatabaseConnection().get_collection(Databases.INGREDIENTS_COLLECTION)
 
     @db_retry()
     def bulk_update(self, records):
@@ -214,18 +463,19 @@ class IngredientsCollection(object):
         if not operations:
             return
 
-        return self.db_connection.bulk_write(operations, ordered=False)
+        return timed_bulk_write(self.db_connection, operations)
 
     @db_retry(retry_count=10)
-    def get_records(self, query=None):
+    def get_records(self, query=None, projection=None):
         """Ftech records from DB. If no explicit query is given then return all the records.
 
         :param query: (dict) Dict containing the query to be performed on find operation on db.
+        :param projection: (dict) Optional dict of the fields to return for each record.
         """
         if query:
-            return self.db_connection.find(query)
+            return self.db_connection.find(query, projection)
 
-        return self.db_connection.find()
+        return self.db_connection.find({}, projection)
 
     @db_retry(retry_count=10)
     def remove_keys(self, query, keys_to_remove):
@@ -244,10 +494,9 @@ class LyophilizedCollection(object):
     Class to perform different operations on `lyophilized` collection
     in Mongo DB.
     """
-    def __init__(self):
-        db = DatabaseConnection()
-        db_client = db.get_db_client()
-        self.db_connection = db_client[Databases.LYOHUB_DB][Databases.LYOPHILIZED_COLLECTION]
+    @property
+    def db_connection(self):
+        return DatabaseConnection().get_collection(Databases.LYOPHILIZED_COLLECTION)
 
     @db_retry()
     def bulk_update(self, records):
@@ -273,7 +522,239 @@ class LyophilizedCollection(object):
         if not operations:
             return
 
-        return self.db_connection.bulk_write(operations, ordered=False)
+        return timed_bulk_write(self.db_connection, operations)
+
+    @db_retry(retry_count=10)
+    def get_records(self, query=None, projection=None):
+        """Ftech records from DB. If no explicit query is given then return all the records.
+
+        :param query: (dict) Dict containing the query to be performed on find operation on db.
+        :param projection: (dict) Optional dict of the fields to return for each record.
+        """
+        if query:
+            return self.db_connection.find(query, projection).sort('first_submission_date')
+
+        return self.db_connection.find({}, projection).sort('first_submission_date')
+
+    @db_retry(retry_count=10)
+    def create_indexes(self):
+        """Create the indexes used by the dashboard and the query API. Creating an
+        index which already exists is a no-op.
+        """
+        # Date range filters and keyset pagination on the drug's first submission date.
+        self.db_connection.create_index([('first_submission_date', ASCENDING), ('_id', ASCENDING)])
+        # The ingredient lists are arrays, and Mongo can not build a compound
+        # index over two array fields, hence single field indexes for these.
+        for key in ['products', 'active_ingredients_list', 'inactive_ingredients_list',
+                    'active_ingredient_ids', 'inactive_ingredient_ids', 'company']:
+            self.db_connection.create_index([(key, ASCENDING)])
+
+    @db_retry(retry_count=10)
+    def update_first_submission_dates(self):
+        """Backfill the `first_submission_date` field, the earliest of the `date`
+        list, of the records which do not have it yet.
+
+        :returns: (UpdateResult) Number of records matched and updated.
+        """
+        return self.db_connection.update_many(
+            {'first_submission_date': {'$exists': False}, 'date.0': {'$exists': True}},
+            [{'$set': {'first_submission_date': {'$arrayElemAt': ['$date', 0]}}}])
+
+    @db_retry(retry_count=10)
+    def get_page(self, query=None, projection=None, after=None, limit=100):
+        """Fetch a page of records sorted on the drug's first submission date and `_id`,
+        using keyset pagination, i.e. the page starts right after the given sort key
+        instead of skipping over all the previous records. The filter and the sort
+        are both served by the `first_submission_date`, `_id` index.
+
+        :param query: (dict) Dict containing the query to be performed on find operation on db.
+        :param projection: (dict) Optional dict of the fields to return for each record.
+        :param after: (tuple) First submission date and `_id` of the last record of the
+                      previous page, None for the first page.
+        :param limit: (int) Maximum number of records to return.
+        :returns: (list) List of records.
+        """
+        page_query = {'first_submission_date': {'$type': 'date'}}
+        if query:
+            page_query = {'$and': [page_query, query]}
+        if after:
+            keyset = {'$or': [
+                {'first_submission_date': {'$gt': after[0]}},
+                {'first_submission_date': after[0], '_id': {'$gt': after[1]}}
+            ]}
+            page_query = {'$and': [page_query, keyset]}
+
+        cursor = self.db_connection.find(page_query, projection).sort([('first_submission_date', 1), ('_id', 1)]).limit(limit)
+        return list(cursor)
+
+    @db_retry(retry_count=10)
+    def get_updated_records(self, since, projection=None):
+        """Fetch the records written (see `lut`) at or after the given time.
+
+        :param since: (int) Unix time of the oldest write to return.
+        :param projection: (dict) Optional dict of the fields to return for each record.
+        """
+        return self.db_connection.find({'lut': {'$gte': since}}, projection)
+
+    def watch(self, fields=None, resume_after=None, max_await_time_ms=None):
+        """Open a change stream on the collection, with the full record after each
+        insert, update or replace. Change streams need a replica set or a sharded
+        cluster, `OperationFailure` is raised on a standalone server.
+
+        :param fields: (list) Fields of the records to return, all if not given.
+        :param resume_after: (dict) Resume token of the last change seen, if any.
+        :param max_await_time_ms: (int) Time to wait for a change on each `try_next`.
+        :returns: (ChangeStream) The change stream, to be closed by the caller.
+        """
+        pipeline = [{'$match': {'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}}}]
+        if fields:
+            projection = {f"fullDocument.{field}": 1 for field in fields}
+            projection.update({'operationType': 1, 'documentKey': 1})
+            pipeline.append({'$project': projection})
+
+        return self.db_connection.watch(pipeline, full_document='updateLookup', resume_after=resume_after,
+                                        max_await_time_ms=max_await_time_ms)
+
+    @db_retry(retry_count=10)
+    def get_distinct_values(self, key, query=None):
+        """Return the distinct values stored under the given key. Array fields like
+        `products` or `active_ingredients_list` are unwound by Mongo itself, so only
+        the unique values are sent over the wire.
+
+        :param key: (str) Name of the field to fetch distinct values for.
+        :param query: (dict) Optional query to filter the records on.
+        :returns: (list) List of distinct values for the field.
+        """
+        return self.db_connection.distinct(key, query or {})
+
+    @db_retry(retry_count=10)
+    def get_yearly_occurrences(self, key, values=None):
+        """Run a server side aggregation to count the number of products an ingredient
+        (or company) is present in, grouped by the year of the drug's first submission.
+        A product and ingredient pair is only counted once, in the earliest year it was seen.
+
+        :param key: (str) Field holding the values to count, i.e. `active_ingredient_ids`,
+                    `inactive_ingredient_ids` or `company`.
+        :param values: (list) Only count these values, all the values if not given.
+        :returns: (CommandCursor) Cursor over dicts with `value`, `year` and `count` keys.
+        """
+        match = {key: {'$exists': True, '$nin': [[], None, ""]}, 'date.0': {'$exists': True}}
+        if values is not None:
+            match[key]['$in'] = list(values)
+        pipeline = [
+            {'$match': match},
+            {'$project': {
+                '_id': 0,
+                'products': 1,
+                'value': f"${key}",
+                'year': {'$year': {'$arrayElemAt': ['$date', 0]}}
+            }},
+            {'$unwind': '$products'},
+            {'$unwind': '$value'},
+            {'$group': {
+                '_id': {'product': '$products', 'value': '$value'},
+                'year': {'$min': '$year'}
+            }},
+            {'$group': {
+                '_id': {'value': '$_id.value', 'year': '$year'},
+                'count': {'$sum': 1}
+            }},
+            {'$project': {'_id': 0, 'value': '$_id.value', 'year': '$_id.year', 'count': 1}}
+        ]
+        if values is not None:
+            # Drugs matched on one of the values also list other values, drop them after the unwind.
+            pipeline.insert(4, {'$match': {'value': {'$in': list(values)}}})
+
+        return self.db_connection.aggregate(pipeline, allowDiskUse=True)
+
+
+class CooccurrenceCollection(object):
+    """
+    Class to perform different operations on `ingredient_pairs` collection
+    in Mongo DB. Each record holds a pair of ingredients and the number of
+    lyophilized drugs both the ingredients are present in.
+    """
+    @property
+    def db_connection(self):
+        return DatabaseConnection().get_collection(Databases.COOCCURRENCE_COLLECTION)
+
+    @db_retry()
+    def bulk_increment(self, pair_counts):
+        """Does a unordered bulk increment of the count of given ingredient pairs,
+        pairs whose count drops to zero are removed.
+
+        :param pair_counts: (dict) Dict with a sorted tuple of two ingredients as key
+                            and the number to add to the pair's count (can be negative) as value.
+        :returns: (BulkWriteResult) Type and count of operations performed if any operations to perform 
+                                    else None if there are no operations to perform.
+        """
+        operations = []
+        lut = int(time.time())
+        for (first, second), count in pair_counts.items():
+            if not count:
+                continue
+            operations.append(UpdateOne({"_id": f"{first}|{second}"},
+                                        {"$inc": {"count": count},
+                                         "$set": {"lut": lut},
+                                         "$setOnInsert": {"ingredients": [first, second]}},
+                                        upsert=True))
+
+        if not operations:
+            return
+
+        result = timed_bulk_write(self.db_connection, operations)
+        self.db_connection.delete_many({"count": {"$lte": 0}})
+        return result
+
+    @db_retry(retry_count=10)
+    def get_records(self, query=None):
+        """Ftech records from DB. If no explicit query is given then return all the records.
+
+        :param query: (dict) Dict containing the query to be performed on find operation on db.
+        """
+        if query:
+            return self.db_connection.find(query)
+
+        return self.db_connection.find()
+
+    @db_retry(retry_count=10)
+    def remove_all(self):
+        """Remove all the records, used before rebuilding the counts from scratch."""
+        self.db_connection.delete_many({})
+
+
+class IngredientIndexCollection(object):
+    """
+    Class to perform different operations on `ingredient_index` collection
+    in Mongo DB. Each record is a canonical ingredient, keyed on its UNII code
+    (or on its name for ingredients without a code), along with all the names
+    the ingredient is listed with on the labels.
+    """
+    @property
+    def db_connection(self):
+        return DatabaseConnection().get_collection(Databases.INGREDIENT_INDEX_COLLECTION)
+
+    @db_retry()
+    def bulk_update_aliases(self, aliases):
+        """Does a unordered bulk upsert of the canonical ingredients and their aliases.
+
+        :param aliases: (dict) Dict with the canonical ingredient ID as key and the
+                        set of names to add as aliases as value.
+        :returns: (BulkWriteResult) Type and count of operations performed if any operations to perform 
+                                    else None if there are no operations to perform.
+        """
+        operations = []
+        lut = int(time.time())
+        for ingredient_id, ingredient_aliases in aliases.items():
+            operations.append(UpdateOne({"_id": ingredient_id},
+                                        {"$addToSet": {"aliases": {"$each": sorted(ingredient_aliases)}},
+                                         "$set": {"lut": lut}},
+                                        upsert=True))
+
+        if not operations:
+            return
+
+        return timed_bulk_write(self.db_connection, operations)
 
     @db_retry(retry_count=10)
     def get_records(self, query=None):
@@ -282,6 +763,236 @@ class LyophilizedCollection(object):
         :param query: (dict) Dict containing the query to be performed on find operation on db.
         """
         if query:
-            return self.db_connection.find(query).sort('date')
+            return self.db_connection.find(query)
+
+        return self.db_connection.find()
+
+
+class LocksCollection(object):
+    """
+    Class to perform different operations on `locks` collection in Mongo DB.
+    A lock is a record with the lock name as `_id`, the owner holding it and
+    the time it expires at, so a lock held by a crashed process is freed
+    once it expires.
+    """
+    @property
+    def db_connection(self):
+        return DatabaseConnection().get_collection(Databases.LOCKS_COLLECTION)
+
+    @db_retry(retry_count=10)
+    def acquire(self, name, owner, ttl):
+        """Acquire the lock, or extend it if it is already held by the same owner.
+
+        :param name: (str) Name of the lock.
+        :param owner: (str) Unique name of the owner acquiring the lock.
+        :param ttl: (int) Number of seconds after which the lock expires.
+        :returns: (bool) True if the lock is held by the owner, False otherwise.
+        """
+        now = int(time.time())
+        try:
+            self.db_connection.update_one(
+                {"_id": name, "$or": [{"owner": owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": owner, "expires_at": now + ttl, "lut": now}},
+                upsert=True)
+        except DuplicateKeyError:
+            return False
+        return True
+
+    @db_retry(retry_count=10)
+    def release(self, name, owner):
+        """Release the lock if it is held by the given owner.
+
+        :param name: (str) Name of the lock.
+        :param owner: (str) Unique name of the owner releasing the lock.
+        """
+        self.db_connection.delete_one({"_id": name, "owner": owner})
+
+    @contextmanager
+    def hold(self, names, owner, ttl):
+        """Hold all the given locks, or none of them, extending them until the block
+        exits so that long runs do not lose them.
+
+        :param names: (list) Names of the locks.
+        :param owner: (str) Unique name of the owner acquiring the locks.
+        :param ttl: (int) Number of seconds after which the locks expire if not extended.
+        :returns: (bool) True if the locks are held, False if any is held by another owner.
+        """
+        acquired = list()
+        for name in sorted(set(names)):
+            if not self.acquire(name, owner, ttl):
+                break
+            acquired.append(name)
+        else:
+            done = threading.Event()
+            def heartbeat():
+                while not done.wait(ttl / 3):
+                    for name in acquired:
+                        self.acquire(name, owner, ttl)
+
+            threading.Thread(target=heartbeat, daemon=True).start()
+            try:
+                yield True
+            finally:
+                done.set()
+                for name in acquired:
+                    self.release(name, owner)
+            return
+
+        for name in acquired:
+            self.release(name, owner)
+        yield False
+
+
+class RefreshJobsCollection(object):
+    """
+    Class to perform different operations on `refresh_jobs` collection in
+    Mongo DB. Each record is the status of a refresh requested through the
+    dashboard API, shared by all the dashboard workers.
+    """
+    @property
+    def db_connection(self):
+        return DatabaseConnection().get_collection(Databases.REFRESH_JOBS_COLLECTION)
+
+    @db_retry(retry_count=10)
+    def set_job(self, job_id, **status):
+        """Create or update the status of a job.
+
+        :param job_id: (str) ID of the job.
+        :param status: Fields of the job to set, e.g. `status` or `error`.
+        """
+        self.db_connection.update_one({"_id": job_id}, {"$set": dict(status, lut=int(time.time()))}, upsert=True)
+
+    @db_retry(retry_count=10)
+    def get_job(self, job_id):
+        """Return the status of a job, None if there is no such job."""
+        return self.db_connection.find_one({"_id": job_id}, {"lut": 0})
+
+    @db_retry(retry_count=10)
+    def create_indexes(self):
+        """Expire the jobs a week after their last update."""
+        self.db_connection.create_index([('lut', ASCENDING)], expireAfterSeconds=REFRESH_JOB_TTL)
+
+
+class LabelIngredientsCollection(object):
+    """
+    Class to perform different operations on `label_ingredients` collection
+    in Mongo DB. Each record is one ingredient of one DailyMed label of a
+    lyophilized drug, i.e. the nested `active_ingredients` and `inactive_ingredients`
+    maps of the `lyophilized` collection flattened, so that they can be indexed.
+    """
+    @property
+    def db_connection(self):
+        return DatabaseConnection().get_collection(Databases.LABEL_INGREDIENTS_COLLECTION)
+
+    @db_retry()
+    def bulk_replace(self, drug_records):
+        """Does a unordered bulk replace of the label ingredients of the given drugs,
+        records of a drug which are not given anymore are removed.
+
+        :param drug_records: (dict) Dict with the application number as key and the list
+                             of label ingredient records of the drug as value.
+        :returns: (BulkWriteResult) Type and count of operations performed if any operations to perform 
+                                    else None if there are no operations to perform.
+        """
+        operations = []
+        lut = int(time.time())
+        for application_number, records in drug_records.items():
+            record_ids = list()
+            for record in records:
+                record['lut'] = lut
+                record_ids.append(record.get('_id'))
+                operations.append(ReplaceOne({"_id": record.get('_id')}, record, upsert=True))
+            operations.append(DeleteMany({"application_number": application_number, "_id": {"$nin": record_ids}}))
+
+        if not operations:
+            return
+
+        return timed_bulk_write(self.db_connection, operations)
 
-        return self.db_connection.find().sort('date')
\ No newline at end of file
+    @db_retry(retry_count=10)
+    def get_records(self, query=None, projection=None):
+        """Ftech records from DB, sorted by drug, label and position of the ingredient
+        on the label. If no explicit query is given then return all the records.
+
+        :param query: (dict) Dict containing the query to be performed on find operation on db.
+        :param projection: (dict) Optional dict of the fields to return for each record.
+        """
+        sort = [('application_number', ASCENDING), ('setid', ASCENDING), ('role', ASCENDING), ('position', ASCENDING)]
+        return self.db_connection.find(query or {}, projection).sort(sort)
+
+    @db_retry(retry_count=10)
+    def get_page(self, query=None, projection=None, after=None, limit=100):
+        """Fetch a page of records sorted on `_id`, using keyset pagination.
+
+        :param query: (dict) Dict containing the query to be performed on find operation on db.
+        :param projection: (dict) Optional dict of the fields to return for each record.
+        :param after: (str) `_id` of the last record of the previous page, None for the first page.
+        :param limit: (int) Maximum number of records to return.
+        :returns: (list) List of records.
+        """
+        page_query = dict(query or {})
+        if after:
+            page_query = {'$and': [page_query, {'_id': {'$gt': after}}]}
+
+        return list(self.db_connection.find(page_query, projection).sort('_id', ASCENDING).limit(limit))
+
+    @db_retry(retry_count=10)
+    def get_distinct_values(self, key, query=None):
+        """Return the distinct values stored under the given key for the records
+        matching the query.
+
+        :param key: (str) Name of the field to fetch distinct values for.
+        :param query: (dict) Optional query to filter the records on.
+        :returns: (list) List of distinct values for the field.
+        """
+        return self.db_connection.distinct(key, query or {})
+
+    @db_retry(retry_count=10)
+    def get_co_ingredients(self, ingredient_ids, role=None, limit=None):
+        """Run a server side aggregation to count the drugs in which other ingredients
+        are listed on the same label as any of the given ingredients.
+
+        :param ingredient_ids: (list) Canonical ingredient IDs.
+        :param role: (str) Only count co-ingredients with this role, `active` or `inactive`.
+        :param limit: (int) Maximum number of co-ingredients to return, all if not given.
+        :returns: (CommandCursor) Cursor over dicts with `ingredient_id` and `count` keys,
+                  most frequent co-ingredients first.
+        """
+        setids = self.get_distinct_values('setid', {'ingredient_id': {'$in': list(ingredient_ids)}})
+        match = {'setid': {'$in': setids}, 'ingredient_id': {'$nin': list(ingredient_ids)}}
+        if role:
+            match['role'] = role
+        pipeline = [
+            {'$match': match},
+            {'$group': {'_id': '$ingredient_id', 'drugs': {'$addToSet': '$application_number'}}},
+            {'$project': {'_id': 0, 'ingredient_id': '$_id', 'count': {'$size': '$drugs'}}},
+            {'$sort': {'count': -1, 'ingredient_id': 1}}
+        ]
+        if limit:
+            pipeline.append({'$limit': limit})
+
+        return self.db_connection.aggregate(pipeline, allowDiskUse=True)
+
+    @db_retry(retry_count=10)
+    def create_indexes(self):
+        """Create the indexes used by the dashboard and the query API. Creating an
+        index which already exists is a no-op.
+        """
+        # Drugs by ingredient, optionally narrowed to a role and a strength.
+        self.db_connection.create_index([('ingredient_id', ASCENDING), ('role', ASCENDING),
+                                         ('strength', ASCENDING), ('application_number', ASCENDING)])
+        # Labels of a drug in table order, also used to replace the records of a drug.
+        self.db_connection.create_index([('application_number', ASCENDING), ('setid', ASCENDING),
+                                         ('role', ASCENDING), ('position', ASCENDING)])
+        # Ingredients listed together on a label.
+        self.db_connection.create_index([('setid', ASCENDING), ('ingredient_id', ASCENDING)])
+
+    @db_retry(retry_count=10)
+    def remove_all(self):
+        """Remove all the records, used before rebuilding the collection from scratch."""
+        self.db_connection.delete_many({})
+
+    @db_retry(retry_count=10)
+    def is_empty(self):
+        """Return True if the collection has no records, e.g. before it is backfilled."""
+        return self.db_connection.find_one({}, {'_id': 1}) is None
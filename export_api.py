@@ -0,0 +1,157 @@
+#pylint: disable=invalid-name
+# -*- coding: utf-8 -*-
+"""
+.. :module:: export_api
+   :platform: Linux
+   :synopsis: Flask blueprint to export the drugs shown on the tables page
+              as CSV, Parquet or Arrow IPC.
+
+.. moduleauthor:: Ashwani Agarwal (agarw288@purdue.edu) (October 18, 2026)
+"""
+
+import io
+import csv
+import logger as log
+from flask import (
+    Blueprint,
+    Response,
+    abort,
+    request,
+    stream_with_context
+)
+from ui_data import (
+    EXPORT_COLUMNS,
+    MongoData
+)
+from query_api import (
+    parse_date
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows')
+}
+
+MONGO_DATA = MongoData()
+
+export_blueprint = Blueprint('export', __name__)
+
+class ChunkSink(io.RawIOBase):
+    """
+    Write only file object which holds written bytes until they are drained,
+    used to stream the output of the pyarrow writers chunk by chunk.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = list()
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = list()
+        return data
+
+def get_batches(rows):
+    """Group the rows into lists of at most `EXPORT_BATCH_SIZE` rows."""
+    batch = list()
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield batch
+            batch = list()
+
+    if batch:
+        yield batch
+
+def stream_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in get_batches(rows):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate(0)
+
+    data = buffer.getvalue()
+    if data:
+        yield data.encode('utf-8')
+
+def get_arrow_schema():
+    fields = list()
+    for column in EXPORT_COLUMNS:
+        if column == 'first_submission_date':
+            fields.append(pa.field(column, pa.date32()))
+        else:
+            fields.append(pa.field(column, pa.string()))
+    return pa.schema(fields)
+
+def stream_arrow(rows, export_format):
+    schema = get_arrow_schema()
+    sink = ChunkSink()
+    if export_format == 'parquet':
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+
+    for batch in get_batches(rows):
+        columns = list(zip(*batch))
+        record_batch = pa.record_batch([pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                                       schema=schema)
+        writer.write_batch(record_batch)
+        yield sink.drain()
+
+    writer.close()
+    yield sink.drain()
+
+@export_blueprint.route('/export', methods=['GET'])
+def export_table_data():
+    """Stream the drugs matching the `product`, `active`, `inactive` or `company`
+    query parameters (same filters as the tables page, each can be repeated) and
+    the `start_date`/`end_date` first submission date range, in the requested
+    `format`: `csv` (default), `parquet` or `arrow`.
+    """
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        abort(400, f"Unsupported export format: {export_format}")
+    if export_format != 'csv' and not pa:
+        abort(501, f"Export format {export_format} needs pyarrow to be installed")
+
+    rows = MONGO_DATA.iter_export_rows(product_search=request.args.getlist('product'),
+                                     active_search=request.args.getlist('active'),
+                                     inactive_search=request.args.getlist('inactive'),
+                                     company_search=request.args.getlist('company'),
+                                     start_date=parse_date('start_date'),
+                                     end_date=parse_date('end_date'))
+    log.do_info(f"Exporting table data as {export_format} for filters: {dict(request.args.lists())}")
+
+    if export_format == 'csv':
+        stream = stream_csv(rows)
+    else:
+        stream = stream_arrow(rows, export_format)
+
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    return Response(stream_with_context(stream), mimetype=mimetype,
+                    headers={'Content-Disposition': f"attachment; filename=lyophilized_drugs.{extension}"})
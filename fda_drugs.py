@@ -19,6 +19,9 @@ from pymongo import (
 from download_drugs_data import (
     DownloadDrugsData
 )
+from metrics import (
+    count_records
+)
 from database import (
     DrugsMetaCollection,
     IngredientsCollection,
@@ -62,10 +65,13 @@ class DrugsMeta(object):
             sponsor_name = drug_meta.get("sponsor_name", "").lower()
             
             products_name = set()
+            dosage_forms = set()
             for product in drug_meta.get("products", []):
                 prod_name = product.get("brand_name", "").lower()
                 if prod_name:
                     products_name.add(prod_name)
+                if product.get("dosage_form"):
+                    dosage_forms.add(product.get("dosage_form").upper())
 
             date_list = set()
             for submission in drug_meta.get("submissions", []):
@@ -89,10 +95,17 @@ class DrugsMeta(object):
                     log.do_error(f"Submission date: {date} not in proper format for app number: {application_number}")
 
             drug_meta_json.update({
+                "_id": application_number,
                 "application_number": application_number,
                 "company": sponsor_name,
                 "products": list(products_name),
-                "date": datetime_list
+                # Used to pick the drugs whose SPLs are classified (see `DailyMed.classify_lyophilized_from_spl`).
+                "dosage_forms": sorted(dosage_forms),
+                "date": datetime_list,
+                "first_submission_date": datetime_list[0] if datetime_list else None,
+                # SPL set IDs harmonized by openFDA, used to resolve the DailyMed labels
+                # of all the drugs at once (see `DailyMed.get_spl_titles`).
+                "spl_set_ids": sorted(set(drug_meta.get("openfda", {}).get("spl_set_id", [])))
             })
         except Exception as exc:
             log.do_error(f"Error while parsing drugs meta, error: {str(exc)}")
@@ -112,6 +125,7 @@ class DrugsMeta(object):
             if drug_meta_json:
                 records_list.append(drug_meta_json)
                 update_counter += 1
+                count_records()
             if (update_counter % 10000 == 0) and records_list:
                 db_obj.bulk_update({'insert': records_list})
                 records_list = list()
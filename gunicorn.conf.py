@@ -0,0 +1,52 @@
+#pylint: disable=invalid-name
+# -*- coding: utf-8 -*-
+"""
+.. :module:: gunicorn.conf
+   :platform: Linux
+   :synopsis: Gunicorn settings for the dashboard, loaded by gunicorn when run
+              from this directory. Settings can be changed in the `server`
+              section of the config file, e.g.
+              `{"bind": "0.0.0.0:8050", "workers": 4, "threads": 4}`.
+
+.. moduleauthor:: Ashwani Agarwal (agarw288@purdue.edu) (October 18, 2026)
+"""
+
+import os
+import multiprocessing
+from database import (
+    get_config
+)
+
+_config = get_config().get('server') or {}
+
+bind = _config.get('bind', "0.0.0.0:8050")
+# Every worker holds the dashboard data, keep their number small and serve
+# concurrent callbacks of a worker from threads.
+workers = _config.get('workers', min(4, multiprocessing.cpu_count()))
+# Read by the app on load, the dashboard watcher is on by default with several workers.
+os.environ['DASHBOARD_WORKERS'] = str(workers)
+worker_class = "gthread"
+threads = _config.get('threads', 4)
+timeout = _config.get('timeout', 120)
+# Load the dashboard data once in the master, the workers share it after fork.
+preload_app = True
+
+def when_ready(server):
+    """Runs in the master once the app is loaded, before the workers are forked."""
+    from app import (
+        close_db_connections
+    )
+    close_db_connections()
+
+def post_fork(server, worker):
+    from app import (
+        init_worker
+    )
+    init_worker()
+
+def worker_exit(server, worker):
+    from app import (
+        DASHBOARD_WATCHER
+    )
+    if DASHBOARD_WATCHER:
+        DASHBOARD_WATCHER.stop()
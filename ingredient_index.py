@@ -0,0 +1,163 @@
+#pylint: disable=invalid-name
+# -*- coding: utf-8 -*-
+"""
+.. :module:: ingredient_index
+   :platform: Linux
+   :synopsis: Module for normalizing ingredient names to canonical
+              ingredient IDs based on their UNII codes.
+
+.. moduleauthor:: Ashwani Agarwal (agarw288@purdue.edu) (October 18, 2026)
+"""
+
+import logger as log
+from database import (
+    IngredientIndexCollection,
+    LyophilizedCollection
+)
+
+REBUILD_BATCH_SIZE = 5000
+
+class IngredientIndex(object):
+    """
+    Class to map ingredient names, as listed on the SPL documents, to canonical
+    ingredient IDs and back. The canonical ID of an ingredient is its UNII code,
+    ingredients without a code are identified by their name, unless the name
+    is a known alias of an ingredient with a code. The canonical name of an
+    ingredient is its shortest alias.
+    """
+
+    def __init__(self, records=None):
+        self._names = dict()
+        self._alias_ids = dict()
+        self._pending = dict()
+        for record in records or []:
+            self._add(record.get('_id'), record.get('aliases', []))
+
+    @classmethod
+    def from_db(cls):
+        return cls(IngredientIndexCollection().get_records())
+
+    def __len__(self):
+        return len(self._names)
+
+    def _add(self, ingredient_id, aliases):
+        for alias in aliases:
+            self._alias_ids.setdefault(alias, set()).add(ingredient_id)
+            name = self._names.get(ingredient_id)
+            if not name or (len(alias), alias) < (len(name), name):
+                self._names[ingredient_id] = alias
+
+    def get_id(self, name, code=None):
+        """Return the canonical ID for an ingredient.
+
+        :param name: (str) Ingredient name as listed on the label.
+        :param code: (str) UNII code of the ingredient, if any.
+        :returns: (str) Canonical ingredient ID.
+        """
+        if code:
+            return code
+
+        coded_ids = sorted(ingredient_id for ingredient_id in self._alias_ids.get(name, [])
+                           if ingredient_id != name)
+        if coded_ids:
+            return coded_ids[0]
+        return name
+
+    def get_name(self, ingredient_id):
+        """Return the canonical name for a canonical ingredient ID."""
+        return self._names.get(ingredient_id, ingredient_id)
+
+    def get_ids(self, names):
+        """Return the canonical IDs of all the ingredients known by the given names,
+        either as their canonical name or as an alias.
+
+        :param names: (list) Ingredient names.
+        :returns: (list) Canonical ingredient IDs.
+        """
+        ingredient_ids = set()
+        for name in names:
+            ingredient_ids.update(self._alias_ids.get(name, {name}))
+        return sorted(ingredient_ids)
+
+    def add_ingredient(self, name, code=None):
+        """Resolve an ingredient to its canonical ID, and record the name as an
+        alias of the ID to be saved with `save`.
+
+        :param name: (str) Ingredient name as listed on the label.
+        :param code: (str) UNII code of the ingredient, if any.
+        :returns: (str) Canonical ingredient ID.
+        """
+        ingredient_id = self.get_id(name, code)
+        if name not in self._alias_ids or ingredient_id not in self._alias_ids[name]:
+            self._add(ingredient_id, [name])
+            self._pending.setdefault(ingredient_id, set()).add(name)
+        return ingredient_id
+
+    def get_ingredient_ids(self, ingredients):
+        """Return the sorted canonical IDs of the given parsed ingredients.
+
+        :param ingredients: (list) List of dicts with `name` and `code` of the ingredients.
+        :returns: (list) Canonical ingredient IDs.
+        """
+        ingredient_ids = set()
+        for ingredient in ingredients:
+            if ingredient.get('name'):
+                ingredient_ids.add(self.add_ingredient(ingredient.get('name'), ingredient.get('code')))
+        return sorted(ingredient_ids)
+
+    def save(self):
+        """Save the aliases added since the last save to the `ingredient_index` collection."""
+        if not self._pending:
+            return
+        IngredientIndexCollection().bulk_update_aliases(self._pending)
+        log.do_info(f"Updated ingredient index with {len(self._pending)} ingredients.")
+        self._pending = dict()
+
+def rebuild_ingredient_index():
+    """Backfill the `ingredient_index` collection and the `active_ingredient_ids`,
+    `inactive_ingredient_ids` lists of the lyophilized drugs from the ingredients
+    already stored for each label, without fetching the SPL documents again.
+    """
+    ingredient_index = IngredientIndex.from_db()
+    lyophilized_db_obj = LyophilizedCollection()
+    projection = {'active_ingredients': 1, 'inactive_ingredients': 1}
+
+    # Register the names of the ingredients with a code first, so that the same name
+    # without a code on another label resolves to the coded ingredient.
+    for record in lyophilized_db_obj.get_records(query={'lyophilized': True}, projection=projection):
+        for role in ['active', 'inactive']:
+            for setid_ingredients in record.get(f"{role}_ingredients", {}).values():
+                for ingredient in setid_ingredients:
+                    if ingredient.get('name') and ingredient.get('code'):
+                        ingredient_index.add_ingredient(ingredient.get('name'), ingredient.get('code'))
+
+    records_list = list()
+    update_counter = 0
+    for record in lyophilized_db_obj.get_records(query={'lyophilized': True}, projection=projection):
+        db_record = {'_id': record.get('_id')}
+        for role in ['active', 'inactive']:
+            ingredients = list()
+            for setid_ingredients in record.get(f"{role}_ingredients", {}).values():
+                ingredients.extend(setid_ingredients)
+            db_record[f"{role}_ingredient_ids"] = ingredient_index.get_ingredient_ids(ingredients)
+        records_list.append(db_record)
+        update_counter += 1
+
+        if len(records_list) >= REBUILD_BATCH_SIZE:
+            ingredient_index.save()
+            lyophilized_db_obj.bulk_update({'insert': records_list})
+            records_list = list()
+
+    ingredient_index.save()
+    if records_list:
+        lyophilized_db_obj.bulk_update({'insert': records_list})
+
+    log.do_info(f"Rebuilt canonical ingredient IDs for {update_counter} records, "
+                f"{len(ingredient_index)} canonical ingredients.")
+
+if __name__ == "__main__":
+    from cooccurrence import (
+        rebuild_cooccurrence_counts
+    )
+    rebuild_ingredient_index()
+    rebuild_cooccurrence_counts()
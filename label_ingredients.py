@@ -0,0 +1,96 @@
+#pylint: disable=invalid-name
+# -*- coding: utf-8 -*-
+"""
+.. :module:: label_ingredients
+   :platform: Linux
+   :synopsis: Module for the flat `label_ingredients` collection, one record
+              per ingredient of a DailyMed label of a lyophilized drug.
+
+.. moduleauthor:: Ashwani Agarwal (agarw288@purdue.edu) (October 18, 2026)
+"""
+
+import logger as log
+from database import (
+    LabelIngredientsCollection,
+    LyophilizedCollection
+)
+from ingredient_index import (
+    IngredientIndex
+)
+
+ROLES = ['active', 'inactive']
+REBUILD_BATCH_SIZE = 500
+
+def get_label_ingredient_records(application_number, active_ingredients, inactive_ingredients, ingredient_index):
+    """Flatten the ingredients of a drug's labels into `label_ingredients` records.
+
+    :param application_number: (str) Application number of the drug, the `_id` of its
+                               `lyophilized` record.
+    :param active_ingredients: (dict) SPL set ID to the list of parsed active ingredients.
+    :param inactive_ingredients: (dict) SPL set ID to the list of parsed inactive ingredients.
+    :param ingredient_index: (IngredientIndex) Index to resolve the canonical ingredient IDs.
+    :returns: (list) List of records, one per ingredient and label.
+    """
+    records = list()
+    for role, ingredients in zip(ROLES, [active_ingredients, inactive_ingredients]):
+        for setid, setid_ingredients in (ingredients or {}).items():
+            for position, ingredient in enumerate(setid_ingredients or []):
+                name = ingredient.get('name')
+                records.append({
+                    '_id': f"{application_number}|{setid}|{role}|{position}",
+                    'application_number': application_number,
+                    'setid': setid,
+                    'role': role,
+                    'position': position,
+                    'ingredient_id': ingredient_index.get_id(name, ingredient.get('code')) if name else None,
+                    'name': name or "",
+                    'code': ingredient.get('code'),
+                    'strength': ingredient.get('strength', "")
+                })
+
+    return records
+
+def get_application_numbers(ingredient_ids, role=None, strength=None):
+    """Return the application numbers of the drugs with any of the given ingredients
+    on one of their labels, answered from the `label_ingredients` indexes only.
+
+    :param ingredient_ids: (list) Canonical ingredient IDs.
+    :param role: (str) Only match the ingredients with this role, `active` or `inactive`.
+    :param strength: (str) Only match the ingredients listed with this strength.
+    :returns: (list) Application numbers.
+    """
+    query = {'ingredient_id': {'$in': list(ingredient_ids)}}
+    if role:
+        query['role'] = role
+    if strength is not None:
+        query['strength'] = strength
+    return LabelIngredientsCollection().get_distinct_values('application_number', query)
+
+def rebuild_label_ingredients():
+    """Rebuild the `label_ingredients` collection from scratch from the ingredients
+    already stored for each label in the `lyophilized` collection. Only needed to
+    backfill the collection, it is kept up to date by `update_ingredients_to_db`.
+    """
+    ingredient_index = IngredientIndex.from_db()
+    label_ingredients_db_obj = LabelIngredientsCollection()
+    label_ingredients_db_obj.remove_all()
+    label_ingredients_db_obj.create_indexes()
+
+    drug_records = dict()
+    record_counter = 0
+    projection = {'active_ingredients': 1, 'inactive_ingredients': 1}
+    for record in LyophilizedCollection().get_records(query={'lyophilized': True}, projection=projection):
+        drug_records[record.get('_id')] = get_label_ingredient_records(record.get('_id'), record.get('active_ingredients'),
+                                                                       record.get('inactive_ingredients'), ingredient_index)
+        record_counter += len(drug_records[record.get('_id')])
+        if len(drug_records) >= REBUILD_BATCH_SIZE:
+            label_ingredients_db_obj.bulk_replace(drug_records)
+            drug_records = dict()
+
+    if drug_records:
+        label_ingredients_db_obj.bulk_replace(drug_records)
+
+    log.do_info(f"Rebuilt label ingredients collection with {record_counter} records.")
+
+if __name__ == "__main__":
+    rebuild_label_ingredients()
@@ -0,0 +1,263 @@
+#pylint: disable=invalid-name
+# -*- coding: utf-8 -*-
+"""
+.. :module:: metrics
+   :platform: Linux
+   :synopsis: Module for in process counters and histograms of the pipeline,
+              exposed in the Prometheus text format and as a run summary.
+
+.. moduleauthor:: Ashwani Agarwal (agarw288@purdue.edu) (October 18, 2026)
+"""
+
+import json
+import time
+import threading
+import contextvars
+import logger as log
+from contextlib import (
+    contextmanager
+)
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer
+)
+
+DEFAULT_METRICS_PORT = 9108
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10000)
+SUMMARY_QUANTILES = (0.5, 0.95, 0.99)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_CURRENT_STAGE = contextvars.ContextVar('current_stage', default=None)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{str(value)}"' for key, value in labels) + "}"
+
+class Counter(object):
+    """
+    Monotonic counter, optionally split by labels.
+    """
+    type_name = "counter"
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in sorted(values.items())]
+
+    def snapshot(self):
+        with self._lock:
+            return [{'labels': dict(key), 'value': value} for key, value in sorted(self._values.items())]
+
+class Gauge(Counter):
+    """
+    Value which can go up and down, optionally split by labels.
+    """
+    type_name = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+class Histogram(object):
+    """
+    Histogram of observed values (durations, batch sizes) in cumulative buckets,
+    optionally split by labels.
+    """
+    type_name = "histogram"
+
+    def __init__(self, name, description, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            for index, bucket in enumerate(self.buckets):
+                if value <= bucket:
+                    counts[index] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the time spent in the `with` block."""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+
+    def get_quantile(self, quantile, **labels):
+        """Estimate a quantile from the buckets (upper bound of the bucket it falls in).
+
+        :returns: (float) The estimate, None if nothing was observed.
+        """
+        counts, _ = self._values.get(tuple(sorted(labels.items())), (None, 0))
+        if not counts or not sum(counts):
+            return
+        rank = quantile * sum(counts)
+        seen = 0
+        for bucket, count in zip(self.buckets + (float('inf'),), counts):
+            seen += count
+            if seen >= rank:
+                return bucket
+
+    def render(self):
+        lines = list()
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bucket, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                bucket_label = "+Inf" if bucket == float('inf') else repr(bucket)
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bucket_label),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+    def snapshot(self):
+        with self._lock:
+            keys = sorted(self._values)
+        snapshot = list()
+        for key in keys:
+            counts, total = self._values[key]
+            summary = {'labels': dict(key), 'count': sum(counts), 'sum': round(total, 6)}
+            for quantile in SUMMARY_QUANTILES:
+                summary[f"p{int(quantile * 100)}"] = self.get_quantile(quantile, **dict(key))
+            snapshot.append(summary)
+        return snapshot
+
+class Registry(object):
+    """
+    Registry of all the metrics of the process.
+    """
+
+    def __init__(self):
+        self._metrics = dict()
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        """Return all the metrics in the Prometheus text exposition format."""
+        lines = list()
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+REGISTRY = Registry()
+
+def counter(name, description):
+    return REGISTRY.register(Counter(name, description))
+
+def gauge(name, description):
+    return REGISTRY.register(Gauge(name, description))
+
+def histogram(name, description, buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, description, buckets))
+
+HTTP_REQUEST_SECONDS = histogram("http_request_duration_seconds", "Latency of HTTP requests per endpoint and status.")
+SPL_PARSE_SECONDS = histogram("spl_parse_duration_seconds", "Time to parse the ingredients of a SPL document.")
+BULK_WRITE_SECONDS = histogram("mongo_bulk_write_duration_seconds", "Latency of Mongo bulk writes per collection.")
+BULK_WRITE_SIZE = histogram("mongo_bulk_write_operations", "Number of operations per Mongo bulk write.", SIZE_BUCKETS)
+STAGE_RECORDS = counter("pipeline_stage_records_total", "Records processed per pipeline stage.")
+STAGE_SECONDS = gauge("pipeline_stage_duration_seconds", "Duration of the last run of a pipeline stage.")
+STAGE_RATE = gauge("pipeline_stage_records_per_second", "Records processed per second in the last run of a stage.")
+POOL_CONNECTIONS = gauge("mongo_pool_connections", "Open and checked out connections of the Mongo pool per server.")
+POOL_CHECKOUT_SECONDS = histogram("mongo_pool_checkout_duration_seconds", "Time to check out a connection from the Mongo pool.")
+POOL_CHECKOUT_FAILURES = counter("mongo_pool_checkout_failures_total", "Failed Mongo pool checkouts per server and reason.")
+
+@contextmanager
+def track_stage(stage):
+    """Time a pipeline stage, records counted with `count_records` in the
+    `with` block (in this thread) are attributed to the stage."""
+    token = _CURRENT_STAGE.set(stage)
+    start_records = STAGE_RECORDS.get(stage=stage)
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        _CURRENT_STAGE.reset(token)
+        duration = time.perf_counter() - start_time
+        records = STAGE_RECORDS.get(stage=stage) - start_records
+        STAGE_SECONDS.set(round(duration, 3), stage=stage)
+        STAGE_RATE.set(round(records / duration, 3) if duration else 0, stage=stage)
+        log.do_info(f"Stage {stage} processed {records} records in {duration:.1f} seconds.")
+
+def count_records(amount=1):
+    """Count processed records for the stage currently tracked, if any."""
+    stage = _CURRENT_STAGE.get()
+    if stage:
+        STAGE_RECORDS.inc(amount, stage=stage)
+
+def write_run_summary(path):
+    """Write a snapshot of all the metrics as JSON to the given file."""
+    summary = {'generated_at': int(time.time()), 'metrics': REGISTRY.snapshot()}
+    with open(path, 'w') as fp:
+        json.dump(summary, fp, indent=2)
+    log.do_info(f"Wrote run summary to {path}")
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port=DEFAULT_METRICS_PORT, host="127.0.0.1"):
+    """Serve `/metrics` on a local port from a daemon thread.
+
+    :returns: (ThreadingHTTPServer) The server, None if the port is not available.
+    """
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as exc:
+        log.do_error(f"Failed to start metrics server on port {port}, error: {exc}")
+        return
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    log.do_info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,177 @@
+#pylint: disable=invalid-name
+# -*- coding: utf-8 -*-
+"""
+.. :module:: profiling
+   :platform: Linux
+   :synopsis: Opt-in latency profiling of the dashboard callbacks, split in
+              sections (Mongo query, row building, serialization).
+
+.. moduleauthor:: Ashwani Agarwal (agarw288@purdue.edu) (October 18, 2026)
+"""
+
+import os
+import time
+import cProfile
+import threading
+import contextvars
+import logger as log
+from functools import (
+    wraps
+)
+from contextlib import (
+    contextmanager
+)
+from collections import (
+    deque
+)
+from plotly.io.json import (
+    to_json_plotly
+)
+from database import (
+    get_config
+)
+from metrics import (
+    SIZE_BUCKETS,
+    histogram
+)
+
+MAX_SAMPLES = 1000
+DEFAULT_SLOW_THRESHOLD = 1.0
+PERCENTILES = (50, 95, 99)
+PAYLOAD_BUCKETS = tuple(size * 1024 for size in SIZE_BUCKETS)
+
+CALLBACK_SECONDS = histogram("dash_callback_duration_seconds", "Latency of dashboard callbacks per section.")
+CALLBACK_PAYLOAD = histogram("dash_callback_payload_bytes", "Size of the serialized callback outputs.", PAYLOAD_BUCKETS)
+
+_CURRENT_PROFILE = contextvars.ContextVar('current_profile', default=None)
+
+@contextmanager
+def section(name):
+    """Time a section of the callback being profiled, a no-op when no callback
+    is profiled, so it can be left in code shared with the pipeline and APIs."""
+    sections = _CURRENT_PROFILE.get()
+    if sections is None:
+        yield
+        return
+
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        sections[name] = sections.get(name, 0) + time.perf_counter() - start_time
+
+class CallbackProfiler(object):
+    """
+    Class to time the dashboard callbacks. A profiled callback records its
+    total time, the time of each `section` run inside it, the time to
+    serialize its output to JSON and the size of the serialized output. The
+    last `MAX_SAMPLES` samples are kept per callback to report percentiles.
+    Callbacks slower than the threshold get their cProfile stats dumped, if
+    enabled.
+    """
+
+    def __init__(self, enabled=False, slow_threshold=DEFAULT_SLOW_THRESHOLD, dump_dir=None):
+        """
+        :param enabled: (bool) Profile the callbacks, `profile` is a no-op otherwise.
+        :param slow_threshold: (float) Seconds after which a call is slow.
+        :param dump_dir: (str) Directory to dump the cProfile stats of slow calls
+                         to, calls are not run under cProfile if not given.
+        """
+        self.enabled = enabled
+        self.slow_threshold = slow_threshold
+        self.dump_dir = dump_dir
+        self._samples = dict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls):
+        """Create the profiler from the `callback_profiling` section of the config
+        file, e.g. `{"enabled": true, "slow_threshold": 0.5, "dump_dir": "profiles"}`.
+        """
+        config = get_config().get('callback_profiling') or {}
+        return cls(enabled=bool(config.get('enabled')),
+                   slow_threshold=config.get('slow_threshold', DEFAULT_SLOW_THRESHOLD),
+                   dump_dir=config.get('dump_dir'))
+
+    def profile(self, name):
+        """Decorator to profile a callback, to be placed below `app.callback`."""
+        def decorator(func):
+            if not self.enabled:
+                return func
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                sections = dict()
+                token = _CURRENT_PROFILE.set(sections)
+                profiler = cProfile.Profile() if self.dump_dir else None
+                start_time = time.perf_counter()
+                try:
+                    if profiler:
+                        profiler.enable()
+                    try:
+                        output = func(*args, **kwargs)
+                    finally:
+                        if profiler:
+                            profiler.disable()
+                finally:
+                    _CURRENT_PROFILE.reset(token)
+
+                callback_time = time.perf_counter() - start_time
+                # Dash serializes the output again when sending it, this is only
+                # done to measure the serialization time and payload size.
+                serialize_start_time = time.perf_counter()
+                payload_size = len(to_json_plotly(output))
+                sections['serialize'] = time.perf_counter() - serialize_start_time
+                sections['total'] = callback_time + sections['serialize']
+
+                self.record(name, sections, payload_size)
+                if profiler and sections['total'] >= self.slow_threshold:
+                    self.dump(name, profiler, sections['total'])
+                return output
+            return wrapper
+        return decorator
+
+    def record(self, name, sections, payload_size):
+        for section_name, seconds in sections.items():
+            CALLBACK_SECONDS.observe(seconds, callback=name, section=section_name)
+        CALLBACK_PAYLOAD.observe(payload_size, callback=name)
+
+        with self._lock:
+            samples = self._samples.setdefault(name, deque(maxlen=MAX_SAMPLES))
+            samples.append((sections, payload_size))
+
+    def dump(self, name, profiler, seconds):
+        try:
+            os.makedirs(self.dump_dir, exist_ok=True)
+            path = os.path.join(self.dump_dir, f"{name}-{int(time.time() * 1000)}.prof")
+            profiler.dump_stats(path)
+            log.do_info(f"Callback {name} took {seconds:.2f} seconds, dumped profile to {path}")
+        except OSError as exc:
+            log.do_error(f"Failed to dump profile for callback {name}, error: {exc}")
+
+    def get_stats(self):
+        """Return the percentiles (in milliseconds) of every section, and of the
+        payload size (in bytes), per callback.
+
+        :returns: (dict) Callback name to its `calls`, `sections` and `payload_bytes`.
+        """
+        with self._lock:
+            samples = {name: list(callback_samples) for name, callback_samples in self._samples.items()}
+
+        stats = dict()
+        for name, callback_samples in samples.items():
+            section_times = dict()
+            for sections, _ in callback_samples:
+                for section_name, seconds in sections.items():
+                    section_times.setdefault(section_name, list()).append(seconds * 1000)
+            stats[name] = {
+                'calls': len(callback_samples),
+                'sections': {section_name: get_percentiles(values) for section_name, values in section_times.items()},
+                'payload_bytes': get_percentiles([payload_size for _, payload_size in callback_samples])
+            }
+        return stats
+
+def get_percentiles(values):
+    values = sorted(values)
+    return {f"p{percentile}": round(values[min(len(values) - 1, int(len(values) * percentile / 100))], 3)
+            for percentile in PERCENTILES}
@@ -0,0 +1,271 @@
+#pylint: disable=invalid-name
+# -*- coding: utf-8 -*-
+"""
+.. :module:: query_api
+   :platform: Linux
+   :synopsis: Flask blueprint for a read only JSON API over the
+              `lyophilized` collection.
+
+.. moduleauthor:: Ashwani Agarwal (agarw288@purdue.edu) (October 18, 2026)
+"""
+
+import json
+import base64
+from datetime import (
+    datetime
+)
+from flask import (
+    Blueprint,
+    abort,
+    jsonify,
+    request
+)
+from ui_data import (
+    MongoData
+)
+from cooccurrence import (
+    TOP_PARTNERS,
+    get_cooccurrence_matrix
+)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+DEFAULT_FIELDS = [
+    'application_number',
+    'company',
+    'products',
+    'date',
+    'first_submission_date',
+    'set_ids',
+    'active_ingredients_list',
+    'inactive_ingredients_list'
+]
+ALLOWED_FIELDS = DEFAULT_FIELDS + ['active_ingredients', 'inactive_ingredients', 'active_ingredient_ids',
+                                  'inactive_ingredient_ids', 'lut']
+
+LABEL_INGREDIENT_FIELDS = ['application_number', 'setid', 'role', 'position', 'ingredient_id', 'name', 'code', 'strength']
+ROLES = ['active', 'inactive']
+
+SEARCH_TYPES = {
+    'product': 'product_search',
+    'active': 'active_search',
+    'inactive': 'inactive_search',
+    'company': 'company_search'
+}
+
+MONGO_DATA = MongoData()
+
+query_blueprint = Blueprint('query', __name__, url_prefix='/api')
+
+def encode_cursor(record):
+    """Encode the sort key (first submission date and `_id`) of a record into
+    an opaque cursor string for the next page."""
+    keyset = {'date': record['first_submission_date'].isoformat(), '_id': record['_id']}
+    return base64.urlsafe_b64encode(json.dumps(keyset).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        keyset = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return (datetime.fromisoformat(keyset['date']), keyset['_id'])
+    except Exception:
+        abort(400, "Invalid cursor")
+
+def encode_id_cursor(record):
+    return base64.urlsafe_b64encode(json.dumps({'_id': record['_id']}).encode('utf-8')).decode('ascii')
+
+def decode_id_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))['_id']
+    except Exception:
+        abort(400, "Invalid cursor")
+
+def parse_limit(default=DEFAULT_PAGE_SIZE):
+    try:
+        limit = min(int(request.args.get('limit', default)), MAX_PAGE_SIZE)
+    except ValueError:
+        abort(400, "Invalid limit")
+    if limit <= 0:
+        abort(400, "Invalid limit")
+    return limit
+
+def parse_role():
+    role = request.args.get('role')
+    if role and role not in ROLES:
+        abort(400, f"Invalid role: {role}, expected one of {', '.join(ROLES)}")
+    return role
+
+def get_ingredient_ids(ingredients):
+    """Return the canonical IDs of the ingredients known by the given names or UNII codes,
+    names are stored in lower case and codes in upper case."""
+    names = [ingredient.lower() for ingredient in ingredients] + [ingredient.upper() for ingredient in ingredients]
+    return MONGO_DATA.ingredient_index.get_ids(names)
+
+def parse_date(key):
+    value = request.args.get(key)
+    if not value:
+        return
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        abort(400, f"Invalid {key}: {value}, expected YYYY-MM-DD")
+
+def get_projection():
+    fields = request.args.get('fields')
+    if not fields:
+        return {field: 1 for field in DEFAULT_FIELDS}
+
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+    invalid_fields = set(fields) - set(ALLOWED_FIELDS)
+    if invalid_fields:
+        abort(400, f"Unknown fields: {', '.join(sorted(invalid_fields))}")
+    # `first_submission_date` is always needed to build the cursor for the next page.
+    return {field: 1 for field in fields + ['first_submission_date']}
+
+def serialize_record(record):
+    record = dict(record)
+    if 'date' in record:
+        record['date'] = [date.strftime('%Y-%m-%d') for date in record.get('date', [])]
+    record['first_submission_date'] = record['first_submission_date'].strftime('%Y-%m-%d')
+    return record
+
+def get_drugs_page(search_type=None, value=None):
+    """Return a page of drugs matching the search, as a JSON response. The
+    response carries an ETag so that clients can poll with `If-None-Match`
+    and get a `304 Not Modified` back when nothing changed.
+    """
+    filters = dict()
+    if search_type:
+        filters[SEARCH_TYPES[search_type]] = value
+    for search_arg, search_key in SEARCH_TYPES.items():
+        values = request.args.getlist(search_arg)
+        if values and search_key not in filters:
+            filters[search_key] = values
+
+    query = MONGO_DATA.get_search_query(**filters)
+
+    query.update(MONGO_DATA.get_date_query(parse_date('start_date'), parse_date('end_date')))
+
+    limit = parse_limit()
+
+    after = None
+    if request.args.get('cursor'):
+        after = decode_cursor(request.args.get('cursor'))
+
+    records = MONGO_DATA.lyophilized_db_obj.get_page(query=query, projection=get_projection(),
+                                                     after=after, limit=limit)
+
+    next_cursor = None
+    if len(records) == limit:
+        next_cursor = encode_cursor(records[-1])
+
+    response = jsonify({
+        'data': [serialize_record(record) for record in records],
+        'metadata': {'count': len(records), 'limit': limit, 'next_cursor': next_cursor}
+    })
+    response.add_etag()
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@query_blueprint.route('/drugs', methods=['GET'])
+def get_drugs():
+    """List drugs, optionally filtered with `product`, `active`, `inactive` or
+    `company` query parameters and a `start_date`/`end_date` first submission date range.
+    Use `fields` for a comma separated projection, `limit` for the page size and
+    `cursor` (the `next_cursor` of the previous page) to paginate.
+    """
+    return get_drugs_page()
+
+@query_blueprint.route('/drugs/<search_type>/<path:value>', methods=['GET'])
+def get_drugs_by(search_type, value):
+    """List drugs by `product`, `active` or `inactive` ingredient, or `company`.
+    Supports the same query parameters as `/api/drugs`.
+    """
+    if search_type not in SEARCH_TYPES:
+        abort(404)
+    return get_drugs_page(search_type, value.lower())
+
+@query_blueprint.route('/ingredients/<path:ingredient>/partners', methods=['GET'])
+def get_ingredient_partners(ingredient):
+    """List the ingredients most often present together with the given ingredient
+    in lyophilized drugs, with the number of drugs they are present together in.
+    Use `limit` for the number of partners to return.
+    """
+    limit = parse_limit(default=TOP_PARTNERS)
+    cooccurrence_matrix = get_cooccurrence_matrix()
+    ingredient_index = MONGO_DATA.ingredient_index
+    names = [ingredient_index.get_name(ingredient_id) for ingredient_id in ingredient_index.get_ids([ingredient.lower()])]
+    names = [name for name in names if name in cooccurrence_matrix]
+    if not names:
+        abort(404, f"Unknown ingredient: {ingredient}")
+    ingredient = names[0]
+
+    partners = cooccurrence_matrix.get_top_partners(ingredient, limit=limit)
+    return jsonify({
+        'ingredient': ingredient,
+        'partners': [{'ingredient': partner, 'count': count} for partner, count in partners]
+    })
+
+@query_blueprint.route('/label-ingredients', methods=['GET'])
+def get_label_ingredients():
+    """List the ingredients of the DailyMed labels, one entry per ingredient and
+    label, filtered with `ingredient` (name or UNII code), `role` (`active` or
+    `inactive`), `strength` (as listed on the label) and `application_number`
+    query parameters. `ingredient` and `application_number` can be repeated.
+    Use `limit` for the page size and `cursor` to paginate.
+    """
+    query = dict()
+    ingredients = request.args.getlist('ingredient')
+    if ingredients:
+        query['ingredient_id'] = {'$in': get_ingredient_ids(ingredients)}
+    role = parse_role()
+    if role:
+        query['role'] = role
+    if 'strength' in request.args:
+        query['strength'] = request.args.get('strength')
+    application_numbers = request.args.getlist('application_number')
+    if application_numbers:
+        query['application_number'] = {'$in': [number.upper() for number in application_numbers]}
+    if not query:
+        abort(400, "Give at least one of ingredient, role, strength or application_number")
+
+    limit = parse_limit()
+    after = None
+    if request.args.get('cursor'):
+        after = decode_id_cursor(request.args.get('cursor'))
+
+    records = MONGO_DATA.label_ingredients_db_obj.get_page(query=query, after=after, limit=limit,
+                                                           projection={field: 1 for field in LABEL_INGREDIENT_FIELDS})
+
+    next_cursor = None
+    if len(records) == limit:
+        next_cursor = encode_id_cursor(records[-1])
+
+    response = jsonify({
+        'data': [{field: record.get(field) for field in LABEL_INGREDIENT_FIELDS} for record in records],
+        'metadata': {'count': len(records), 'limit': limit, 'next_cursor': next_cursor}
+    })
+    response.add_etag()
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@query_blueprint.route('/ingredients/<path:ingredient>/co-ingredients', methods=['GET'])
+def get_co_ingredients(ingredient):
+    """List the ingredients listed on the same DailyMed labels as the given ingredient,
+    with the number of drugs they are listed together in. Unlike `partners`, the
+    ingredients have to be on the same label, and can be narrowed to a `role`, e.g.
+    the excipients used with an active ingredient. Use `limit` for the number of
+    co-ingredients to return.
+    """
+    limit = parse_limit(default=TOP_PARTNERS)
+    role = parse_role()
+    ingredient_ids = get_ingredient_ids([ingredient])
+
+    ingredient_index = MONGO_DATA.ingredient_index
+    co_ingredients = MONGO_DATA.label_ingredients_db_obj.get_co_ingredients(ingredient_ids, role=role, limit=limit)
+    return jsonify({
+        'ingredient': ingredient_index.get_name(ingredient_ids[0]) if ingredient_ids else ingredient,
+        'co_ingredients': [{'ingredient': ingredient_index.get_name(row.get('ingredient_id')),
+                            'ingredient_id': row.get('ingredient_id'),
+                            'count': row.get('count')} for row in co_ingredients]
+    })
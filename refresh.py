@@ -0,0 +1,196 @@
+#pylint: disable=invalid-name
+# -*- coding: utf-8 -*-
+"""
+.. :module:: refresh
+   :platform: Linux
+   :synopsis: Module to refresh a few drugs, given by application number or
+              SPL set ID, without running the whole backend pipeline.
+
+.. moduleauthor:: Ashwani Agarwal (agarw288@purdue.edu) (October 18, 2026)
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import argparse
+import logger as log
+from collections import (
+    Counter
+)
+from connection import (
+    RequestWrapper
+)
+from cooccurrence import (
+    update_pair_counts
+)
+from dailymed import (
+    DailyMed
+)
+from database import (
+    IngredientsCollection,
+    LocksCollection,
+    LyophilizedCollection,
+    get_config
+)
+
+MAX_REFRESH_RECORDS = 100
+
+# Locks in the `locks` collection, shared with the scheduler. A refresh holds the
+# locks of the pipeline stages rewriting the drugs it writes, and of its drugs,
+# so that the co-occurrence counts are never updated twice for the same change.
+LOCK_TTL = 6 * 60 * 60
+STAGE_LOCK_NAME = "stage:{}"
+REFRESH_LOCK_NAME = "refresh:{}"
+REFRESH_LOCKED_STAGES = ['mark_lyophilized', 'get_ingredients', 'create_db_indexes']
+
+class RefreshLockedError(Exception):
+    """Raised when the locks of a refresh are held by a backend run or another refresh."""
+
+# Fields of a lyophilized record shown by the dashboard, the values of these
+# fields before and after the refresh are the cache entries to update.
+CHANGED_FIELDS = {
+    'active': 'active_ingredient_ids',
+    'inactive': 'inactive_ingredient_ids',
+    'company': 'company',
+    'products': 'products'
+}
+
+def get_record_ids(application_numbers=None, setids=None):
+    """Return the `_id` of the drugs with the given application numbers, or with
+    a DailyMed label with one of the given set IDs.
+
+    :param application_numbers: (list) Application numbers, e.g. `NDA012345`.
+    :param setids: (list) SPL set IDs.
+    :returns: (list) `_id` of the records in the `ingredients` collection.
+    """
+    search_queries = list()
+    if application_numbers:
+        search_queries.append({'application_number': {'$in': list(application_numbers)}})
+    for setid in setids or []:
+        search_queries.append({f"set_ids.{setid}": {'$exists': 1}})
+
+    if not search_queries:
+        return list()
+
+    records = IngredientsCollection().get_records(query={'$or': search_queries})
+    return [record.get('_id') for record in records]
+
+def get_changed_values(records):
+    """Return the values of the dashboard fields of the given records.
+
+    :param records: (list) Lyophilized records, before and after the refresh.
+    :returns: (dict) Entity type (`active`, `inactive`, `company` or `products`) to the set of values.
+    """
+    changed_values = {entity_type: set() for entity_type in CHANGED_FIELDS}
+    for record in records:
+        for entity_type, key in CHANGED_FIELDS.items():
+            value = record.get(key)
+            if isinstance(value, list):
+                changed_values[entity_type].update(item for item in value if item)
+            elif value:
+                changed_values[entity_type].add(value)
+
+    return changed_values
+
+def get_ingredient_ids(record):
+    """Return the canonical IDs of the active and inactive ingredients of a lyophilized record."""
+    return (record.get(CHANGED_FIELDS['active']) or []) + (record.get(CHANGED_FIELDS['inactive']) or [])
+
+def refresh_drugs(application_numbers=None, setids=None, rate_limiter=None):
+    """Refresh the given drugs: resolve their set IDs again, fetch their SPL
+    documents and update the `ingredients` and `lyophilized` collections.
+
+    :param application_numbers: (list) Application numbers, e.g. `NDA012345`.
+    :param setids: (list) SPL set IDs.
+    :param rate_limiter: (RateLimiter) Budget for the DailyMed requests.
+    :returns: (dict) Dict with the refreshed `application_numbers`, the `record_ids` of
+              the drugs, the `changed` dashboard values of the drugs (see `get_changed_values`)
+              and the change in the ingredient `pair_counts`, None if no drug matches.
+    """
+    start_time = time.time()
+    record_ids = get_record_ids(application_numbers, setids)
+    if not record_ids:
+        log.do_error(f"No drugs found to refresh for application numbers: {application_numbers}, setids: {setids}")
+        return
+    if len(record_ids) > MAX_REFRESH_RECORDS:
+        raise ValueError(f"Refresh of {len(record_ids)} drugs requested, at most {MAX_REFRESH_RECORDS} "
+                         f"can be refreshed at once, run the backend pipeline instead.")
+
+    query = {'_id': {'$in': record_ids}}
+    projection = dict({key: 1 for key in CHANGED_FIELDS.values()}, application_number=1)
+    lyophilized_db_obj = LyophilizedCollection()
+    records_before = list(lyophilized_db_obj.get_records(query=query, projection=projection))
+
+    dailymed_obj = DailyMed(rate_limiter)
+    dailymed_obj.update_drugs_setids_to_db(query=query, force=True, bulk=False)
+    spl_ingredients = dailymed_obj.classify_lyophilized_from_spl(query=query, force=True)
+    dailymed_obj.insert_drugs_to_lyophilized_coll(query=query)
+    dailymed_obj.update_ingredients_to_db(query=query, spl_ingredients=spl_ingredients)
+
+    records_after = list(lyophilized_db_obj.get_records(query=query, projection=projection))
+    refreshed_numbers = sorted({record.get('application_number') for record in records_before + records_after
+                                if record.get('application_number')})
+    log.do_info(f"Refreshed {len(record_ids)} drugs in {time.time() - start_time:.1f} seconds, "
+                f"lyophilized: {refreshed_numbers}")
+
+    pair_counts = Counter()
+    ingredients_before = {record.get('_id'): get_ingredient_ids(record) for record in records_before}
+    for record in records_after:
+        update_pair_counts(pair_counts, ingredients_before.pop(record.get('_id'), []), get_ingredient_ids(record))
+    for ingredients in ingredients_before.values():
+        update_pair_counts(pair_counts, ingredients, [])
+
+    return {
+        'application_numbers': refreshed_numbers,
+        'record_ids': record_ids,
+        'changed': get_changed_values(records_before + records_after),
+        'pair_counts': pair_counts
+    }
+
+def refresh_drugs_locked(application_numbers=None, setids=None, rate_limiter=None, owner=None):
+    """Run `refresh_drugs` holding the locks of the pipeline stages and of the drugs
+    to refresh (see `REFRESH_LOCKED_STAGES`).
+
+    :param owner: (str) Unique name of the run holding the locks, generated if not given.
+    :returns: (dict) Same as `refresh_drugs`.
+    :raises RefreshLockedError: If any of the locks is held elsewhere.
+    """
+    owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+    lock_names = [STAGE_LOCK_NAME.format(stage) for stage in REFRESH_LOCKED_STAGES] + \
+                 [REFRESH_LOCK_NAME.format(record_id) for record_id in get_record_ids(application_numbers, setids)]
+    with LocksCollection().hold(lock_names, owner, LOCK_TTL) as held:
+        if not held:
+            raise RefreshLockedError("A backend run or another refresh holds the locks of the refresh")
+        return refresh_drugs(application_numbers, setids, rate_limiter)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh a few drugs from DailyMed.")
+    parser.add_argument('application_numbers', nargs='*', metavar='APPLICATION_NUMBER',
+                        help="Application numbers of the drugs to refresh, e.g. NDA012345.")
+    parser.add_argument('--setid', dest='setids', action='append', default=[],
+                        help="SPL set ID of a label of a drug to refresh, can be repeated.")
+    parser.add_argument('--dashboard-url', metavar='URL',
+                        help="Queue the refresh on a running dashboard (e.g. http://localhost:8050), "
+                             "so that its caches are updated for the refreshed drugs. The dashboard must "
+                             "have the `refresh_api` enabled in its config file.")
+    args = parser.parse_args()
+    if not (args.application_numbers or args.setids):
+        parser.error("Give at least one application number or --setid.")
+
+    if args.dashboard_url:
+        headers = {'Content-Type': 'application/json'}
+        token = (get_config().get('refresh_api') or {}).get('token')
+        if token:
+            headers['Authorization'] = f"Bearer {token}"
+        response = RequestWrapper().make_request('post', f"{args.dashboard_url.rstrip('/')}/api/refresh",
+                                                 headers=headers,
+                                                 data=json.dumps({'application_numbers': args.application_numbers,
+                                                                  'setids': args.setids}))
+        log.do_info(f"Dashboard refresh response: {response.text}")
+    else:
+        try:
+            refresh_drugs_locked(args.application_numbers, args.setids)
+        except RefreshLockedError as exc:
+            log.do_error(f"{exc}, try again later.")
@@ -1,3 +1,4 @@
+import argparse
 import logger as log
 from fda_drugs import (
     DrugsMeta
@@ -5,6 +6,31 @@ from fda_drugs import (
 from dailymed import (
     DailyMed
 )
+from database import (
+    DatabaseConnection,
+    LabelIngredientsCollection,
+    LyophilizedCollection,
+    RefreshJobsCollection,
+    get_config
+)
+from ingredient_index import (
+    IngredientIndex,
+    rebuild_ingredient_index
+)
+from label_ingredients import (
+    rebuild_label_ingredients
+)
+from metrics import (
+    DEFAULT_METRICS_PORT,
+    start_metrics_server,
+    track_stage,
+    write_run_summary
+)
+from spl_archive import (
+    ingest_spl_archives
+)
+
+RUN_SUMMARY_FILE = "run_summary.json"
 
 def fetch_fda_drugs():
     try:
@@ -14,31 +40,105 @@ def fetch_fda_drugs():
         log.do_error(f"Error while fetching drugs from FDA drugs portal, stopping execution!")
         raise exc
 
-def mark_lyophilized_drugs_in_db():
+def mark_lyophilized_drugs_in_db(query=None, rate_limiter=None, spl_listing=False):
+    """Tag the lyophilized drugs.
+
+    :param spl_listing: (bool) Resolve the labels of the drugs from the DailyMed SPL listing
+                        and openFDA, see `DailyMed.update_drugs_setids_to_db`.
+    :returns: (dict) SPL set ID to the ingredients info already parsed while tagging,
+              see `DailyMed.classify_lyophilized_from_spl`.
+    """
     try:
-        dailymed_obj = DailyMed()
-        dailymed_obj.update_drugs_setids_to_db()
-        dailymed_obj.insert_drugs_to_lyophilized_coll()
-        dailymed_obj.compare_dailymed_data_from_db()
+        dailymed_obj = DailyMed(rate_limiter)
+        dailymed_obj.update_drugs_setids_to_db(query=query, bulk=spl_listing)
+        spl_ingredients = dailymed_obj.classify_lyophilized_from_spl(query=query)
+        dailymed_obj.insert_drugs_to_lyophilized_coll(query=query)
     except Exception as exc:
         log.do_error(f"Exception while updating lyophilized tags for drugs in mongo collections, stopping execution!")
         raise exc
+    return spl_ingredients
 
-def get_ingredients_for_lyophilized():
+def get_ingredients_for_lyophilized(query=None, rate_limiter=None, spl_ingredients=None):
     try:
-        dailymed_obj = DailyMed()
-        dailymed_obj.update_ingredients_to_db()
+        dailymed_obj = DailyMed(rate_limiter)
+        dailymed_obj.update_ingredients_to_db(query=query, spl_ingredients=spl_ingredients)
     except Exception as exc:
         log.do_error(f"Failed to fetch ingredients for lyophilized drugs, stopping execution!")
         raise exc
 
-def run_backend():
-    fetch_fda_drugs()
-    mark_lyophilized_drugs_in_db()
-    get_ingredients_for_lyophilized()
+def ingest_spl_archives_to_db(spl_archives, update=False, processes=None):
+    try:
+        ingest_spl_archives(spl_archives, update=update, processes=processes)
+    except Exception as exc:
+        log.do_error(f"Failed to ingest DailyMed release archives, stopping execution!")
+        raise exc
+
+def backfill_label_ingredients():
+    """Backfill the `label_ingredients` collection from the ingredients stored in the
+    `lyophilized` collection if it is empty, e.g. on a database written before it
+    existed. The ingredient index is backfilled first if it is empty too.
+    """
+    if not LabelIngredientsCollection().is_empty():
+        return
+    if not len(IngredientIndex.from_db()):
+        rebuild_ingredient_index()
+    rebuild_label_ingredients()
+
+def create_db_indexes():
+    try:
+        lyophilized_db_obj = LyophilizedCollection()
+        result = lyophilized_db_obj.update_first_submission_dates()
+        log.do_info(f"Backfilled first submission date of {result.modified_count} lyophilized records.")
+        lyophilized_db_obj.create_indexes()
+        backfill_label_ingredients()
+        LabelIngredientsCollection().create_indexes()
+        RefreshJobsCollection().create_indexes()
+    except Exception as exc:
+        log.do_error(f"Failed to create indexes on lyophilized and label ingredients collections, error: {exc}")
+        raise exc
+
+def run_backend(spl_archives=None, update=False, processes=None, spl_listing=False):
+    """Run the backend pipeline. The labels of the drugs are fetched from DailyMed,
+    or read from the given DailyMed SPL release archives.
+
+    :param spl_archives: (list) Paths of DailyMed SPL release archives.
+    :param update: (bool) The archives are monthly updates, not a full release.
+    :param processes: (int) Number of processes parsing the archives.
+    :param spl_listing: (bool) Resolve the labels of the drugs from the DailyMed SPL listing.
+    """
+    try:
+        with track_stage('fetch_fda_drugs'):
+            fetch_fda_drugs()
+        if spl_archives:
+            with track_stage('ingest_spl_archives'):
+                ingest_spl_archives_to_db(spl_archives, update=update, processes=processes)
+        else:
+            with track_stage('mark_lyophilized'):
+                spl_ingredients = mark_lyophilized_drugs_in_db(spl_listing=spl_listing)
+            with track_stage('get_ingredients'):
+                get_ingredients_for_lyophilized(spl_ingredients=spl_ingredients)
+        with track_stage('create_db_indexes'):
+            create_db_indexes()
+    finally:
+        write_run_summary(RUN_SUMMARY_FILE)
 
 if __name__ == "__main__":
-    run_backend()
+    parser = argparse.ArgumentParser(description="Run the backend pipeline.")
+    parser.add_argument('--spl-archive', dest='spl_archives', action='append', default=[], metavar='PATH',
+                        help="DailyMed SPL release archive to read the labels from instead of the DailyMed API, "
+                             "can be repeated (e.g. for the parts of a full release).")
+    parser.add_argument('--update', action='store_true',
+                        help="The release archives are monthly updates, only the drugs with labels in them are updated.")
+    parser.add_argument('--processes', type=int, help="Number of processes parsing the release archives.")
+    parser.add_argument('--spl-listing', action='store_true',
+                        help="Resolve the labels of the drugs from the whole DailyMed SPL listing and openFDA, "
+                             "with fewer requests, instead of looking up every drug. Labels openFDA does not "
+                             "list yet are missed.")
+    args = parser.parse_args()
+
+    DatabaseConnection().set_profile('ingest')
+    start_metrics_server(get_config().get('metrics_port') or DEFAULT_METRICS_PORT)
+    run_backend(args.spl_archives, update=args.update, processes=args.processes, spl_listing=args.spl_listing)
 
 
     
\ No newline at end of file
@@ -0,0 +1,265 @@
+#pylint: disable=invalid-name
+# -*- coding: utf-8 -*-
+"""
+.. :module:: scheduler
+   :platform: Linux
+   :synopsis: Background scheduler running the backend pipeline stages on
+              configurable intervals, with per-stage concurrency limits
+              and request rate budgets.
+
+.. moduleauthor:: Ashwani Agarwal (agarw288@purdue.edu) (October 18, 2026)
+"""
+
+import os
+import time
+import uuid
+import socket
+import argparse
+import threading
+import logger as log
+from concurrent.futures import (
+    ThreadPoolExecutor
+)
+from connection import (
+    RateLimiter
+)
+from database import (
+    DatabaseConnection,
+    LocksCollection,
+    get_config
+)
+from metrics import (
+    DEFAULT_METRICS_PORT,
+    start_metrics_server,
+    track_stage
+)
+from refresh import (
+    LOCK_TTL,
+    STAGE_LOCK_NAME,
+    RefreshLockedError,
+    refresh_drugs_locked
+)
+from run import (
+    create_db_indexes,
+    fetch_fda_drugs,
+    get_ingredients_for_lyophilized,
+    mark_lyophilized_drugs_in_db
+)
+
+SCHEDULER_TICK = 5
+MAX_WORKERS = 4
+# Seconds before stages not run in a cycle, because a stage before them failed
+# or was running elsewhere, are tried again.
+RETRY_DELAY = 10 * 60
+
+# Stage settings, can be overridden per stage from the `scheduler` section of
+# the config file. `interval` is in seconds, `concurrency` is the number of
+# runs of the stage allowed at once in this process and `rate_limit` the
+# number of DailyMed requests per second allowed for the stage. The stages
+# depend on each other and are run in this order, like in `run.run_backend`.
+DEFAULT_STAGES = {
+    'fetch_fda_drugs': {'interval': 24 * 60 * 60, 'concurrency': 1, 'rate_limit': None},
+    'mark_lyophilized': {'interval': 24 * 60 * 60, 'concurrency': 1, 'rate_limit': 5},
+    'get_ingredients': {'interval': 12 * 60 * 60, 'concurrency': 1, 'rate_limit': 5},
+    'create_db_indexes': {'interval': 24 * 60 * 60, 'concurrency': 1, 'rate_limit': None}
+}
+
+# Stage functions, called with the query and rate limiter of the run and a dict
+# shared by the stages of a cycle, e.g. to hand the SPLs parsed while tagging the
+# lyophilized drugs over to `get_ingredients`, like `run.run_backend` does.
+STAGE_FUNCTIONS = {
+    'fetch_fda_drugs': lambda query, rate_limiter, cycle: fetch_fda_drugs(),
+    'mark_lyophilized': lambda query, rate_limiter, cycle: cycle.update(
+                            spl_ingredients=mark_lyophilized_drugs_in_db(query, rate_limiter)),
+    'get_ingredients': lambda query, rate_limiter, cycle: get_ingredients_for_lyophilized(
+                            query, rate_limiter, spl_ingredients=cycle.get('spl_ingredients')),
+    'create_db_indexes': lambda query, rate_limiter, cycle: create_db_indexes()
+}
+
+class Stage(object):
+    """
+    Class to hold the schedule and limits of a pipeline stage.
+    """
+
+    def __init__(self, name, interval, concurrency=1, rate_limit=None):
+        """
+        :param name: (str) Name of the stage, one of `STAGE_FUNCTIONS`.
+        :param interval: (int) Number of seconds between scheduled runs.
+        :param concurrency: (int) Number of runs allowed at once.
+        :param rate_limit: (float) DailyMed requests per second allowed for the stage.
+        """
+        self.name = name
+        self.function = STAGE_FUNCTIONS[name]
+        self.interval = interval
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.next_run = time.time()
+
+class Scheduler(object):
+    """
+    Class to run the pipeline stages in a background thread. Every cycle, the
+    stages whose interval elapsed are run one after the other, in the order of
+    `DEFAULT_STAGES`, so that a stage only runs once the stages before it are
+    done. A stage (or an application refresh) is never run twice at the same
+    time, neither within this process, where the stage concurrency limit
+    applies, nor across processes, where it is guarded by a lock in the
+    `locks` collection.
+    """
+
+    def __init__(self, stages_config=None):
+        """
+        :param stages_config: (dict) Stage settings overriding `DEFAULT_STAGES`,
+                              read from the config file when not given.
+        """
+        if stages_config is None:
+            stages_config = get_config().get('scheduler', {})
+
+        self.stages = dict()
+        for name, settings in DEFAULT_STAGES.items():
+            settings = dict(settings, **stages_config.get(name, {}))
+            self.stages[name] = Stage(name, **settings)
+
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._locks_db_obj = None
+        self._executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+        self._cycle_lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    @property
+    def locks_db_obj(self):
+        if not self._locks_db_obj:
+            self._locks_db_obj = LocksCollection()
+        return self._locks_db_obj
+
+    def _run_locked(self, lock_name, function):
+        """Run the function while holding the lock, extending the lock until
+        the function returns so that long runs do not lose it.
+
+        :returns: (bool) True if the function ran, False if the lock is held elsewhere.
+        """
+        with self.locks_db_obj.hold([lock_name], self.get_run_owner(), LOCK_TTL) as held:
+            if not held:
+                log.do_info(f"Lock {lock_name} is held by another run, skipping run.")
+                return False
+            function()
+        return True
+
+    def get_run_owner(self):
+        """Return the owner of a single run, so that two runs of this process do not share a lock."""
+        return f"{self.owner}:{uuid.uuid4().hex}"
+
+    def _run_tracked(self, stage, query, cycle):
+        with track_stage(stage.name):
+            stage.function(query, stage.rate_limiter, cycle)
+
+    def run_stage(self, name, query=None, cycle=None):
+        """Run a stage, unless the stage concurrency limit is reached.
+
+        :param name: (str) Name of the stage.
+        :param query: (dict) Query restricting the records the stage runs on.
+        :param cycle: (dict) Results shared with the other stages of the cycle, see `STAGE_FUNCTIONS`.
+        :returns: (bool) True if the stage ran, False if it was skipped.
+        """
+        if cycle is None:
+            cycle = dict()
+        stage = self.stages[name]
+        if not stage.semaphore.acquire(blocking=False):
+            log.do_info(f"Stage {name} is already running, skipping run.")
+            return False
+
+        try:
+            lock_name = STAGE_LOCK_NAME.format(name) if not query else \
+                        STAGE_LOCK_NAME.format(f"{name}:{sorted(query.items())}")
+            start_time = time.time()
+            ran = self._run_locked(lock_name, lambda: self._run_tracked(stage, query, cycle))
+            if ran:
+                log.do_info(f"Stage {name} finished in {time.time() - start_time:.1f} seconds.")
+            return ran
+        except Exception as exc:
+            log.do_error(f"Stage {name} failed, error: {exc}")
+            return False
+        finally:
+            stage.semaphore.release()
+
+    def refresh_application(self, application_number):
+        """Refresh the records of a single application, i.e. resolve its set-ids,
+        lyophilized tag and ingredients again, within the DailyMed request
+        budget of the `get_ingredients` stage.
+
+        :param application_number: (str) Application number, e.g. `NDA012345`.
+        :returns: (bool) True if the application was refreshed.
+        """
+        rate_limiter = self.stages['get_ingredients'].rate_limiter
+        try:
+            refresh_drugs_locked([application_number], rate_limiter=rate_limiter, owner=self.get_run_owner())
+            return True
+        except RefreshLockedError as exc:
+            log.do_info(f"Refresh of {application_number} skipped, {exc}.")
+            return False
+        except Exception as exc:
+            log.do_error(f"Refresh of {application_number} failed, error: {exc}")
+            return False
+
+    def request_refresh(self, application_number):
+        """Queue a refresh of a single application in the background.
+
+        :returns: (Future) Future resolving to the result of `refresh_application`.
+        """
+        return self._executor.submit(self.refresh_application, application_number)
+
+    def run_cycle(self):
+        """Run the stages whose interval elapsed, one after the other. The cycle stops
+        at the first stage which fails or is skipped, the stages left are tried again
+        after `RETRY_DELAY`.
+
+        :returns: (bool) False if a cycle is already running, True otherwise.
+        """
+        if not self._cycle_lock.acquire(blocking=False):
+            return False
+
+        try:
+            due_stages = [stage for stage in self.stages.values() if stage.next_run <= time.time()]
+            cycle = dict()
+            for index, stage in enumerate(due_stages):
+                stage.next_run = time.time() + stage.interval
+                if not self.run_stage(stage.name, cycle=cycle):
+                    for stage_left in due_stages[index:]:
+                        stage_left.next_run = time.time() + RETRY_DELAY
+                    log.do_error(f"Stage {stage.name} did not complete, stages left in the cycle are retried "
+                                 f"in {RETRY_DELAY} seconds: {', '.join(stage_left.name for stage_left in due_stages[index:])}")
+                    break
+        finally:
+            self._cycle_lock.release()
+        return True
+
+    def start(self):
+        """Run the stages on their intervals until `stop` is called."""
+        log.do_info(f"Starting scheduler for stages: {', '.join(self.stages)}")
+        while not self._stop_event.is_set():
+            now = time.time()
+            if not self._cycle_lock.locked() and any(stage.next_run <= now for stage in self.stages.values()):
+                self._executor.submit(self.run_cycle)
+            self._stop_event.wait(SCHEDULER_TICK)
+
+    def stop(self):
+        self._stop_event.set()
+        self._executor.shutdown(wait=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the backend pipeline stages on a schedule.")
+    parser.add_argument('--refresh', metavar='APPLICATION_NUMBER',
+                        help="Refresh a single application and exit.")
+    args = parser.parse_args()
+
+    DatabaseConnection().set_profile('ingest')
+    start_metrics_server(get_config().get('metrics_port') or DEFAULT_METRICS_PORT)
+    scheduler = Scheduler()
+    try:
+        if args.refresh:
+            scheduler.refresh_application(args.refresh)
+        else:
+            scheduler.start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.stop()
@@ -0,0 +1,127 @@
+#pylint: disable=invalid-name
+# -*- coding: utf-8 -*-
+"""
+.. :module:: search_index
+   :platform: Linux
+   :synopsis: Module for prefix and fuzzy search over products and
+              ingredients for the search-as-you-type dropdowns.
+
+.. moduleauthor:: Ashwani Agarwal (agarw288@purdue.edu) (October 18, 2026)
+"""
+
+import bisect
+import difflib
+from string_table import (
+    get_string_table
+)
+
+TOP_K = 50
+FUZZY_CUTOFF = 0.75
+
+class SearchIndex(object):
+    """
+    Class to search through a list of values (products or ingredients) by
+    prefix, with substring and fuzzy matching as fallbacks. Values are kept
+    in a sorted array so that a prefix lookup is a binary search followed by
+    a scan of the matching values only. Values are interned in the shared
+    string table, and a value already in lower case is its own key.
+    """
+
+    def __init__(self, values):
+        self._values = dict()
+        for value in values:
+            if value:
+                value = get_string_table().intern(str(value))
+                self._values.setdefault(get_key(value), value)
+        self._keys = sorted(self._values)
+
+    def add(self, values):
+        """Add new values to the index, values already present are skipped."""
+        for value in values:
+            if value and str(value).lower() not in self._values:
+                value = get_string_table().intern(str(value))
+                key = get_key(value)
+                self._values[key] = value
+                bisect.insort(self._keys, key)
+
+    def remove(self, values):
+        """Remove values from the index, values not present are skipped."""
+        for value in values:
+            key = str(value).lower() if value else None
+            if key in self._values:
+                del self._values[key]
+                del self._keys[bisect.bisect_left(self._keys, key)]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def prefix_search(self, query, limit=TOP_K):
+        """Return the values which start with the given query.
+
+        :param query: (str) Text typed by the user, matched case insensitively.
+        :param limit: (int) Maximum number of values to return.
+        :returns: (list) Matching values in sorted order.
+        """
+        query = query.lower()
+        matches = list()
+        index = bisect.bisect_left(self._keys, query)
+        while index < len(self._keys) and len(matches) < limit:
+            key = self._keys[index]
+            if not key.startswith(query):
+                break
+            matches.append(self._values[key])
+            index += 1
+
+        return matches
+
+    def search(self, query, limit=TOP_K):
+        """Return the top matches for the given query. Prefix matches come first,
+        followed by values containing the query, and if nothing matches, the
+        values closest to the query (to allow for typos).
+
+        :param query: (str) Text typed by the user.
+        :param limit: (int) Maximum number of values to return.
+        :returns: (list) Matching values.
+        """
+        if not query:
+            return [self._values[key] for key in self._keys[:limit]]
+
+        query = query.lower().strip()
+        matches = self.prefix_search(query, limit)
+        if len(matches) < limit:
+            found = set(matches)
+            for key in self._keys:
+                if query in key and self._values[key] not in found:
+                    matches.append(self._values[key])
+                    if len(matches) >= limit:
+                        break
+
+        if not matches:
+            close_matches = difflib.get_close_matches(query, self._keys, n=limit, cutoff=FUZZY_CUTOFF)
+            matches = [self._values[key] for key in close_matches]
+
+        return matches
+
+    def get_options(self, query, selected=None, limit=TOP_K):
+        """Return dropdown options for the given query. Currently selected values
+        are always part of the options, otherwise the dropdown drops them.
+
+        :param query: (str) Text typed by the user.
+        :param selected: (str/list) Value(s) currently selected in the dropdown.
+        :param limit: (int) Maximum number of matches to return.
+        :returns: (list) List of `label`, `value` dicts.
+        """
+        if selected and not isinstance(selected, list):
+            selected = [selected]
+
+        values = list(selected or [])
+        for value in self.search(query, limit):
+            if value not in values:
+                values.append(value)
+
+        return [{'label': value, 'value': value} for value in values]
+
+def get_key(value):
+    """Return the lower case search key of a value, the value itself if already lower case."""
+    key = value.lower()
+    return value if key == value else key
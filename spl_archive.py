@@ -0,0 +1,321 @@
+#pylint: disable=invalid-name
+# -*- coding: utf-8 -*-
+"""
+.. :module:: spl_archive
+   :platform: Linux
+   :synopsis: Module for ingesting the drugs' labels from locally downloaded
+              DailyMed SPL release archives (full releases and monthly
+              updates), instead of fetching every SPL from the DailyMed API.
+
+              The archives are zips of one zip per SPL, holding the SPL XML
+              and its images. The SPL zips are read in memory, one at a time,
+              and parsed in parallel by a pool of processes. Only the labels of
+              the lyophilized drugs are parsed again for their ingredients.
+
+.. moduleauthor:: Ashwani Agarwal (agarw288@purdue.edu) (October 18, 2026)
+"""
+
+import io
+import json
+import time
+import zipfile
+import xmltodict
+import logger as log
+from collections import (
+    defaultdict
+)
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    as_completed
+)
+from dailymed import (
+    DAILYMED_WEBPAGE_URL,
+    LYOPHILIZED,
+    DailyMed
+)
+from metrics import (
+    SPL_PARSE_SECONDS,
+    count_records
+)
+from spl_classifier import (
+    get_text,
+    iter_sections,
+    sanitize_list
+)
+
+# Root of the ids of the FDA applications (NDA, ANDA or BLA) products are approved under.
+APPLICATION_NUMBER_ROOT = "2.16.840.1.113883.3.150"
+MEMBERS_PER_TASK = 64
+RECORDS_PER_WRITE = 5000
+
+# Archives opened and DailyMed object of a worker process.
+_ARCHIVES = dict()
+_DAILYMED_OBJ = None
+
+def get_spl_members(archive):
+    """Return the names of the SPLs in a release archive, the SPL zips, or the SPL
+    XML files if the archive holds them directly."""
+    return [name for name in archive.namelist() if name.lower().endswith(('.zip', '.xml'))]
+
+def read_spl_member(archive, name):
+    """Return the SPL XML of a member of a release archive, None if there is none.
+    A nested zip is read in memory, only its XML file is decompressed.
+
+    :param archive: (ZipFile) The release archive.
+    :param name: (str) Name of the member, a SPL zip or XML file.
+    """
+    if name.lower().endswith('.xml'):
+        return archive.read(name)
+
+    with zipfile.ZipFile(io.BytesIO(archive.read(name))) as spl_zip:
+        xml_names = [xml_name for xml_name in spl_zip.namelist() if xml_name.lower().endswith('.xml')]
+        if not xml_names:
+            return
+        return spl_zip.read(xml_names[0])
+
+def get_application_numbers(document):
+    """Return the application numbers (e.g. `NDA012345`) the products of a SPL are
+    approved under.
+
+    :param document: (dict) The `document` element of the SPL, as parsed by xmltodict.
+    """
+    application_numbers = set()
+    components = ((document.get('component') or {}).get('structuredBody') or {}).get('component')
+    for section in iter_sections(components):
+        for subject in sanitize_list(section.get('subject')):
+            product = (subject or {}).get('manufacturedProduct') or {}
+            for subject_of in sanitize_list(product.get('subjectOf')):
+                for approval_id in sanitize_list(((subject_of or {}).get('approval') or {}).get('id')):
+                    if (approval_id or {}).get('@root') == APPLICATION_NUMBER_ROOT and approval_id.get('@extension'):
+                        application_numbers.add(approval_id.get('@extension').strip().upper())
+    return sorted(application_numbers)
+
+def parse_spl(content):
+    """Parse a SPL XML document.
+
+    :param content: (bytes) The SPL XML.
+    :returns spl: (dict) Set ID, version, effective time, title (lowercase) and
+                  application numbers of the SPL, and its ingredients info
+                  (see `DailyMed.get_ingredients`).
+    """
+    global _DAILYMED_OBJ
+    if _DAILYMED_OBJ is None:
+        _DAILYMED_OBJ = DailyMed()
+
+    response_json = json.loads(json.dumps(xmltodict.parse(content)))
+    document = response_json.get('document') or {}
+    setid = (document.get('setId') or {}).get('@root')
+    try:
+        version = int((document.get('versionNumber') or {}).get('@value') or 0)
+    except ValueError:
+        version = 0
+
+    return {
+        'setid': setid,
+        'version': version,
+        'effective_time': (document.get('effectiveTime') or {}).get('@value') or "",
+        'title': " ".join(get_text(document.get('title')).split()).lower(),
+        'application_numbers': get_application_numbers(document),
+        'ingredients': _DAILYMED_OBJ.get_ingredients_from_spl(response_json, setid)
+    }
+
+def parse_spl_members(path, names, ingredients=True):
+    """Parse the given SPLs of a release archive, runs in the worker processes.
+
+    :param path: (str) Path of the release archive.
+    :param names: (list) Names of the SPL members to parse.
+    :param ingredients: (bool) Return the ingredients of the SPLs, otherwise only their
+                        `lyophilized_sources` are kept.
+    :returns spls: (list) The parsed SPLs (see `parse_spl`) with their `member` name and
+                   parse time, the SPLs which failed to parse are logged and left out.
+    """
+    archive = _ARCHIVES.get(path)
+    if archive is None:
+        archive = _ARCHIVES[path] = zipfile.ZipFile(path)
+
+    spls = list()
+    for name in names:
+        try:
+            content = read_spl_member(archive, name)
+            if not content:
+                continue
+            parse_start_time = time.perf_counter()
+            spl = parse_spl(content)
+            spl['parse_seconds'] = time.perf_counter() - parse_start_time
+            spl['member'] = name
+            if not ingredients:
+                spl['ingredients'] = {'lyophilized_sources': spl['ingredients'].get('lyophilized_sources') or []}
+        except Exception as exc:
+            log.do_error(f"Failed to parse SPL {name} of {path}, error: {exc}")
+            continue
+        if spl.get('setid'):
+            spls.append(spl)
+    return spls
+
+def iter_spl_members(paths, members, processes=None, ingredients=True):
+    """Parse the given SPLs of the release archives, in parallel.
+
+    :param paths: (list) Paths of the release archives.
+    :param members: (dict) Index of the archive in `paths` to the names of its SPL members to parse.
+    :param processes: (int) Number of worker processes, the number of CPUs by default.
+                      With 1 the SPLs are parsed in this process.
+    :param ingredients: (bool) Return the ingredients of the SPLs, see `parse_spl_members`.
+    :returns: (generator) Yields the index of the archive in `paths` and the parsed
+              SPL (see `parse_spl_members`), in no particular order.
+    """
+    tasks = list()
+    for archive_index, names in members.items():
+        tasks.extend((archive_index, str(paths[archive_index]), names[start:start + MEMBERS_PER_TASK])
+                     for start in range(0, len(names), MEMBERS_PER_TASK))
+
+    if processes == 1:
+        for archive_index, path, names in tasks:
+            for spl in parse_spl_members(path, names, ingredients):
+                yield archive_index, spl
+        return
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {executor.submit(parse_spl_members, path, names, ingredients): archive_index
+                   for archive_index, path, names in tasks}
+        for future in as_completed(futures):
+            for spl in future.result():
+                yield futures[future], spl
+
+def iter_spl_archives(paths, processes=None, ingredients=True):
+    """Parse every SPL of the given release archives, in parallel, see `iter_spl_members`."""
+    members = dict()
+    for archive_index, path in enumerate(paths):
+        with zipfile.ZipFile(path) as archive:
+            members[archive_index] = get_spl_members(archive)
+        log.do_info(f"Found {len(members[archive_index])} SPLs in release archive {path}")
+
+    yield from iter_spl_members(paths, members, processes, ingredients)
+
+def get_spl_ingredients(paths, spls, processes=None):
+    """Parse the given SPLs again for their ingredients.
+
+    :param paths: (list) Paths of the release archives.
+    :param spls: (list) SPLs found while scanning the archives, with the index of their
+                 archive in `paths` as `archive_index`.
+    :param processes: (int) Number of processes parsing the SPLs.
+    :returns spl_ingredients: (dict) SPL set ID to its ingredients (see `DailyMed.get_ingredients`).
+    """
+    members = defaultdict(set)
+    for spl in spls:
+        members[spl['archive_index']].add(spl['member'])
+
+    spl_ingredients = dict()
+    for _, spl in iter_spl_members(paths, {archive_index: sorted(names) for archive_index, names in members.items()},
+                                   processes):
+        SPL_PARSE_SECONDS.observe(spl.pop('parse_seconds'))
+        spl_ingredients[spl['setid']] = spl['ingredients']
+
+    log.do_info(f"Parsed the ingredients of {len(spl_ingredients)} SPLs of lyophilized drugs.")
+    return spl_ingredients
+
+def ingest_spl_archives(paths, update=False, processes=None):
+    """Update the labels (`set_ids`), lyophilized tags and ingredients of the drugs
+    from DailyMed SPL release archives, in one pass over the archives. Does what
+    `DailyMed.update_drugs_setids_to_db`, `classify_lyophilized_from_spl`,
+    `insert_drugs_to_lyophilized_coll` and `update_ingredients_to_db` do, without
+    any call to DailyMed.
+
+    When a SPL is in several archives, the latest version is used. A drug already
+    tagged as lyophilized stays lyophilized. The archives are scanned without keeping
+    the ingredients, the latest SPLs of the lyophilized drugs are then parsed again.
+
+    :param paths: (list) Paths of the release archives, e.g. the parts of a full
+                  release followed by the monthly updates since.
+    :param update: (bool) The archives only hold updated SPLs: the drugs keep their
+                   labels which are not in the archives, and the drugs without any
+                   label in the archives are left as they are. Otherwise the labels of
+                   every drug are replaced by the ones in the archives.
+    :param processes: (int) Number of processes parsing the SPLs.
+    """
+    start_time = time.time()
+    dailymed_obj = DailyMed()
+    projection = {'set_ids': 1, 'spl_classified': 1, 'lyophilized_sources': 1, LYOPHILIZED: 1}
+    records = {record.get('_id'): record
+               for record in dailymed_obj.ingredients_db_obj.get_records(projection=projection)}
+
+    spl_counter = 0
+    latest_spls = dict()
+    for archive_index, spl in iter_spl_archives(paths, processes, ingredients=False):
+        count_records()
+        spl_counter += 1
+        SPL_PARSE_SECONDS.observe(spl.pop('parse_seconds'))
+        spl['application_numbers'] = [number for number in spl['application_numbers'] if number in records]
+        if not spl['application_numbers']:
+            continue
+        spl['archive_index'] = archive_index
+        spl_key = (spl['version'], spl['effective_time'], archive_index)
+        if spl['setid'] in latest_spls and latest_spls[spl['setid']][0] >= spl_key:
+            continue
+        latest_spls[spl['setid']] = (spl_key, spl)
+
+    log.do_info(f"Parsed {spl_counter} SPLs from {len(paths)} release archives, "
+                f"{len(latest_spls)} SPLs are labels of known drugs.")
+
+    drug_spls = defaultdict(list)
+    for _, spl in latest_spls.values():
+        for application_number in spl['application_numbers']:
+            drug_spls[application_number].append(spl)
+
+    records_list = list()
+    updated_ids = list()
+    lyophilized_ids = set()
+    for record_id, record in records.items():
+        spls = drug_spls.get(record_id, [])
+        if update and not spls:
+            continue
+
+        set_ids_dict = dict(record.get('set_ids') or {}) if update else dict()
+        classified = set(record.get('spl_classified') or []) if update else set()
+        lyophilized_sources = dict(record.get('lyophilized_sources') or {}) if update else dict()
+        is_lyophilized = False
+        for spl in spls:
+            setid = spl['setid']
+            set_ids_dict[setid] = {'title': spl['title'], 'web_url': DAILYMED_WEBPAGE_URL.format(setid)}
+            classified.add(setid)
+            sources = spl['ingredients'].get('lyophilized_sources')
+            if sources:
+                lyophilized_sources[setid] = sources
+            else:
+                lyophilized_sources.pop(setid, None)
+            if LYOPHILIZED in spl['title'] or sources:
+                is_lyophilized = True
+
+        db_record = {
+            '_id': record_id,
+            'set_ids': set_ids_dict,
+            'spl_classified': sorted(classified),
+            'lyophilized_sources': lyophilized_sources
+        }
+        if record.get(LYOPHILIZED) is True:
+            db_record[LYOPHILIZED] = True
+        elif not set_ids_dict:
+            db_record[LYOPHILIZED] = "N/A"
+        else:
+            db_record[LYOPHILIZED] = is_lyophilized
+        if db_record[LYOPHILIZED] is True:
+            lyophilized_ids.add(record_id)
+        records_list.append(db_record)
+        updated_ids.append(record_id)
+
+        if len(records_list) >= RECORDS_PER_WRITE:
+            dailymed_obj.ingredients_db_obj.bulk_update({'insert': records_list})
+            records_list = list()
+
+    if records_list:
+        dailymed_obj.ingredients_db_obj.bulk_update({'insert': records_list})
+    log.do_info(f"Updated labels and lyophilized tags of {len(updated_ids)} drugs from the release archives.")
+
+    if update and not updated_ids:
+        return
+    query = {'_id': {'$in': updated_ids}} if update else None
+    spl_ingredients = get_spl_ingredients(paths, [spl for record_id in lyophilized_ids
+                                                  for spl in drug_spls.get(record_id, [])], processes)
+    dailymed_obj.insert_drugs_to_lyophilized_coll(query=query)
+    dailymed_obj.update_ingredients_to_db(query=query, spl_ingredients=spl_ingredients)
+
+    log.do_info(f"Ingested {len(paths)} release archives in {time.time() - start_time:.1f} seconds.")
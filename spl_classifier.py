@@ -0,0 +1,81 @@
+#pylint: disable=invalid-name
+# -*- coding: utf-8 -*-
+"""
+.. :module:: spl_classifier
+   :platform: Linux
+   :synopsis: Module to tell from the content of a SPL document whether the
+              drug is lyophilized, looking at the dosage form names of the
+              products and at the dosage forms and description sections.
+
+.. moduleauthor:: Ashwani Agarwal (agarw288@purdue.edu) (October 18, 2026)
+"""
+
+import re
+
+# LOINC codes of the label sections looked at, to the name of the source
+# reported when the section has lyophilized wording.
+CLASSIFIED_SECTIONS = {
+    '43678-2': 'dosage_forms',
+    '34089-3': 'description'
+}
+FORM_CODE_SOURCE = 'form_code'
+
+LYOPHILIZED_PATTERN = re.compile(r"\blyophili[sz](?:ed|ate|ation)\b|\bfreeze[\s-]?dried\b", re.IGNORECASE)
+
+def is_lyophilized_text(text):
+    """Return True if the text has lyophilized or freeze-dried wording."""
+    return bool(text) and LYOPHILIZED_PATTERN.search(text) is not None
+
+def sanitize_list(data):
+    if data is None:
+        return list()
+    if not isinstance(data, list):
+        return [data]
+    return data
+
+def get_text(node):
+    """Return the text of a parsed XML element and of all its children, without
+    the attributes."""
+    if isinstance(node, str):
+        return node
+    if isinstance(node, list):
+        return " ".join(get_text(item) for item in node)
+    if isinstance(node, dict):
+        return " ".join(get_text(value) for key, value in node.items() if not key.startswith('@'))
+    return ""
+
+def iter_sections(components):
+    """Yield every section of the given body components, subsections included."""
+    for component in sanitize_list(components):
+        section = component.get('section') if isinstance(component, dict) else None
+        if not isinstance(section, dict):
+            continue
+        yield section
+        yield from iter_sections(section.get('component'))
+
+def iter_form_names(section):
+    """Yield the dosage form names of the products (and kit parts) listed in a section."""
+    for subject in sanitize_list(section.get('subject')):
+        product = ((subject or {}).get('manufacturedProduct') or {}).get('manufacturedProduct') or {}
+        yield (product.get('formCode') or {}).get('@displayName', "")
+        for part in sanitize_list(product.get('part')):
+            yield (((part or {}).get('partProduct') or {}).get('formCode') or {}).get('@displayName', "")
+
+def classify_spl(document):
+    """Classify a SPL document as lyophilized or not.
+
+    :param document: (dict) The `document` element of the SPL, as parsed by xmltodict.
+    :returns sources: (list) Where the lyophilized wording was found, any of `form_code`,
+                      `dosage_forms` and `description`. Empty if the drug is not lyophilized.
+    """
+    sources = set()
+    components = ((document.get('component') or {}).get('structuredBody') or {}).get('component')
+    for section in iter_sections(components):
+        if FORM_CODE_SOURCE not in sources and any(is_lyophilized_text(name) for name in iter_form_names(section)):
+            sources.add(FORM_CODE_SOURCE)
+
+        source = CLASSIFIED_SECTIONS.get((section.get('code') or {}).get('@code'))
+        if source and source not in sources and is_lyophilized_text(get_text(section)):
+            sources.add(source)
+
+    return sorted(sources)
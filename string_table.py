@@ -0,0 +1,104 @@
+#pylint: disable=invalid-name
+# -*- coding: utf-8 -*-
+"""
+.. :module:: string_table
+   :platform: Linux
+   :synopsis: Module for the table of interned strings (products, ingredients
+              and companies) shared by the in-memory dashboard data.
+
+.. moduleauthor:: Ashwani Agarwal (agarw288@purdue.edu) (October 18, 2026)
+"""
+
+import numpy as np
+import pandas as pd
+
+_STRING_TABLE = None
+
+def get_string_table():
+    """Return the string table shared by the dashboard data of this process."""
+    global _STRING_TABLE
+    if _STRING_TABLE is None:
+        _STRING_TABLE = StringTable()
+    return _STRING_TABLE
+
+class StringTable(object):
+    """
+    Class to intern strings and give each one an integer code. Data structures
+    hold the codes, or the interned string, instead of their own copy of every
+    name. The table only grows, so the codes (and categoricals built on the
+    table) stay valid when strings are added.
+    """
+
+    def __init__(self, values=None):
+        self._values = list()
+        self._codes = dict()
+        self._categories = None
+        for value in values or []:
+            self.add(value)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, value):
+        return value in self._codes
+
+    def add(self, value):
+        """Add a string to the table, if not already present.
+
+        :param value: (str) String to add.
+        :returns: (int) Code of the string.
+        """
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self._values)
+            self._values.append(value)
+            self._codes[value] = code
+        return code
+
+    def intern(self, value):
+        """Return the table's copy of the given string, adding it if needed."""
+        return self._values[self.add(value)]
+
+    def get_code(self, value):
+        """Return the code of a string, None if it is not in the table."""
+        return self._codes.get(value)
+
+    def get_codes(self, values):
+        """Return the codes of the given strings, adding the ones not in the table.
+
+        :param values: (iterable) Strings, or a categorical of strings.
+        :returns: (ndarray) Array of int32 codes.
+        """
+        if isinstance(values, pd.Series):
+            values = values.array
+        if isinstance(values, pd.Categorical):
+            # Only translate the categories, the values are codes already.
+            return self.get_codes(values.categories)[values.codes]
+        return np.fromiter((self.add(value) for value in values), dtype=np.int32)
+
+    def get_value(self, code):
+        return self._values[code]
+
+    def get_values(self, codes):
+        """Return the strings for the given codes."""
+        return [self._values[code] for code in codes]
+
+    @property
+    def values(self):
+        return self._values
+
+    @property
+    def categories(self):
+        """Index of all the strings, position being the code, to build categoricals on."""
+        if self._categories is None or len(self._categories) != len(self._values):
+            self._categories = pd.Index(self._values, dtype=object)
+        return self._categories
+
+    def categorical(self, values):
+        """Return the given strings as a categorical coded on the table.
+
+        :param values: (iterable) Strings.
+        :returns: (Categorical) Categorical with the table as categories.
+        """
+        codes = self.get_codes(values)
+        return pd.Categorical.from_codes(codes, categories=self.categories)
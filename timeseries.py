@@ -0,0 +1,180 @@
+#pylint: disable=invalid-name
+# -*- coding: utf-8 -*-
+"""
+.. :module:: timeseries
+   :platform: Linux
+   :synopsis: Module for the yearly occurences index of active ingredients,
+              inactive ingredients and companies used by the dashboard.
+
+.. moduleauthor:: Ashwani Agarwal (agarw288@purdue.edu) (October 18, 2026)
+"""
+
+import numpy as np
+import pandas as pd
+from string_table import (
+    get_string_table
+)
+
+ACTIVE = "active"
+INACTIVE = "inactive"
+COMPANY = "company"
+
+ENTITY_LABELS = {
+    ACTIVE: "Active Ingredient",
+    INACTIVE: "Inactive Ingredient",
+    COMPANY: "Company"
+}
+
+# Position of an entity type in the list is its code.
+ENTITY_TYPES = list(ENTITY_LABELS)
+
+class TimeSeriesIndex(object):
+    """
+    Class to hold the number of occurences of every entity (active ingredient,
+    inactive ingredient or company) per year in a single index of
+    (entity type, entity, year) -> count. All the time series and the
+    ingredients charts are served from this index.
+
+    The index is kept as four numpy arrays (entity type code, entity code in
+    the string table, year and count), sorted on (entity type, entity, year),
+    so that the rows of an entity are found with a binary search. The arrays
+    can be views of a memory-mapped file, see `dashboard_data`.
+    """
+
+    def __init__(self, occurrences_df, strings=None):
+        """
+        :param occurrences_df: (DataFrame) Dataframe with `EntityType`, `Entity`,
+                               `Year` and `Occurences` columns.
+        :param strings: (StringTable) Table to code the entities on, the shared
+                        table if not given.
+        """
+        self.strings = strings if strings is not None else get_string_table()
+        self._set_rows(*self._get_rows(occurrences_df))
+
+    @classmethod
+    def from_arrays(cls, strings, entity_types, entities, years, counts, is_sorted=True):
+        """Create the index from arrays, used as is if already sorted on
+        (entity type, entity, year).
+
+        :param strings: (StringTable) Table the entities are coded on.
+        :param entity_types: (ndarray) int8 entity type codes, see `ENTITY_TYPES`.
+        :param entities: (ndarray) int32 entity codes.
+        :param years: (ndarray) int16 years.
+        :param counts: (ndarray) int32 occurences.
+        :param is_sorted: (bool) Whether the arrays are sorted.
+        """
+        timeseries_index = cls.__new__(cls)
+        timeseries_index.strings = strings
+        timeseries_index._set_rows(entity_types, entities, years, counts, is_sorted=is_sorted)
+        return timeseries_index
+
+    def _get_rows(self, occurrences_df):
+        entity_types = pd.Categorical(occurrences_df['EntityType'], categories=ENTITY_TYPES).codes.astype(np.int8)
+        entities = self.strings.get_codes(occurrences_df['Entity'])
+        years = occurrences_df['Year'].to_numpy(dtype=np.int16)
+        counts = occurrences_df['Occurences'].to_numpy(dtype=np.int32)
+        return entity_types, entities, years, counts
+
+    def _set_rows(self, entity_types, entities, years, counts, is_sorted=False):
+        if not is_sorted:
+            order = np.lexsort((years, entities, entity_types))
+            entity_types, entities, years, counts = entity_types[order], entities[order], years[order], counts[order]
+        # Rows of the entity type with code `i` are between bounds `i` and `i + 1`.
+        type_bounds = np.searchsorted(entity_types, np.arange(len(ENTITY_TYPES) + 1))
+        # Swapped in one assignment, readers take the arrays from a single tuple.
+        self._rows = (entity_types, entities, years, counts, type_bounds)
+
+    @property
+    def arrays(self):
+        """(tuple) The entity type, entity, year and count arrays of the index."""
+        return self._rows[:4]
+
+    def update(self, occurrences_df, entities):
+        """Replace the yearly occurences of the given entities, leaving the others as is.
+
+        :param occurrences_df: (DataFrame) Dataframe with `EntityType`, `Entity`, `Year`
+                               and `Occurences` columns, with the current occurences of
+                               the entities. Rows for other entities are ignored.
+        :param entities: (dict) Entity type to the names of the entities to replace.
+        """
+        keys = np.array([get_key(ENTITY_TYPES.index(entity_type), self.strings.add(entity))
+                         for entity_type, names in entities.items() for entity in names], dtype=np.int64)
+        if not len(keys):
+            return
+
+        entity_types, entity_codes, years, counts, _ = self._rows
+        keep = ~np.isin(get_key(entity_types, entity_codes), keys)
+        new_entity_types, new_entity_codes, new_years, new_counts = self._get_rows(occurrences_df)
+        add = np.isin(get_key(new_entity_types, new_entity_codes), keys)
+        self._set_rows(np.concatenate([entity_types[keep], new_entity_types[add]]),
+                       np.concatenate([entity_codes[keep], new_entity_codes[add]]),
+                       np.concatenate([years[keep], new_years[add]]),
+                       np.concatenate([counts[keep], new_counts[add]]))
+
+    def _get_type_rows(self, entity_type):
+        """Return the entity, year and count arrays of the rows of an entity type."""
+        _, entities, years, counts, type_bounds = self._rows
+        if entity_type not in ENTITY_TYPES:
+            return entities[:0], years[:0], counts[:0]
+        type_code = ENTITY_TYPES.index(entity_type)
+        start, end = type_bounds[type_code], type_bounds[type_code + 1]
+        return entities[start:end], years[start:end], counts[start:end]
+
+    def get_entities(self, entity_type):
+        """Return all the entities of the given type present in the index.
+
+        :param entity_type: (str) One of `active`, `inactive` or `company`.
+        :returns: (list) List of entity names.
+        """
+        entities, _, _ = self._get_type_rows(entity_type)
+        return sorted(self.strings.get_values(np.unique(entities)))
+
+    def get_totals(self, entity_type):
+        """Return the total number of occurences for every entity of the given type.
+
+        :param entity_type: (str) One of `active`, `inactive` or `company`.
+        :returns: (DataFrame) Dataframe with `Entity` and `Occurences` columns
+                  sorted on `Occurences`.
+        """
+        entities, _, counts = self._get_type_rows(entity_type)
+        if not len(entities):
+            return pd.DataFrame({'Entity': [], 'Occurences': []})
+
+        starts = np.flatnonzero(np.r_[True, entities[1:] != entities[:-1]])
+        totals_df = pd.DataFrame({
+            'Entity': self.strings.get_values(entities[starts]),
+            'Occurences': np.add.reduceat(counts.astype(np.int64), starts)
+        })
+        # Entities in name order first, as ties on `Occurences` keep that order.
+        totals_df = totals_df.sort_values(by=['Entity']).reset_index(drop=True)
+        return totals_df.sort_values(by=['Occurences'])
+
+    def get_series(self, entity_type, entities):
+        """Return the yearly occurences for the given entities.
+
+        :param entity_type: (str) One of `active`, `inactive` or `company`.
+        :param entities: (iterable) Names of the entities to fetch the series for.
+        :returns: (list) List of dicts with `name`, `x` (years) and `y` (occurences),
+                  one per entity present in the index.
+        """
+        type_entities, years, counts = self._get_type_rows(entity_type)
+        series = list()
+        for entity in sorted(set(entities)):
+            code = self.strings.get_code(entity)
+            if code is None:
+                continue
+            start = np.searchsorted(type_entities, code, side='left')
+            end = np.searchsorted(type_entities, code, side='right')
+            if start == end:
+                continue
+            series.append({
+                'name': entity,
+                'x': years[start:end].tolist(),
+                'y': counts[start:end].tolist()
+            })
+
+        return series
+
+def get_key(entity_types, entities):
+    """Combine entity type and entity codes into a single int64 key."""
+    return (np.asarray(entity_types, dtype=np.int64) << 32) | np.asarray(entities, dtype=np.int64)
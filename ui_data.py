@@ -2,23 +2,142 @@ import traceback
 import logger as log
 import pandas as pd
 from datetime import (
-    datetime
+    date,
+    datetime,
+    timedelta
 )
 from database import (
     DrugsMetaCollection,
     IngredientsCollection,
+    LabelIngredientsCollection,
     LyophilizedCollection
 )
-from dash import (
-    html,
-    dcc
+from ingredient_index import (
+    IngredientIndex
+)
+from profiling import (
+    section
+)
+from string_table import (
+    get_string_table
 )
 
+OCCURRENCE_KEYS = {
+    'active': 'active_ingredient_ids',
+    'inactive': 'inactive_ingredient_ids',
+    'company': 'company'
+}
+
+EXPORT_COLUMNS = [
+    'application_number',
+    'company',
+    'products',
+    'first_submission_date',
+    'setid',
+    'label_title',
+    'label_url',
+    'role',
+    'ingredient',
+    'code',
+    'strength'
+]
+
+DEFAULT_TABLE_DAYS = 365
+
+TABLE_PROJECTION = {key: 1 for key in ['application_number', 'company', 'products', 'date', 'set_ids']}
+NESTED_INGREDIENTS_PROJECTION = {'active_ingredients': 1, 'inactive_ingredients': 1}
+EXPORT_PROJECTION = dict(TABLE_PROJECTION, **NESTED_INGREDIENTS_PROJECTION)
+LABEL_INGREDIENT_PROJECTION = {key: 1 for key in ['application_number', 'setid', 'role', 'name', 'code', 'strength']}
+
+class TableRow(object):
+    """
+    One drug of the results table. Only plain values are kept (no Dash components),
+    so rows can be rendered in a single pass, exported or cached. `labels` holds a
+    `(setid, title, web_url, active, inactive)` tuple per DailyMed label with
+    ingredients, `active` and `inactive` being tuples of `(name, code, strength)`.
+    """
+    __slots__ = ('application_number', 'company', 'products', 'dates', 'labels')
+
+    def __init__(self, application_number, company, products, dates, labels):
+        self.application_number = application_number
+        self.company = company
+        self.products = products
+        self.dates = dates
+        self.labels = labels
+
+    @classmethod
+    def from_record(cls, record, label_ingredients=None, first_submission_only=False):
+        """Create the row of a `lyophilized` record.
+
+        :param record: (dict) The record.
+        :param label_ingredients: (list) Records of the drug in the `label_ingredients` collection,
+                                  sorted by label and position. The nested ingredients of the
+                                  record are used if not given.
+        :param first_submission_only: (bool) Only keep the first submission date of the drug,
+                                      e.g. when the drugs are filtered on it, all the dates otherwise.
+        :returns: (TableRow) The row, None if no label of the drug has ingredients.
+        """
+        ingredients = {'active': record.get('active_ingredients') or {},
+                       'inactive': record.get('inactive_ingredients') or {}}
+        if label_ingredients is not None:
+            ingredients = {'active': dict(), 'inactive': dict()}
+            for label_ingredient in label_ingredients:
+                ingredients[label_ingredient.get('role')].setdefault(label_ingredient.get('setid'), []).append(label_ingredient)
+
+        labels = list()
+        for setid, label in (record.get('set_ids') or {}).items():
+            active = tuple((ingredient.get('name', ""), ingredient.get('code'), ingredient.get('strength', ""))
+                           for ingredient in ingredients['active'].get(setid, []))
+            inactive = tuple((ingredient.get('name', ""), ingredient.get('code'), ingredient.get('strength', ""))
+                             for ingredient in ingredients['inactive'].get(setid, []))
+            if active or inactive:
+                labels.append((setid, label.get('title'), label.get('web_url'), active, inactive))
+
+        if not labels:
+            return
+
+        dates = record.get('date') or []
+        if first_submission_only:
+            dates = dates[:1]
+
+        return cls(record.get('application_number'), record.get('company'),
+                   tuple(product for product in record.get('products') or [] if product), tuple(dates), tuple(labels))
+
+    @property
+    def row_span(self):
+        """Number of table lines of the drug, one per ingredient line of each label."""
+        return sum(max(len(active), len(inactive)) for _, _, _, active, inactive in self.labels)
+
+    def iter_lines(self):
+        """Yield the `(label, active, inactive)` cells of every table line of the drug.
+        `label` is the `(title, web_url, row_span)` of the label starting on the line, None
+        if the line continues a label. `active` and `inactive` are the `(name, strength)`
+        of the ingredients on the line, None if the label has no more of them.
+        """
+        for _, title, web_url, active, inactive in self.labels:
+            label_span = max(len(active), len(inactive))
+            for i in range(label_span):
+                yield ((title, web_url, label_span) if i == 0 else None,
+                       (active[i][0], active[i][2]) if i < len(active) else None,
+                       (inactive[i][0], inactive[i][2]) if i < len(inactive) else None)
+
+    def iter_export_rows(self):
+        """Yield one row per ingredient of every label, in the order of `EXPORT_COLUMNS`."""
+        first_submission_date = self.dates[0].date() if self.dates else None
+        products = "; ".join(self.products)
+        for setid, title, web_url, active, inactive in self.labels:
+            for role, ingredients in [('active', active), ('inactive', inactive)]:
+                for name, code, strength in ingredients:
+                    yield (self.application_number, self.company, products, first_submission_date,
+                           setid, title, web_url, role, name, code, strength)
+
 class MongoData(object):
 
     def __init__(self):
         self._ingredients_db_obj = None
         self._lyophilized_db_obj = None
+        self._label_ingredients_db_obj = None
+        self._ingredient_index = None
 
     @property
     def ingredients_db_obj(self):
@@ -32,6 +151,29 @@ class MongoData(object):
             self._lyophilized_db_obj = LyophilizedCollection()
         return self._lyophilized_db_obj
 
+    @property
+    def label_ingredients_db_obj(self):
+        if not self._label_ingredients_db_obj:
+            self._label_ingredients_db_obj = LabelIngredientsCollection()
+        return self._label_ingredients_db_obj
+
+    @property
+    def ingredient_index(self):
+        if not self._ingredient_index:
+            self._ingredient_index = IngredientIndex.from_db()
+        return self._ingredient_index
+
+    def reset_ingredient_index(self):
+        """Drop the loaded ingredient index, it is loaded again on next use."""
+        self._ingredient_index = None
+
+    def reset_db_objs(self):
+        """Drop the collection objects, they are created again on next use with
+        the db client of the current process."""
+        self._ingredients_db_obj = None
+        self._lyophilized_db_obj = None
+        self._label_ingredients_db_obj = None
+
     def sanitize_list(self, item):
         if not isinstance(item, list):
             result = list()
@@ -39,260 +181,197 @@ class MongoData(object):
             return result
         return item
 
-    def get_table_data(self, start_date=None, end_date=None, product_search=None, active_search=None, inactive_search=None):
-        
-        search_query = dict()
-        result = list()
-        if product_search:
-            result.extend(self.sanitize_list(product_search))
-            search_query.update({
-                'products': {'$in': result}
-            })
-        elif active_search:
-            result.extend(self.sanitize_list(active_search))
-            search_query.update({
-                'active_ingredients_list': {'$in': result}
-            })
-        elif inactive_search:
-            result.extend(self.sanitize_list(inactive_search))
-            search_query.update({
-                'inactive_ingredients_list': {'$in': result}
-            })
-        
-        if not (start_date or search_query):
-            today = datetime.today()
-            start_date = datetime(today.year, today.month, 1)
-
-            ##
-            ## For Testing purposes, using start date from Jan 1, 2022.
-            ##
-            start_date = datetime(2022, 1, 1)
-            search_query.update({'date': {'$gte': start_date}})
+    def get_search_query(self, product_search=None, active_search=None, inactive_search=None, company_search=None):
+        """Return the mongo query for the given search filters. Only the first
+        filter given, in the order of the arguments, is applied. Ingredients are
+        matched on their canonical IDs, so that every spelling of an ingredient
+        on the labels is found.
+
+        :returns: (dict) Query to run on the `lyophilized` collection.
+        """
+        search_filters = [
+            ('products', product_search),
+            ('active_ingredient_ids', active_search),
+            ('inactive_ingredient_ids', inactive_search),
+            ('company', company_search)
+        ]
+        for key, search in search_filters:
+            if search:
+                search = self.sanitize_list(search)
+                if key.endswith('_ingredient_ids'):
+                    search = self.ingredient_index.get_ids(search)
+                return {key: {'$in': search}}
+
+        return dict()
+
+    def get_date_query(self, start_date=None, end_date=None):
+        """Return the mongo query for the drugs first submitted in the given range,
+        served by the `first_submission_date` index.
+
+        :param start_date: (datetime) Start of the range, included.
+        :param end_date: (datetime) End of the range, excluded.
+        :returns: (dict) Query to run on the `lyophilized` collection, empty if no date is given.
+        """
+        date_range = dict()
+        if start_date:
+            date_range['$gte'] = start_date
         if end_date:
-            search_query['date'].update({
-                '$lt': end_date
-            })       
+            date_range['$lt'] = end_date
+        if not date_range:
+            return dict()
 
-        records_rows = list()
-        record_id = None
-        try:
-            for records in self.lyophilized_db_obj.get_records(query=search_query):
-                record_id = records.get('_id')
-                labels_rows = list()
-                active_ingredients_rows = list()
-                active_strength_rows = list()
-                inactive_ingredients_rows = list()
-                inactive_strength_rows = list() 
-                for setid, labels in records.get('set_ids', {}).items():
-                    row = list()
-                    active = records.get('active_ingredients', {}).get(setid, [])
-                    inactive = records.get('inactive_ingredients', {}).get(setid, [])
-                    active_len = len(active)
-                    inactive_len = len(inactive)
-                    row_span = max(active_len, max(inactive_len, 0))
-
-                    if row_span == 0:
-                        continue
+        return {'first_submission_date': date_range}
 
-                    row.append(dcc.Markdown(f"[{labels.get('title')}]({labels.get('web_url')})"))
-                    row.append(row_span)
-
-                    labels_rows.append(row)
-                    for i in range(1, row_span):
-                        labels_rows.append(list())
-
-                    
-                    for i in range(0, row_span):
-                        active_name_row = ["", 1]
-                        active_strength_row = ["", 1]
-                        inactive_name_row = ["", 1]
-                        inactive_strength_row = ["", 1]
-
-                        if i < active_len:
-                            active_name_row = [active[i].get('name', ""), 1]
-                            active_strength_row = [active[i].get('strength', ""), 1]
-                        
-                        if i < inactive_len:
-                            inactive_name_row = [inactive[i].get('name', ""), 1]
-                            inactive_strength_row = [inactive[i].get('strength', ""), 1]
-                        
-                        active_ingredients_rows.append(active_name_row)
-                        active_strength_rows.append(active_strength_row)
-                        inactive_ingredients_rows.append(inactive_name_row)
-                        inactive_strength_rows.append(inactive_strength_row)
-
-
-                total_span = len(labels_rows)
-                if total_span <= 0:
-                    total_span = 1
-
-                app_number = records.get('application_number')
-                app_list = [app_number, total_span]
-            
-                product_outer_list = list()     
-                for product in records.get('products', []):
-                    product_rows = [product.upper(), html.Br()]
-                
-                product_rows.append(app_number)
-                product_outer_list = [product_rows, total_span, "products"]
-
-                date_rows = list() 
-                if not start_date:
-                    date_value = list()
-                    for date in records.get('date'):
-                        date_value.append(date.strftime('%m-%d-%Y'))
-                        date_value.append(html.Br())
-                else:
-                    date_value = ""
-                    for date in records.get('date'):
-                        if date.year >= start_date.year and date.month >= start_date.month:
-                            if end_date: 
-                                if date.year <= end_date.year and date.month <= end_date.month:
-                                    date_value = date.strftime('%m-%d-%Y')
-                                    break
-                            else:
-                                date_value = date.strftime('%m-%d-%Y')
-                                break
-                
-                date_rows = [date_value, total_span, "dates"]
-                company_rows = [records.get('company'), total_span]
-            
-                current_row = [date_rows, product_outer_list, company_rows]
-
-                for i in range(0, len(labels_rows)):
-                    if labels_rows[i]:
-                        current_row.append(labels_rows[i])
-                    current_row.extend([active_ingredients_rows[i], active_strength_rows[i]])
-                    current_row.extend([inactive_ingredients_rows[i], inactive_strength_rows[i]])
-    
-                    records_rows.append(current_row)
-                    current_row = list()
+    def get_table_data(self, start_date=None, end_date=None, product_search=None, active_search=None, inactive_search=None, company_search=None):
+        """Return the rows of the results table for the drugs matching the given
+        filters, see `TableRow`. Without any filter, only the drugs first submitted
+        in the last `DEFAULT_TABLE_DAYS` days are returned.
 
-        except Exception as exc:
-            log.do_error(f"Exception occurred while fetching records from database for record: {record_id}, error: {str(exc)}, traceback: {traceback.format_exc()}")
+        :param start_date: (datetime) Only the drugs first submitted from this date on.
+        :param end_date: (datetime) Only the drugs first submitted before this date.
+        :returns: (list) `TableRow` per drug with at least one ingredient on its labels.
+        """
+        search_query = self.get_search_query(product_search, active_search, inactive_search, company_search)
 
-        return records_rows
+        if not (start_date or end_date or search_query):
+            start_date = datetime.combine(date.today() - timedelta(days=DEFAULT_TABLE_DAYS), datetime.min.time())
+        search_query.update(self.get_date_query(start_date, end_date))
+        first_submission_only = bool(start_date or end_date)
 
+        table_rows = list()
+        try:
+            with section('mongo_query'):
+                records_list = list(self.lyophilized_db_obj.get_records(query=search_query, projection=TABLE_PROJECTION))
+                # The ingredients of the labels are read from the flat, indexed collection
+                # instead of the nested maps of the `lyophilized` records.
+                label_ingredients = dict()
+                application_numbers = [record.get('_id') for record in records_list]
+                for label_ingredient in self.label_ingredients_db_obj.get_records(
+                                            query={'application_number': {'$in': application_numbers}},
+                                            projection=LABEL_INGREDIENT_PROJECTION):
+                    label_ingredients.setdefault(label_ingredient.get('application_number'), list()).append(label_ingredient)
+                # Drugs not in the flat collection yet (e.g. before it is backfilled, see
+                # `label_ingredients.py`) are shown from their nested maps.
+                records_by_id = {record.get('_id'): record for record in records_list
+                                 if record.get('_id') not in label_ingredients}
+                if records_by_id:
+                    for nested_record in self.lyophilized_db_obj.get_records(
+                                            query={'_id': {'$in': list(records_by_id)}},
+                                            projection=NESTED_INGREDIENTS_PROJECTION):
+                        records_by_id[nested_record.get('_id')].update(nested_record)
+        except Exception as exc:
+            log.do_error(f"Exception occurred while fetching records from database, error: {str(exc)}")
+            return table_rows
+
+        with section('build_rows'):
+            for record in records_list:
+                try:
+                    table_row = TableRow.from_record(record, label_ingredients.get(record.get('_id')),
+                                                     first_submission_only)
+                except Exception as exc:
+                    log.do_error(f"Exception occurred while building table row for record: {record.get('_id')}, error: {str(exc)}, traceback: {traceback.format_exc()}")
+                    continue
+                if table_row:
+                    table_rows.append(table_row)
+
+        return table_rows
+
+
+    def iter_export_rows(self, product_search=None, active_search=None, inactive_search=None, company_search=None,
+                         start_date=None, end_date=None):
+        """Yield one row per ingredient of every DailyMed label of the drugs matching the
+        given filters, in the order of `EXPORT_COLUMNS`. Records are read from a server
+        side cursor and rows are generated lazily, so memory use does not grow with the
+        number of drugs exported.
+        """
+        search_query = self.get_search_query(product_search, active_search, inactive_search, company_search)
+        search_query.update(self.get_date_query(start_date, end_date))
+
+        for record in self.lyophilized_db_obj.get_records(query=search_query, projection=EXPORT_PROJECTION):
+            table_row = TableRow.from_record(record)
+            if table_row:
+                yield from table_row.iter_export_rows()
 
     def get_search_bar_data(self):
-        products = set()
+        products = self.lyophilized_db_obj.get_distinct_values('products')
         active_ingredients = set()
+        for ingredient_id in self.lyophilized_db_obj.get_distinct_values('active_ingredient_ids'):
+            active_ingredients.add(self.ingredient_index.get_name(ingredient_id))
         inactive_ingredients = set()
-        for records in self.lyophilized_db_obj.get_records():
-            products.update(set(records.get('products', [])))
-            active_ingredients.update(set(records.get('active_ingredients_list', [])))
-            inactive_ingredients.update(set(records.get('inactive_ingredients_list', [])))
+        for ingredient_id in self.lyophilized_db_obj.get_distinct_values('inactive_ingredient_ids'):
+            inactive_ingredients.add(self.ingredient_index.get_name(ingredient_id))
 
         return (list(products), list(active_ingredients), list(inactive_ingredients))
 
+    def get_unlisted_search_bar_values(self, removed_values):
+        """Return the search bar values not listed by any drug anymore, among the
+        given ones. Only the given values are looked up, an ingredient name is kept
+        as long as any canonical ID with that name is listed.
+
+        :param removed_values: (dict) Entity type (`products`, `active` or `inactive`) to the
+                               products or canonical ingredient IDs not listed anymore.
+        :returns: (dict) Entity type to the products or ingredient names to remove.
+        """
+        unlisted_values = dict()
+        products = set(removed_values.get('products') or [])
+        if products:
+            listed = self.lyophilized_db_obj.get_distinct_values('products', {'products': {'$in': list(products)}})
+            unlisted_values['products'] = products - set(listed)
+
+        for entity_type in ['active', 'inactive']:
+            names = {self.ingredient_index.get_name(ingredient_id)
+                     for ingredient_id in removed_values.get(entity_type) or []}
+            if not names:
+                continue
+            key = OCCURRENCE_KEYS[entity_type]
+            listed = self.lyophilized_db_obj.get_distinct_values(
+                        key, {key: {'$in': self.ingredient_index.get_ids(names)}})
+            unlisted_values[entity_type] = names - {self.ingredient_index.get_name(ingredient_id)
+                                                    for ingredient_id in listed}
+
+        return unlisted_values
+
     
-    def generate_occurences_data(self):
+    def get_occurrences_dataframe(self, values=None):
+        """Return the number of occurences of every active ingredient, inactive ingredient
+        and company per year, aggregated in the database. Ingredients are counted by
+        canonical ID and reported under their canonical name.
+
+        :param values: (dict) Entity type to the canonical IDs (or companies) to count,
+                       only the entity types present are counted. Everything is counted
+                       if not given.
+        :returns: (DataFrame) Dataframe with `EntityType`, `Entity`, `Year` and `Occurences` columns,
+                  `Entity` being a categorical on the shared string table.
+        """
+        entity_types = list()
+        entities = list()
+        years = list()
+        occurences = list()
         try:
-            active_ingredients_dict = dict()
-            inactive_ingredients_dict = dict() 
-            products_set = set()       
-            for record in self.lyophilized_db_obj.get_records():
-                products = record.get('products', [])
-                active_ingredients = record.get('active_ingredients_list', [])
-                inactive_ingredients = record.get('inactive_ingredients_list', [])
-                        
-                date = record.get('date', [])[0]
-                date_value = date.strftime('%Y')
-
-                for product in products:
-                    for ingredient in active_ingredients:
-                        id = product + ingredient
-                        if id not in products_set:
-                            products_set.add(id)
-                            existing_val = active_ingredients_dict.get(ingredient, {}).get(date_value, 0)
-                            total_val = active_ingredients_dict.get(ingredient, {}).get('total_count', 0)
-                            if active_ingredients_dict.get(ingredient):
-                                active_ingredients_dict[ingredient].update({date_value: existing_val + 1})
-                                active_ingredients_dict[ingredient].update({'total_count': total_val + 1})
-                            else:
-                                active_ingredients_dict[ingredient] = {}
-                                active_ingredients_dict[ingredient].update({date_value: 1})
-                                active_ingredients_dict[ingredient].update({'total_count': 1})
-
-                    for ingredient in inactive_ingredients:
-                        id = product + ingredient
-                        if id not in products_set:
-                            products_set.add(id)
-                            existing_val = inactive_ingredients_dict.get(ingredient, {}).get(date_value, 0)
-                            total_val = inactive_ingredients_dict.get(ingredient, {}).get('total_count', 0)
-                            if inactive_ingredients_dict.get(ingredient):
-                                inactive_ingredients_dict[ingredient].update({date_value: existing_val + 1})
-                                inactive_ingredients_dict[ingredient].update({'total_count': total_val + 1})
-                            else:
-                                inactive_ingredients_dict[ingredient] = {}
-                                inactive_ingredients_dict[ingredient].update({date_value: 1})
-                                inactive_ingredients_dict[ingredient].update({'total_count': 1})
+            for entity_type, key in OCCURRENCE_KEYS.items():
+                if values is not None and entity_type not in values:
+                    continue
+                entity_values = values.get(entity_type) if values is not None else None
+                for row in self.lyophilized_db_obj.get_yearly_occurrences(key, entity_values):
+                    entity = row.get('value')
+                    if entity is None:
+                        continue
+                    if key.endswith('_ingredient_ids'):
+                        entity = self.ingredient_index.get_name(entity)
+                    entity_types.append(entity_type)
+                    entities.append(entity)
+                    years.append(int(row.get('year')))
+                    occurences.append(row.get('count', 0))
         except Exception as exc:
-            log.do_error(f"Exception occurred while fetching ingredients from Database, error: {str(exc)}")
-
-        return {'active': active_ingredients_dict, 'inactive': inactive_ingredients_dict}
-
-
-    def get_timeseries_dataframe(self):
-
-        time_series_data = self.generate_occurences_data()
-        inactive_list = list()
-        inactive_ing_list = list()
-        active_list = list()
-        active_ing_list = list()
-        inactive_dates_list = list()
-        active_dates_list = list()
-        inactive_occ_list = list()
-        active_occ_list = list()
-        active_total_count = list()
-        inactive_total_count = list()
-
-        for ingredient, value in time_series_data.get('active', {}).items():
-            active_ing_list.append(ingredient)
-            for key, count in value.items():
-                if key == "total_count":
-                    active_total_count.append(count)
-                else:
-                    active_dates_list.append(int(key))
-                    active_list.append(ingredient)
-                    active_occ_list.append(count)
-
-
-        for ingredient, value in time_series_data.get('inactive', {}).items():
-            inactive_ing_list.append(ingredient)
-            for key, count in value.items():
-                if key == "total_count":
-                    inactive_total_count.append(count)
-                else:
-                    inactive_dates_list.append(int(key))
-                    inactive_list.append(ingredient)
-                    inactive_occ_list.append(count)
-
-        active_time_series = pd.DataFrame({
-            "Ingredient": active_list,
-            "Year": active_dates_list,
-            "Occurences": active_occ_list
-        })
-
-        inactive_time_series = pd.DataFrame({
-            "Ingredient": inactive_list,
-            "Year": inactive_dates_list,
-            "Occurences": inactive_occ_list
-        })
+            log.do_error(f"Exception occurred while fetching occurences from Database, error: {str(exc)}")
 
-        active_chart = pd.DataFrame({
-            "Ingredient": active_ing_list,
-            "Occurences": active_total_count
+        occurrences_df = pd.DataFrame({
+            "EntityType": pd.Categorical(entity_types, categories=list(OCCURRENCE_KEYS)),
+            "Entity": get_string_table().categorical(entities),
+            "Year": pd.array(years, dtype='int16'),
+            "Occurences": pd.array(occurences, dtype='int32')
         })
+        # Different canonical IDs can share a canonical name, add their counts up.
+        occurrences_df = occurrences_df.groupby(['EntityType', 'Entity', 'Year'], as_index=False, observed=True).sum()
 
-        inactive_chart = pd.DataFrame({
-            "Ingredient": inactive_ing_list,
-            "Occurences": inactive_total_count
-        })
-    
-        active_time_series = active_time_series.sort_values(by=['Year'])
-        inactive_time_series = inactive_time_series.sort_values(by=['Year'])
-        active_chart = active_chart.sort_values(by=['Occurences'])
-        inactive_chart = inactive_chart.sort_values(by=['Occurences'])
-
-        return (active_chart, inactive_chart, active_time_series, inactive_time_series)
\ No newline at end of file
+        return occurrences_df
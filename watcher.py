@@ -0,0 +1,289 @@
+#pylint: disable=invalid-name
+# -*- coding: utf-8 -*-
+"""
+.. :module:: watcher
+   :platform: Linux
+   :synopsis: Background watcher reporting the drugs changed in the `lyophilized`
+              collection, through a change stream or by polling on `lut`.
+
+.. moduleauthor:: Ashwani Agarwal (agarw288@purdue.edu) (October 18, 2026)
+"""
+
+import time
+import threading
+import logger as log
+from collections import (
+    Counter
+)
+from pymongo.errors import (
+    OperationFailure,
+    PyMongoError
+)
+from cooccurrence import (
+    update_pair_counts
+)
+from database import (
+    LyophilizedCollection,
+    get_config
+)
+from refresh import (
+    CHANGED_FIELDS,
+    get_changed_values
+)
+
+MODES = ['auto', 'change_stream', 'poll']
+DEFAULT_POLL_INTERVAL = 30
+DEFAULT_BATCH_INTERVAL = 5
+# The `lut` of a record is stamped before the bulk write commits it, so each poll
+# reads again the records written in this window before the last `lut` seen.
+DEFAULT_POLL_WINDOW = 5 * 60
+DEFAULT_RECONCILE_INTERVAL = 10 * 60
+CHANGE_STREAM_AWAIT_MS = 1000
+RECONNECT_DELAY = 10
+
+class LyophilizedWatcher(object):
+    """
+    Class to watch the `lyophilized` collection for drugs written by the backend
+    and report their dashboard values (see `refresh.CHANGED_FIELDS`), before and
+    after the change, to a callback. Changes are reported in batches, since the
+    backend writes the drugs in bulk, and only for drugs whose dashboard values
+    actually changed. A snapshot of the dashboard values of every drug is kept to
+    compare against, which also tells which values are not listed by any drug anymore.
+    """
+
+    def __init__(self, on_change, mode='auto', poll_interval=DEFAULT_POLL_INTERVAL,
+                 batch_interval=DEFAULT_BATCH_INTERVAL, poll_window=DEFAULT_POLL_WINDOW,
+                 reconcile_interval=DEFAULT_RECONCILE_INTERVAL):
+        """
+        :param on_change: (function) Called with the changed values (entity type to the
+                          values, like `refresh.get_changed_values`), the removed values
+                          (entity type to the values not listed by any drug anymore) and
+                          the change in the ingredient pair counts (see `cooccurrence.update_pair_counts`).
+        :param mode: (str) `change_stream`, `poll` or `auto` to use a change stream when
+                     the server supports it and poll otherwise.
+        :param poll_interval: (int) Seconds between two polls.
+        :param batch_interval: (int) Maximum seconds to gather changes before reporting them.
+        :param poll_window: (int) Seconds before the last `lut` seen to read again on each poll.
+        :param reconcile_interval: (int) Seconds between two checks for deleted drugs when
+                                   polling, deletes leave no `lut` behind.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown watcher mode: {mode}, expected one of {', '.join(MODES)}")
+        self.on_change = on_change
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.batch_interval = batch_interval
+        self.poll_window = poll_window
+        self.reconcile_interval = reconcile_interval
+        self._lyophilized_db_obj = None
+        self._records = dict()
+        self._counts = {entity_type: Counter() for entity_type in CHANGED_FIELDS}
+        self._last_lut = 0
+        self._last_reconcile_time = 0
+        self._resume_token = None
+        self._apply_lock = threading.Lock()
+        self._loaded_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, on_change, workers=1):
+        """Create the watcher from the `dashboard_watcher` section of the config file,
+        e.g. `{"enabled": true, "mode": "auto", "poll_interval": 30}`, see `__init__`
+        for the other settings.
+
+        :param workers: (int) Number of processes serving the dashboard. The watcher is
+                        enabled by default with more than one, every process holds its own
+                        caches and only the watcher updates all of them.
+        :returns: (LyophilizedWatcher) The watcher, None if it is not enabled.
+        """
+        config = get_config().get('dashboard_watcher') or {}
+        if not config.get('enabled', workers > 1):
+            return
+        return cls(on_change, mode=config.get('mode', 'auto'),
+                   poll_interval=config.get('poll_interval', DEFAULT_POLL_INTERVAL),
+                   batch_interval=config.get('batch_interval', DEFAULT_BATCH_INTERVAL),
+                   poll_window=config.get('poll_window', DEFAULT_POLL_WINDOW),
+                   reconcile_interval=config.get('reconcile_interval', DEFAULT_RECONCILE_INTERVAL))
+
+    @property
+    def lyophilized_db_obj(self):
+        if not self._lyophilized_db_obj:
+            self._lyophilized_db_obj = LyophilizedCollection()
+        return self._lyophilized_db_obj
+
+    @property
+    def projection(self):
+        return dict({key: 1 for key in CHANGED_FIELDS.values()}, lut=1)
+
+    def load(self):
+        """Take the snapshot of the dashboard values of every drug."""
+        self._last_reconcile_time = time.time()
+        for record in self.lyophilized_db_obj.get_records(projection=self.projection):
+            values = get_changed_values([record])
+            self._records[record.get('_id')] = values
+            for entity_type, entity_values in values.items():
+                self._counts[entity_type].update(entity_values)
+            self._last_lut = max(self._last_lut, record.get('lut') or 0)
+
+        self._loaded_event.set()
+        log.do_info(f"Watcher loaded the dashboard values of {len(self._records)} drugs.")
+
+    def apply(self, records):
+        """Compare the given records with the snapshot, update the snapshot and report
+        the changes, if any.
+
+        :param records: (dict) Dict with the `_id` of the drug as key and its record
+                        as value, None for a deleted drug.
+        :returns: (dict) The changed values reported, None if nothing changed.
+        """
+        with self._apply_lock:
+            return self._apply(records)
+
+    def check(self, record_ids):
+        """Report the changes of the given drugs now, e.g. right after refreshing them,
+        instead of on the next poll or change. They are not reported again then.
+
+        :param record_ids: (list) `_id` of the drugs.
+        :returns: (dict) The changed values reported, None if nothing changed or if
+                  the snapshot is not taken yet.
+        """
+        if not self._loaded_event.is_set():
+            return
+        records = {record_id: None for record_id in record_ids}
+        records.update({record.get('_id'): record for record in self.lyophilized_db_obj.get_records(
+                            query={'_id': {'$in': list(record_ids)}}, projection=self.projection)})
+        return self.apply(records)
+
+    def _apply(self, records):
+        changed_values = {entity_type: set() for entity_type in CHANGED_FIELDS}
+        removed_values = {entity_type: set() for entity_type in CHANGED_FIELDS}
+        pair_counts = Counter()
+        changed_drugs = 0
+        for record_id, record in records.items():
+            old_values = self._records.get(record_id, {entity_type: set() for entity_type in CHANGED_FIELDS})
+            new_values = get_changed_values([record] if record else [])
+            if record:
+                self._last_lut = max(self._last_lut, record.get('lut') or 0)
+            if old_values == new_values:
+                continue
+
+            changed_drugs += 1
+            update_pair_counts(pair_counts, old_values['active'] | old_values['inactive'],
+                               new_values['active'] | new_values['inactive'])
+            for entity_type in CHANGED_FIELDS:
+                changed_values[entity_type].update(old_values[entity_type] ^ new_values[entity_type])
+                self._counts[entity_type].update(new_values[entity_type])
+                self._counts[entity_type].subtract(old_values[entity_type])
+                for value in old_values[entity_type] - new_values[entity_type]:
+                    if self._counts[entity_type][value] <= 0:
+                        del self._counts[entity_type][value]
+                        removed_values[entity_type].add(value)
+            if record:
+                self._records[record_id] = new_values
+            else:
+                self._records.pop(record_id, None)
+
+        if not changed_drugs:
+            return
+
+        log.do_info(f"Watcher found {changed_drugs} changed drugs, updating the dashboard.")
+        try:
+            self.on_change(changed_values, removed_values, pair_counts)
+        except Exception as exc:
+            log.do_error(f"Failed to update the dashboard for changed drugs, error: {exc}")
+        return changed_values
+
+    def get_deleted_ids(self):
+        """Return the `_id` of the drugs in the snapshot which are not in the collection anymore."""
+        record_ids = {record.get('_id') for record in self.lyophilized_db_obj.get_records(projection={'_id': 1})}
+        return [record_id for record_id in self._records if record_id not in record_ids]
+
+    def poll_once(self):
+        """Check the drugs written since the last poll, and every reconcile interval
+        the drugs deleted."""
+        since = max(0, self._last_lut - self.poll_window)
+        records = {record.get('_id'): record
+                   for record in self.lyophilized_db_obj.get_updated_records(since, projection=self.projection)}
+        if time.time() - self._last_reconcile_time >= self.reconcile_interval:
+            self._last_reconcile_time = time.time()
+            for record_id in self.get_deleted_ids():
+                records.setdefault(record_id, None)
+        return self.apply(records)
+
+    def poll(self):
+        log.do_info(f"Watcher polling the lyophilized collection every {self.poll_interval} seconds.")
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                self.poll_once()
+            except PyMongoError as exc:
+                log.do_error(f"Watcher failed to poll the lyophilized collection, error: {exc}")
+
+    def watch_change_stream(self):
+        """Report the changes read from a change stream, reconnecting (and resuming
+        after the last change seen) on errors. `OperationFailure` is raised if the
+        server does not support change streams.
+        """
+        opened = False
+        while not self._stop_event.is_set():
+            pending = dict()
+            first_pending_time = None
+            try:
+                with self.lyophilized_db_obj.watch(fields=list(self.projection), resume_after=self._resume_token,
+                                                   max_await_time_ms=CHANGE_STREAM_AWAIT_MS) as stream:
+                    if not opened:
+                        log.do_info("Watcher listening to the lyophilized collection change stream.")
+                        opened = True
+                    while not self._stop_event.is_set():
+                        change = stream.try_next()
+                        if change:
+                            # The full record is None for a delete, or if the record was deleted
+                            # before the update could be looked up.
+                            pending[change.get('documentKey', {}).get('_id')] = change.get('fullDocument')
+                            first_pending_time = first_pending_time or time.time()
+
+                        # Report once the bulk write is over, or at least every batch interval.
+                        if pending and (not change or time.time() - first_pending_time >= self.batch_interval):
+                            self.apply(pending)
+                            pending = dict()
+                            first_pending_time = None
+                            self._resume_token = stream.resume_token
+            except OperationFailure as exc:
+                if not opened:
+                    raise exc
+                log.do_error(f"Watcher change stream failed, error: {exc}, reconnecting.")
+            except PyMongoError as exc:
+                log.do_error(f"Watcher change stream failed, error: {exc}, reconnecting.")
+            if pending:
+                self.apply(pending)
+            self._stop_event.wait(RECONNECT_DELAY)
+
+    def run(self):
+        try:
+            self.load()
+        except PyMongoError as exc:
+            log.do_error(f"Watcher failed to load the lyophilized collection, error: {exc}")
+            return
+
+        if self.mode != 'poll':
+            try:
+                self.watch_change_stream()
+                return
+            except OperationFailure as exc:
+                if self.mode == 'change_stream':
+                    log.do_error(f"Change streams are not supported by the database, error: {exc}")
+                    return
+                log.do_info(f"Change streams are not supported by the database, falling back to polling.")
+        self.poll()
+
+    def start(self):
+        """Watch the collection from a daemon thread."""
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self.run, name="lyophilized-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
@@ -0,0 +1,18 @@
+#pylint: disable=invalid-name
+# -*- coding: utf-8 -*-
+"""
+.. :module:: wsgi
+   :platform: Linux
+   :synopsis: Production entry point of the dashboard, to run under gunicorn
+              with the settings of `gunicorn.conf.py`:
+
+              gunicorn wsgi:server
+
+.. moduleauthor:: Ashwani Agarwal (agarw288@purdue.edu) (October 18, 2026)
+"""
+
+from app import (
+    app
+)
+
+server = app.server